@@ -1,5 +1,9 @@
-from app.utils.helpers import (load_admin_data, get_accesibility_gdf, load_transport_stops, download_GTFS, merge_emt_metro, load_transport_route)
+from app.utils.helpers import (load_admin_data, get_accesibility_gdf_parallel, load_transport_stops,
+                               download_GTFS, merge_emt_metro, load_transport_route)
 import os
+from app.utils.walk_graph import open_walk_graph
+from app.utils.departures import load_departures_index, DEFAULT_WINDOW, FREQUENT_DEPARTURES_PER_HOUR
+from app.utils.export import write_gdf, output_path
 
 
 if __name__ == '__main__':
@@ -30,14 +34,46 @@ if __name__ == '__main__':
     gdf_stops = load_transport_route(gdf_stops)
     print(gdf_stops.crs)
 
+    # Salidas por hora de cada parada en la ventana DEPARTURES_WINDOW (p. ej. "weekday 07:00-09:00") y paradas
+    # frecuentes (al menos FREQUENT_DEPARTURES_PER_HOUR); DEPARTURES_WINDOW="" desactiva la ponderación
+    departures_window = os.getenv("DEPARTURES_WINDOW", DEFAULT_WINDOW)
+    if departures_window:
+        departures_index = load_departures_index()
+        gdf_stops = departures_index.attach(gdf_stops, departures_window,
+                                            float(os.getenv("FREQUENT_DEPARTURES_PER_HOUR", FREQUENT_DEPARTURES_PER_HOUR)))
+        print(f"Paradas frecuentes en '{departures_window}': {int(gdf_stops['frequent'].sum())} de {len(gdf_stops)}")
+
     # Cargar los datos administrativos de los barrios de Valencia
     admin_barr = load_admin_data()
     print(admin_barr.crs)
 
 
-    acces_admin_barr = get_accesibility_gdf(admin_barr,gdf_stops)
-    print(admin_barr.crs)
+    # Modo 'barrio' (un grafo por barrio) o 'city' (un único grafo de toda la ciudad con margen ACCESSIBILITY_BUFFER)
+    mode = os.getenv("ACCESSIBILITY_MODE", "barrio")
+    buffer_distance = float(os.getenv("ACCESSIBILITY_BUFFER", 500))
+
+    # En modo 'city' se puede usar el grafo CSR ya construido (python -m app.utils.walk_graph)
+    G_city = None
+    graph_path = os.getenv("WALK_GRAPH_PATH")
+    if mode == 'city' and graph_path and os.path.exists(graph_path):
+        G_city = open_walk_graph(graph_path)
+        print(f"Grafo peatonal cargado desde {graph_path}: {len(G_city)} nodos")
+
+    # Número de procesos (ACCESSIBILITY_WORKERS > 1 activa la ejecución en paralelo; 1 = en el propio proceso)
+    workers = int(os.getenv("ACCESSIBILITY_WORKERS", 1))
 
     base_dir = os.path.dirname(__file__)
-    output_path = os.path.abspath(os.path.join(base_dir, "../utils/data/acces_admin_barr_previous.geojson"))
-    acces_admin_barr.to_file(output_path, driver="GeoJSON")
\ No newline at end of file
+
+    # Con un solo proceso se usa el mismo montaje por registros y la misma tabla de errores
+    acces_admin_barr, df_errors = get_accesibility_gdf_parallel(admin_barr, gdf_stops, mode=mode,
+                                                                buffer_distance=buffer_distance, max_workers=workers,
+                                                                G_city=G_city)
+    errors_path = os.path.abspath(os.path.join(base_dir, "../utils/data/acces_admin_barr_errors.csv"))
+    df_errors.to_csv(errors_path, index=False)
+    print(f"Barrios procesados: {len(acces_admin_barr) - len(df_errors)}, errores: {len(df_errors)} ({errors_path})")
+    print(acces_admin_barr.crs)
+
+    # Formato de salida: geojson (por defecto), parquet, arrow o fgb
+    output_format = os.getenv("OUTPUT_FORMAT", "geojson")
+    output_file = output_path(os.path.abspath(os.path.join(base_dir, "../utils/data/acces_admin_barr_previous.geojson")), output_format)
+    write_gdf(acces_admin_barr, output_file, output_format)
\ No newline at end of file
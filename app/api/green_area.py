@@ -1,5 +1,7 @@
 from app.utils.helpers import (load_admin_data, load_green_spaces, compute_green_area_ratio,
                                merge_population, compute_green_area_per_capita, load_population_csv)
+from app.utils.export import write_gdf, output_path
+import os
 
 
 
@@ -44,3 +46,11 @@ if __name__ == '__main__':
 
 
     print(gdf_green_pop_barr.columns)
+
+    # Guardar el resultado si se indica un formato de salida (geojson, parquet, arrow o fgb)
+    output_format = os.getenv("OUTPUT_FORMAT")
+    if output_format:
+        base_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "../utils/data/green_admin_barr.geojson"))
+        output_file = output_path(base_path, output_format)
+        write_gdf(gdf_green_pop_barr, output_file, output_format)
+        print(f"Resultado guardado en {output_file}")
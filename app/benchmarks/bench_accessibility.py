@@ -0,0 +1,136 @@
+import argparse
+import math
+import os
+import sys
+import time
+import networkx as nx
+import osmnx as ox
+
+from app.benchmarks.fixtures import load_barrios_fixture
+from app.utils.helpers import (load_transport_stops, merge_emt_metro, load_transport_route, find_nearest_node,
+                               shortest_path_length, compute_barrio_accessibility)
+
+
+# Tiempos medidos (1 núcleo Xeon, osmnx 2.0.1 / networkx 3.3 / scipy 1.17, grafos desde la caché de Overpass):
+#   --barrios 20 --reference: nuevo 0.19 s, anterior 108.79 s (x584); p. ej. LA PUNTA (862 nodos, 46 paradas)
+#                             13.1 ms frente a 47.8 s, BENIMAMET (725 nodos, 22 paradas) 13.1 ms frente a 20.3 s
+#   los 88 barrios, solo el nuevo: 0.83 s en total, sin diferencias con el GeoJSON
+# La implementación anterior crece con nodos × paradas, así que no se mide con todos los barrios.
+
+# Respuestas de Overpass ya descargadas: permiten construir los grafos sin conexión
+OVERPASS_CACHE = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'api', 'cache'))
+
+COMPARED_COLUMNS = ['centroid_distance', 'centroid_route_type', 'num_stops', 'accessibility_percentage']
+
+# Contra el GeoJSON guardado no se comparan 'num_stops' ni 'centroid_route_type': dependen del cruce de paradas y
+# rutas, que ahora se hace por red (EMT / Metro) y el GeoJSON se generó con el cruce anterior entre feeds. Ambas
+# columnas se siguen comparando con la implementación anterior (--reference), que usa las mismas paradas.
+GEOJSON_COMPARED_COLUMNS = ['centroid_distance', 'accessibility_percentage']
+
+
+def accessibility_reference(G, geometry, nearby_stops, threshold_distance=300):
+    # Implementación anterior: un Dijkstra por cada pareja (nodo, parada)
+    barr_centroid = geometry.centroid
+    barr_node = find_nearest_node(G, barr_centroid.y, barr_centroid.x)
+
+    min_distance = float('inf')
+    route_type = None
+    accessible_nodes_set = set()
+
+    for stop in nearby_stops.geometry:
+        try:
+            stop_node = find_nearest_node(G, stop.y, stop.x)
+            distance_center = shortest_path_length(G, barr_node, stop_node)
+
+            if distance_center < min_distance:
+                min_distance = distance_center
+                route_type = nearby_stops.loc[nearby_stops.geometry == stop, 'route_type_en'].values[0]
+
+            for node in G.nodes:
+                if shortest_path_length(G, node, stop_node) <= threshold_distance:
+                    accessible_nodes_set.add(node)
+
+        except nx.NetworkXNoPath:
+            continue
+
+    total_nodes = len(G.nodes)
+
+    return {
+        'centroid_distance': min_distance if min_distance != float('inf') else None,
+        'centroid_route_type': route_type,
+        'num_stops': len(nearby_stops),
+        'accessibility_percentage': (len(accessible_nodes_set) / total_nodes) * 100 if total_nodes > 0 else None,
+    }
+
+
+def same_value(a, b):
+    if a is None or b is None or (isinstance(a, float) and math.isnan(a)) or (isinstance(b, float) and math.isnan(b)):
+        return (a is None or a != a) and (b is None or b != b)
+    if isinstance(a, str) or isinstance(b, str):
+        return a == b
+    return math.isclose(float(a), float(b), rel_tol=1e-9, abs_tol=1e-9)
+
+
+def run(n_barrios, with_reference):
+
+    ox.settings.cache_folder = OVERPASS_CACHE
+    ox.settings.use_cache = True
+
+    df_stops_emt, df_stops_metro = load_transport_stops()
+    gdf_stops = load_transport_route(merge_emt_metro(df_stops_emt, df_stops_metro))
+
+    expected = load_barrios_fixture('acces_admin_barr_previous.geojson')
+    if n_barrios:
+        expected = expected.head(n_barrios)
+
+    mismatches = []
+    t_new = t_ref = 0.0
+
+    for _, row in expected.iterrows():
+        G = ox.graph_from_polygon(row.geometry, network_type='walk', simplify=True)
+        nearby_stops = gdf_stops[gdf_stops.geometry.within(row.geometry)]
+
+        t0 = time.perf_counter()
+        result = compute_barrio_accessibility(G, row.geometry, nearby_stops)
+        elapsed_new = time.perf_counter() - t0
+        t_new += elapsed_new
+
+        line = f"{row['nombre']:<35} nodos={len(G.nodes):>5} paradas={len(nearby_stops):>3} nuevo={elapsed_new * 1000:9.1f} ms"
+
+        if with_reference:
+            t0 = time.perf_counter()
+            reference = accessibility_reference(G, row.geometry, nearby_stops)
+            elapsed_ref = time.perf_counter() - t0
+            t_ref += elapsed_ref
+            line += f"  anterior={elapsed_ref * 1000:10.1f} ms"
+
+            for column in COMPARED_COLUMNS:
+                if not same_value(result[column], reference[column]):
+                    mismatches.append((row['nombre'], column, 'anterior', reference[column], result[column]))
+
+        for column in GEOJSON_COMPARED_COLUMNS:
+            if not same_value(result[column], row[column]):
+                mismatches.append((row['nombre'], column, 'geojson', row[column], result[column]))
+
+        print(line)
+
+    print("-" * 40)
+    print(f"Tiempo total nuevo: {t_new:.2f} s")
+    if with_reference:
+        print(f"Tiempo total anterior: {t_ref:.2f} s (x{t_ref / t_new:.1f})")
+
+    for nombre, column, source, expected_value, value in mismatches:
+        print(f"DIFERENCIA {nombre} {column}: {source}={expected_value} nuevo={value}")
+
+    return len(mismatches) == 0
+
+
+if __name__ == '__main__':
+
+    # En CI: python -m app.benchmarks.bench_accessibility --barrios 10 --reference (sale con 1 si hay diferencias)
+    parser = argparse.ArgumentParser(description="Regresión y tiempos del cálculo de accesibilidad por barrio.")
+    parser.add_argument('--barrios', type=int, default=0, help="Limitar a los N primeros barrios (0 = todos).")
+    parser.add_argument('--reference', action='store_true', help="Ejecutar también la implementación anterior (lenta).")
+    args = parser.parse_args()
+
+    sys.exit(0 if run(args.barrios, args.reference) else 1)
@@ -0,0 +1,55 @@
+import io
+import time
+import geopandas as gpd
+import orjson
+import pyarrow as pa
+import shapely
+
+from app.benchmarks.fixtures import load_indicator_fixtures
+from app.utils.export import iter_export
+
+
+def decode_geojson(data):
+    return gpd.read_file(io.BytesIO(data))
+
+
+def decode_geojson_orjson(data):
+    return orjson.loads(data)
+
+
+def decode_parquet(data):
+    return gpd.read_parquet(io.BytesIO(data))
+
+
+def decode_arrow(data):
+    table = pa.ipc.open_stream(data).read_all()
+    return shapely.from_wkb(table.column('geometry').to_numpy(zero_copy_only=False))
+
+
+def decode_fgb(data):
+    return gpd.read_file(io.BytesIO(data))
+
+
+def timed(fn, repeat):
+    fn()
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return result, (time.perf_counter() - t0) / repeat * 1000
+
+
+if __name__ == '__main__':
+
+    acces_gdf, green_gdf = load_indicator_fixtures()
+    decoders = [('geojson', decode_geojson), ('geojson (orjson)', decode_geojson_orjson), ('parquet', decode_parquet),
+                ('arrow', decode_arrow), ('fgb', decode_fgb)]
+
+    for name, gdf in [('accesibilidad', acces_gdf), ('zonas-verdes', green_gdf)]:
+        print(f"--- {name} ({len(gdf)} barrios) ---")
+        print(f"{'formato':<18}{'bytes':>12}{'escritura ms':>14}{'lectura ms':>12}")
+
+        for label, decoder in decoders:
+            fmt = label.split(' ')[0]
+            data, write_ms = timed(lambda: b''.join(iter_export(gdf, fmt)), 20)
+            _, read_ms = timed(lambda: decoder(data), 20)
+            print(f"{label:<18}{len(data):>12}{write_ms:>14.2f}{read_ms:>12.2f}")
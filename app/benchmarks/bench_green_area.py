@@ -0,0 +1,59 @@
+import argparse
+import time
+import numpy as np
+import geopandas as gpd
+
+from app.benchmarks.fixtures import load_barrios_fixture, synthetic_parks
+from app.utils.green_area import GreenAreaEngine, green_area_by_barrio
+
+
+def overlay_reference(admin_barr, gdf_green):
+    # Implementación anterior de 'compute_green_area_ratio'
+    admin_barr_2 = admin_barr.to_crs('EPSG:25830')
+    gdf_inter_barr = gpd.overlay(gdf_green.to_crs('EPSG:25830'), admin_barr_2, how='intersection')
+    gdf_inter_barr['green_area_m2'] = gdf_inter_barr.geometry.area
+    by_code = gdf_inter_barr.groupby('coddistbar')['green_area_m2'].sum()
+    return admin_barr_2['coddistbar'].map(by_code).to_numpy()
+
+
+def run(n, changed_share):
+
+    admin_barr = load_barrios_fixture()[['coddistbar', 'geometry']]
+    parks = synthetic_parks(n)
+
+    t0 = time.perf_counter()
+    reference = overlay_reference(admin_barr, parks)
+    print(f"gpd.overlay:                {time.perf_counter() - t0:.2f} s")
+
+    t0 = time.perf_counter()
+    engine = GreenAreaEngine(admin_barr)
+    result = engine.barrio_green_area(parks)
+    print(f"Motor indexado (en frío):   {time.perf_counter() - t0:.2f} s")
+
+    np.testing.assert_allclose(result, reference, rtol=1e-9, atol=1e-6)
+    np.testing.assert_array_equal(np.isnan(result), np.isnan(reference))
+
+    # Se modifica una parte de los parques: solo esos se vuelven a calcular
+    changed = parks.copy()
+    rows = np.random.default_rng(1).random(n) < changed_share
+    changed.loc[rows, 'geometry'] = changed.loc[rows].to_crs('EPSG:25830').buffer(10).to_crs('EPSG:4326')
+
+    t0 = time.perf_counter()
+    result = engine.barrio_green_area(changed)
+    print(f"Motor indexado (incremental, {engine.last_computed} parques nuevos): {time.perf_counter() - t0:.2f} s")
+    np.testing.assert_allclose(result, overlay_reference(admin_barr, changed), rtol=1e-9, atol=1e-6)
+
+    t0 = time.perf_counter()
+    green_area_by_barrio(admin_barr, changed)
+    green_area_by_barrio(admin_barr, changed)
+    print(f"Sin cambios (motor compartido): {(time.perf_counter() - t0) / 2:.2f} s")
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Área verde por barrio: overlay frente al motor indexado.")
+    parser.add_argument('--n', type=int, default=5_000, help="Número de parques sintéticos.")
+    parser.add_argument('--changed-share', type=float, default=0.02)
+    args = parser.parse_args()
+
+    run(args.n, args.changed_share)
@@ -0,0 +1,32 @@
+import time
+
+from app.benchmarks.fixtures import load_indicator_fixtures
+from app.utils.heatmap import HeatmapIndex
+from app.utils.simplify import PYRAMID_ZOOMS, zoom_to_tolerance
+
+
+def timed_render(index, repeat=200, **kwargs):
+    body = index.render(0.7, 0.5, **kwargs)
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        index.render(0.7, 0.5, **kwargs)
+    return body, (time.perf_counter() - t0) / repeat
+
+
+if __name__ == '__main__':
+
+    acces_gdf, green_gdf = load_indicator_fixtures()
+
+    t0 = time.perf_counter()
+    index = HeatmapIndex(acces_gdf, green_gdf)
+    print(f"Construcción de la pirámide: {(time.perf_counter() - t0) * 1000:.1f} ms ({len(index)} barrios)")
+
+    full, _ = timed_render(index)
+    print(f"{'nivel':<10}{'tolerancia':>12}{'bytes':>12}{'reducción':>11}{'ms/respuesta':>14}")
+
+    for zoom in [None] + sorted(PYRAMID_ZOOMS, reverse=True):
+        for quantized in (False, True):
+            body, elapsed = timed_render(index, zoom=zoom, quantized=quantized)
+            name = ('completo' if zoom is None else f"z{zoom}") + (' q' if quantized else '')
+            tolerance = 0.0 if zoom is None else zoom_to_tolerance(zoom)
+            print(f"{name:<10}{tolerance:>12.2e}{len(body):>12}{len(full) / len(body):>10.1f}x{elapsed * 1000:>14.3f}")
@@ -0,0 +1,48 @@
+import argparse
+import time
+import numpy as np
+
+from app.benchmarks.fixtures import random_points
+from app.utils.isochrone import load_isochrone_engine, DEFAULT_MINUTES
+
+
+def run(graph_path, n, repeat_share):
+
+    t0 = time.perf_counter()
+    engine = load_isochrone_engine(graph_path)
+    if engine is None:
+        raise SystemExit("No existe el grafo peatonal: genéralo con 'python -m app.utils.walk_graph'")
+    print(f"Carga del motor: {time.perf_counter() - t0:.2f} s ({len(engine.graph)} nodos, "
+          f"{len(engine.stop_nodes)} paradas)")
+
+    # Una parte de las peticiones repite orígenes anteriores, como ocurre con los puntos de interés habituales
+    lons, lats = random_points(n, bbox=(-0.40, 39.44, -0.34, 39.50))
+    rng = np.random.default_rng(1)
+    repeated = rng.random(n) < repeat_share
+    source = rng.integers(0, np.maximum(np.arange(n), 1))
+    lons = np.where(repeated, lons[source], lons)
+    lats = np.where(repeated, lats[source], lats)
+
+    latencies = []
+    for lon, lat in zip(lons, lats):
+        t0 = time.perf_counter()
+        try:
+            engine.isochrones(lon, lat, DEFAULT_MINUTES)
+        except ValueError:
+            continue
+        latencies.append(time.perf_counter() - t0)
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+    print(f"{len(latencies)} isócronas {DEFAULT_MINUTES} min: p50 {p50:.1f} ms, p95 {p95:.1f} ms, p99 {p99:.1f} ms")
+    print(f"Caché: {engine.cache.stats()}")
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Latencia del endpoint /isochrone sin HTTP.")
+    parser.add_argument('--graph', default=None, help="Ruta del grafo CSR (por defecto WALK_GRAPH_PATH).")
+    parser.add_argument('--n', type=int, default=200)
+    parser.add_argument('--repeat-share', type=float, default=0.3)
+    args = parser.parse_args()
+
+    run(args.graph, args.n, args.repeat_share)
@@ -0,0 +1,87 @@
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import numpy as np
+
+from app.benchmarks.fixtures import load_indicator_fixtures, random_points
+from app.utils.geo_db import PostgisBarrioStore, SqliteBarrioStore, build_sqlite_db
+from app.utils.spatial_index import BarrioLocator
+
+
+async def run_concurrent(lookup, lons, lats, concurrency):
+    """
+    Lanza las consultas con 'concurrency' tareas simultáneas y devuelve (segundos, latencias, encontrados).
+    """
+
+    latencies = np.empty(len(lons))
+    found = 0
+    next_index = 0
+
+    async def worker():
+        nonlocal found, next_index
+        while next_index < len(lons):
+            i = next_index
+            next_index += 1
+            t0 = time.perf_counter()
+            if await lookup(lons[i], lats[i]) is not None:
+                found += 1
+            latencies[i] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - t0, latencies, found
+
+
+def report(name, elapsed, latencies, found):
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+    print(f"{name:<28} {len(latencies) / elapsed:>9.0f} consultas/s   p50 {p50:.2f} ms   p99 {p99:.2f} ms   "
+          f"({found} dentro)")
+
+
+async def run(n, concurrencies, postgis_dsn):
+
+    acces_gdf, green_gdf = load_indicator_fixtures()
+    lons, lats = random_points(n)
+
+    # Camino en memoria: los endpoints 'def' de FastAPI se ejecutan en el pool de hilos
+    locator = BarrioLocator(acces_gdf)
+
+    async def memory_lookup(lon, lat):
+        return await asyncio.to_thread(locator.lookup, lon, lat)
+
+    stores = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'barrios.sqlite')
+        build_sqlite_db(path, {'acces': acces_gdf, 'verde': green_gdf})
+        stores['SQLite R*Tree'] = await SqliteBarrioStore.open(path)
+
+        if postgis_dsn:
+            stores['PostGIS (asyncpg)'] = await PostgisBarrioStore.open(postgis_dsn)
+
+        for concurrency in concurrencies:
+            print(f"--- {n} consultas, concurrencia {concurrency} ---")
+            report("En memoria (BarrioLocator)", *await run_concurrent(memory_lookup, lons, lats, concurrency))
+
+            for name, store in stores.items():
+                async def store_lookup(lon, lat, store=store):
+                    return await store.barrio_by_point('acces', lon, lat)
+
+                report(name, *await run_concurrent(store_lookup, lons, lats, concurrency))
+
+        for store in stores.values():
+            await store.close()
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Compara la consulta de barrio por punto en memoria y en vivo "
+                                                 "(SQLite o PostGIS) con distintos niveles de concurrencia.")
+    parser.add_argument('--n', type=int, default=5_000)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 16, 64])
+    parser.add_argument('--postgis', default=None,
+                        help="DSN de un PostGIS local (p. ej. un contenedor postgis/postgis) con las tablas cargadas.")
+    args = parser.parse_args()
+
+    asyncio.run(run(args.n, args.concurrency, args.postgis))
@@ -0,0 +1,77 @@
+import argparse
+import time
+import numpy as np
+
+from app.benchmarks.fixtures import load_barrios_fixture, random_points
+from app.utils.helpers import get_barr_id_coords
+from app.utils.spatial_index import BarrioLocator
+
+
+def lookup_current(lons, lats, gdf):
+    # Camino anterior: 'contains' sobre todos los barrios y después un segundo escaneo por 'coddistbar'
+    found = 0
+    for lon, lat in zip(lons, lats):
+        barrio_id = get_barr_id_coords(lon, lat, gdf)
+        if barrio_id:
+            barrio_data = gdf.loc[gdf['coddistbar'] == barrio_id]
+            if not barrio_data.empty:
+                barrio_data.iloc[0]
+                found += 1
+    return found
+
+
+def lookup_locator(lons, lats, locator):
+    found = 0
+    for lon, lat in zip(lons, lats):
+        if locator.lookup(lon, lat) is not None:
+            found += 1
+    return found
+
+
+def lookup_locator_batch(lons, lats, locator):
+    return int((locator.locate_positions(lons, lats) >= 0).sum())
+
+
+def run(sizes, skip_current_above):
+
+    gdf = load_barrios_fixture()
+
+    t0 = time.perf_counter()
+    locator = BarrioLocator(gdf)
+    print(f"Construcción del índice: {(time.perf_counter() - t0) * 1000:.2f} ms ({len(locator)} barrios)")
+
+    for n in sizes:
+        lons, lats = random_points(n)
+        print(f"--- {n} puntos ---")
+
+        results = {}
+        if n <= skip_current_above:
+            t0 = time.perf_counter()
+            results['actual'] = lookup_current(lons, lats, gdf)
+            elapsed = time.perf_counter() - t0
+            print(f"Actual (contains + escaneo):  {elapsed:.3f} s  ({elapsed / n * 1e6:.1f} µs/punto)")
+
+        t0 = time.perf_counter()
+        results['locator'] = lookup_locator(lons, lats, locator)
+        elapsed = time.perf_counter() - t0
+        print(f"BarrioLocator (punto a punto): {elapsed:.3f} s  ({elapsed / n * 1e6:.1f} µs/punto)")
+
+        t0 = time.perf_counter()
+        results['batch'] = lookup_locator_batch(lons, lats, locator)
+        elapsed = time.perf_counter() - t0
+        print(f"BarrioLocator (vectorizado):   {elapsed:.3f} s  ({elapsed / n * 1e6:.1f} µs/punto)")
+
+        if len(set(results.values())) != 1:
+            raise AssertionError(f"Los métodos no coinciden: {results}")
+        print(f"Puntos dentro de Valencia: {results['locator']}")
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Compara la localización de barrios actual con el BarrioLocator.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--skip-current-above', type=int, default=np.iinfo(np.int64).max,
+                        help="No ejecutar el camino actual (lento) por encima de este número de puntos.")
+    args = parser.parse_args()
+
+    run(args.sizes, args.skip_current_above)
@@ -0,0 +1,76 @@
+import argparse
+import time
+import numpy as np
+
+from app.benchmarks.fixtures import random_points
+from app.utils.stop_index import StopIndex, load_stop_gdf
+from app.utils.walk_graph import project_lonlat
+
+
+def nearest_bruteforce(lons, lats, index, k):
+    # Referencia: distancia a todas las paradas y ordenación, punto a punto
+    x, y = project_lonlat(lons, lats)
+    result = []
+    for px, py in zip(x, y):
+        dist = np.hypot(index.x - px, index.y - py)
+        result.append(np.argsort(dist, kind='stable')[:k])
+    return np.array(result)
+
+
+def run(sizes, k, graph_path):
+
+    gdf_stops = load_stop_gdf()
+    if gdf_stops is None:
+        raise SystemExit("Faltan los feeds GTFS (python -m app.api.accesibility los descarga)")
+
+    graph = None
+    if graph_path:
+        from app.utils.walk_graph import open_walk_graph
+        graph = open_walk_graph(graph_path)
+
+    t0 = time.perf_counter()
+    index = StopIndex(gdf_stops, graph)
+    print(f"Construcción del índice: {(time.perf_counter() - t0) * 1000:.1f} ms ({len(index)} paradas)")
+
+    for n in sizes:
+        lons, lats = random_points(n)
+        print(f"--- {n} puntos, k={k} ---")
+
+        t0 = time.perf_counter()
+        reference = nearest_bruteforce(lons, lats, index, k)
+        elapsed = time.perf_counter() - t0
+        print(f"Fuerza bruta (punto a punto):  {n / elapsed:>10.0f} puntos/s")
+
+        t0 = time.perf_counter()
+        _, positions = index.nearest(lons, lats, k)
+        elapsed = time.perf_counter() - t0
+        print(f"KD-tree (lote):                {n / elapsed:>10.0f} puntos/s")
+
+        t0 = time.perf_counter()
+        index.query_batch(lons, lats, k)
+        elapsed = time.perf_counter() - t0
+        print(f"KD-tree + JSON (lote):         {n / elapsed:>10.0f} puntos/s")
+
+        # Los empates pueden ordenarse distinto: se compara el conjunto de paradas de cada punto
+        mismatches = sum(set(a) != set(b) for a, b in zip(reference, positions))
+        if mismatches:
+            raise AssertionError(f"{mismatches} puntos con vecinos distintos")
+
+    if graph is not None:
+        lons, lats = random_points(200, seed=1)
+        t0 = time.perf_counter()
+        for lon, lat in zip(lons, lats):
+            index.query(lon, lat, k, network=True)
+        elapsed = time.perf_counter() - t0
+        print(f"Con distancia a pie: {elapsed / len(lons) * 1000:.1f} ms/consulta")
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Rendimiento de la búsqueda de paradas cercanas.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 100_000])
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--graph', default=None, help="Grafo CSR para medir también la distancia a pie.")
+    args = parser.parse_args()
+
+    run(args.sizes, args.k, args.graph)
@@ -0,0 +1,107 @@
+import os
+import numpy as np
+import geopandas as gpd
+import pandas as pd
+import shapely
+
+
+DATA_FOLDER = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'utils', 'data'))
+
+# Caja envolvente aproximada del término municipal de Valencia (lon_min, lat_min, lon_max, lat_max)
+VALENCIA_BBOX = (-0.433, 39.278, -0.272, 39.567)
+
+
+def load_barrios_fixture(filename='barrios_accesibilidad.geojson'):
+    """
+    Carga los barrios a partir de los GeoJSON guardados en el repositorio, sin depender de la base de datos.
+    """
+
+    gdf = gpd.read_file(os.path.join(DATA_FOLDER, filename))
+    gdf = gdf.to_crs('EPSG:4326')
+    gdf['coddistbar'] = gdf['coddistbar'].astype(int)
+
+    return gdf
+
+
+def random_points(n, bbox=VALENCIA_BBOX, seed=0):
+    """
+    Genera 'n' puntos aleatorios (lon, lat) uniformes dentro de la caja envolvente.
+    """
+
+    rng = np.random.default_rng(seed)
+    lons = rng.uniform(bbox[0], bbox[2], n)
+    lats = rng.uniform(bbox[1], bbox[3], n)
+
+    return lons, lats
+
+
+def scale_barrios(gdf, factor, width=None):
+    """
+    Repite la capa 'factor' veces, desplazando cada copia hacia el este 'width' metros (por defecto, el ancho de
+    la propia capa) y sumando 1000 * copia a 'coddistbar' si existe, para medir con conjuntos mayores que los 88
+    barrios reales. Los parques y las paradas se escalan con el mismo 'width' que los barrios.
+    """
+
+    if factor <= 1:
+        return gdf
+
+    projected = gdf.to_crs('EPSG:25830')
+    if width is None:
+        minx, _, maxx, _ = projected.total_bounds
+        width = maxx - minx
+
+    copies = []
+    for i in range(factor):
+        shifted = projected.copy()
+        shifted['geometry'] = shapely.transform(np.asarray(projected.geometry.values),
+                                                lambda coords: coords + [i * width, 0])
+        if 'coddistbar' in shifted.columns:
+            shifted['coddistbar'] = shifted['coddistbar'] + 1000 * i
+        copies.append(shifted)
+
+    return gpd.GeoDataFrame(pd.concat(copies, ignore_index=True), crs=projected.crs).to_crs(gdf.crs)
+
+
+def barrios_width(gdf):
+    # Ancho (m, EPSG:25830) de la capa de barrios, para escalar otras capas con 'scale_barrios'
+    minx, _, maxx, _ = gdf.to_crs('EPSG:25830').total_bounds
+    return maxx - minx
+
+
+def synthetic_parks(n, bbox=(-0.42, 39.42, -0.30, 39.52), seed=0):
+    """
+    Parques sintéticos: polígonos de 20-300 m de radio repartidos uniformemente por la caja envolvente.
+    """
+
+    lons, lats = random_points(n, bbox=bbox, seed=seed)
+    rng = np.random.default_rng(seed)
+    points = gpd.GeoSeries(shapely.points(lons, lats), crs='EPSG:4326').to_crs('EPSG:25830')
+    radius = rng.uniform(20, 300, n)
+    geoms = shapely.buffer(np.asarray(points.values), radius, quad_segs=int(rng.integers(2, 8)))
+    return gpd.GeoDataFrame({'id': np.arange(n)}, geometry=geoms, crs='EPSG:25830').to_crs('EPSG:4326')
+
+
+def load_indicator_fixtures(seed=0, scale=1):
+    """
+    Devuelve (acces_gdf, green_gdf) con el esquema que usa la API.
+
+    La accesibilidad es la del GeoJSON guardado; los indicadores de zonas verdes son sintéticos (misma geometría
+    de barrios, valores aleatorios reproducibles), ya que dependen de descargas externas. Con 'scale' > 1 los
+    barrios se replican (ver 'scale_barrios').
+    """
+
+    acces_gdf = scale_barrios(load_barrios_fixture('acces_admin_barr_previous.geojson'), scale)
+    for column in acces_gdf.select_dtypes(include=['float64']).columns:
+        acces_gdf[column] = acces_gdf[column].fillna(0)
+    for column in ['nombre', 'centroid_route_type']:
+        acces_gdf[column] = acces_gdf[column].fillna("Desconocido")
+
+    rng = np.random.default_rng(seed)
+    green_gdf = acces_gdf[['coddistbar', 'nombre', 'geometry']].copy()
+    green_gdf['barr_area_imputed'] = green_gdf.to_crs('EPSG:25830').geometry.area
+    green_gdf['green_ratio'] = rng.uniform(0, 0.4, len(green_gdf))
+    green_gdf['green_area_m2'] = green_gdf['green_ratio'] * green_gdf['barr_area_imputed']
+    green_gdf['population'] = rng.integers(500, 50_000, len(green_gdf)).astype(float)
+    green_gdf['green_area_per_capita_m2'] = green_gdf['green_area_m2'] / green_gdf['population']
+
+    return acces_gdf, green_gdf
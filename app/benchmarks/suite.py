@@ -0,0 +1,329 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+import numpy as np
+
+from app.benchmarks.fixtures import (load_indicator_fixtures, load_barrios_fixture, random_points, scale_barrios,
+                                     barrios_width, synthetic_parks)
+
+
+OVERPASS_CACHE = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'api', 'cache'))
+
+PERCENTILES = (50, 95, 99)
+
+
+def summarize(latencies):
+    latencies = np.asarray(latencies) * 1000
+    result = {f"p{p}_ms": round(float(value), 3) for p, value in zip(PERCENTILES, np.percentile(latencies, PERCENTILES))}
+    result['mean_ms'] = round(float(latencies.mean()), 3)
+    result['n'] = int(len(latencies))
+    return result
+
+
+def peak_memory(fn):
+    # Pico de memoria (bytes) de una ejecución, medido aparte para no penalizar los tiempos
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return int(peak)
+
+
+## ETAPAS DE LOS PIPELINES ##
+
+def bench_stage(name, fn, repeat, setup=None):
+    """
+    Ejecuta 'fn' 'repeat' veces (con 'setup' antes de cada una, fuera del tiempo medido) y una vez más con
+    tracemalloc. La salida por pantalla de la etapa se descarta.
+    """
+
+    latencies = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            if setup:
+                setup()
+            t0 = time.perf_counter()
+            fn()
+            latencies.append(time.perf_counter() - t0)
+
+        if setup:
+            setup()
+        peak = peak_memory(fn)
+
+    result = {'name': name, 'kind': 'pipeline', **summarize(latencies), 'peak_memory_bytes': peak}
+    print(f"{name:<45} p50 {result['p50_ms']:>10.1f} ms   p95 {result['p95_ms']:>10.1f} ms   "
+          f"memoria {peak / 2**20:>8.1f} MiB")
+    return result
+
+
+def pipeline_cases(args, fixtures):
+    from app.utils import green_area
+    from app.utils.helpers import (compute_green_area_ratio, load_transport_stops, merge_emt_metro,
+                                   load_transport_route)
+    from app.utils.heatmap import HeatmapIndex
+
+    acces_gdf, green_gdf, admin_barr, parks, gdf_stops = fixtures
+    results = []
+
+    def reset_green_engine():
+        green_area._engine = None
+
+    results.append(bench_stage('compute_green_area_ratio (en frío)',
+                               lambda: compute_green_area_ratio(admin_barr, parks), args.repeat, reset_green_engine))
+    compute_green_area_ratio(admin_barr, parks)
+    results.append(bench_stage('compute_green_area_ratio (sin cambios)',
+                               lambda: compute_green_area_ratio(admin_barr, parks), args.repeat))
+
+    results.append(bench_stage('load_transport_route',
+                               lambda: load_transport_route(merge_emt_metro(*load_transport_stops())), args.repeat))
+
+    results.append(bench_stage('HeatmapIndex', lambda: HeatmapIndex(acces_gdf, green_gdf), args.repeat))
+
+    if args.accessibility_barrios:
+        try:
+            import osmnx as ox
+        except ImportError:
+            print("get_accesibility_gdf: osmnx no está instalado, se omite")
+        else:
+            from app.utils.helpers import get_accesibility_gdf
+
+            ox.settings.cache_folder = OVERPASS_CACHE
+            ox.settings.use_cache = True
+            subset = load_barrios_fixture().head(args.accessibility_barrios)
+            results.append(bench_stage(f'get_accesibility_gdf ({len(subset)} barrios)',
+                                       lambda: get_accesibility_gdf(subset.copy(), gdf_stops), 1))
+
+    return results
+
+
+## ENDPOINTS ##
+
+def build_app(acces_gdf, green_gdf, gdf_stops):
+    """
+    La aplicación de 'app.main' con los datos de los fixtures, sin pasar por el lifespan (ni instantáneas, ni
+    base de datos, ni grafo peatonal).
+    """
+
+    from app.main import app, datasets, build_derived
+    from app.utils.dataset import Dataset
+    from app.utils.stop_index import StopIndex
+
+    derived = build_derived(acces_gdf, green_gdf)
+    datasets.swap(Dataset(version=derived['heatmap_index'].version, source='fixtures', acces_gdf=acces_gdf,
+                          green_gdf=green_gdf, derived=derived))
+    app.state.barrio_store = None
+    app.state.isochrones = None
+    app.state.stop_index = StopIndex(gdf_stops) if gdf_stops is not None else None
+    return app
+
+
+def endpoint_requests(n, seed=0, batch_size=1000):
+    """
+    Peticiones de cada endpoint: función i -> (método, url, argumentos de httpx).
+    """
+
+    lons, lats = random_points(n, seed=seed)
+    batch_lons, batch_lats = random_points(batch_size, seed=seed + 1)
+    batch_body = json.dumps([[lon, lat] for lon, lat in zip(batch_lons, batch_lats)])
+    rng = np.random.default_rng(seed)
+    # Pesos del ICVU: la mitad repite presets habituales (caché) y la otra mitad son nuevos
+    alphas = np.where(rng.random(n) < 0.5, 0.7, rng.uniform(0, 1, n).round(2))
+
+    return {
+        'GET /zonas-verdes/coord': lambda i: ('GET', '/zonas-verdes/coord', {'params': {'lon': lons[i], 'lat': lats[i]}}),
+        'GET /accesibilidad/coord': lambda i: ('GET', '/accesibilidad/coord', {'params': {'lon': lons[i], 'lat': lats[i]}}),
+        f'POST /coord/batch ({batch_size} puntos)': lambda i: ('POST', '/coord/batch', {
+            'content': batch_body, 'headers': {'content-type': 'application/json'}}),
+        'GET /ICVU/heatmap': lambda i: ('GET', '/ICVU/heatmap', {'params': {'alpha': alphas[i], 'beta': 0.5}}),
+        'GET /ICVU/heatmap?zoom=12': lambda i: ('GET', '/ICVU/heatmap', {
+            'params': {'alpha': alphas[i], 'beta': 0.5, 'zoom': 12, 'quantize': 'true'}}),
+        'GET /paradas/cercanas': lambda i: ('GET', '/paradas/cercanas', {'params': {'lon': lons[i], 'lat': lats[i]}}),
+    }
+
+
+async def _send(client, request, i):
+    method, url, kwargs = request(i)
+    response = await client.request(method, url, **kwargs)
+    if response.status_code >= 500:
+        raise RuntimeError(f"{method} {url}: {response.status_code}")
+    return len(response.content)
+
+
+async def bench_endpoint(client, name, request, n, concurrencies):
+    # Calentamiento (primeras codificaciones y cachés) fuera de la medida
+    for i in range(min(5, n)):
+        await _send(client, request, i)
+
+    latencies, sizes = [], []
+    for i in range(n):
+        t0 = time.perf_counter()
+        sizes.append(await _send(client, request, i))
+        latencies.append(time.perf_counter() - t0)
+
+    throughput = {}
+    for concurrency in concurrencies:
+        next_index = 0
+
+        async def worker():
+            nonlocal next_index
+            while next_index < n:
+                i = next_index
+                next_index += 1
+                await _send(client, request, i)
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        throughput[str(concurrency)] = round(n / (time.perf_counter() - t0), 1)
+
+    tracemalloc.start()
+    try:
+        for i in range(min(50, n)):
+            await _send(client, request, i)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    result = {'name': name, 'kind': 'endpoint', **summarize(latencies), 'throughput_rps': throughput,
+              'response_bytes': int(np.median(sizes)), 'peak_memory_bytes': int(peak)}
+    print(f"{name:<45} p50 {result['p50_ms']:>10.2f} ms   p99 {result['p99_ms']:>10.2f} ms   "
+          + "   ".join(f"c={c}: {rps:.0f}/s" for c, rps in throughput.items()))
+    return result
+
+
+async def endpoint_cases(args, fixtures):
+    try:
+        import httpx
+    except ImportError:
+        print("Endpoints: httpx no está instalado, se omiten")
+        return []
+
+    acces_gdf, green_gdf, _, _, gdf_stops = fixtures
+    app = build_app(acces_gdf, green_gdf, gdf_stops)
+
+    results = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        for name, request in endpoint_requests(args.requests).items():
+            if name.startswith('GET /paradas') and gdf_stops is None:
+                continue
+            results.append(await bench_endpoint(client, name, request, args.requests, args.concurrency))
+    return results
+
+
+## EJECUCIÓN ##
+
+def load_fixtures(scale, n_parks):
+    from app.utils.stop_index import load_stop_gdf
+
+    acces_gdf, green_gdf = load_indicator_fixtures(scale=scale)
+
+    barrios = load_barrios_fixture()
+    width = barrios_width(barrios)
+    admin_barr = scale_barrios(barrios[['coddistbar', 'nombre', 'geometry']], scale)
+    parks = scale_barrios(synthetic_parks(n_parks), scale, width)
+
+    gdf_stops = load_stop_gdf()
+    if gdf_stops is not None and scale > 1:
+        copies = np.repeat(np.arange(scale), len(gdf_stops))
+        gdf_stops = scale_barrios(gdf_stops, scale, width)
+        gdf_stops['stop_id'] = gdf_stops['stop_id'].astype(str) + np.where(copies > 0, np.char.add('_', copies.astype(str)), '')
+
+    return acces_gdf, green_gdf, admin_barr, parks, gdf_stops
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, previous_path):
+    # Cambio relativo de p50 y del rendimiento con la mayor concurrencia respecto a una ejecución anterior
+    with open(previous_path) as f:
+        previous = {case['name']: case for case in json.load(f)['results']}
+
+    print(f"\nComparación con {previous_path}:")
+    for case in results:
+        before = previous.get(case['name'])
+        if before is None:
+            continue
+        line = f"{case['name']:<45} p50 {(case['p50_ms'] / before['p50_ms'] - 1) * 100:+7.1f}%"
+        if case.get('throughput_rps') and before.get('throughput_rps'):
+            concurrency = max(case['throughput_rps'], key=int)
+            if concurrency in before['throughput_rps']:
+                change = case['throughput_rps'][concurrency] / before['throughput_rps'][concurrency] - 1
+                line += f"   rendimiento c={concurrency} {change * 100:+7.1f}%"
+        print(line)
+
+
+def run(args):
+    """
+    Ejecuta la batería con los datos del repositorio (GeoJSON de barrios, feeds GTFS, respuestas de Overpass en
+    app/api/cache) y conjuntos sintéticos escalados. El pico de memoria es el de tracemalloc (Python y NumPy,
+    sin GEOS). Los endpoints necesitan httpx y 'get_accesibility_gdf' osmnx; los barrios que no estén en la caché
+    de Overpass se descargarían, por eso por defecto solo se usan unos pocos.
+    """
+
+    t0 = time.perf_counter()
+    fixtures = load_fixtures(args.scale, args.parks)
+    print(f"Fixtures (escala x{args.scale}): {len(fixtures[0])} barrios, {len(fixtures[3])} parques, "
+          f"{0 if fixtures[4] is None else len(fixtures[4])} paradas en {time.perf_counter() - t0:.1f} s\n")
+
+    results = []
+    if not args.skip_endpoints:
+        results += asyncio.run(endpoint_cases(args, fixtures))
+    if not args.skip_pipelines:
+        results += pipeline_cases(args, fixtures)
+
+    report = {
+        'commit': git_commit(),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'params': {'scale': args.scale, 'parks': args.parks, 'requests': args.requests,
+                   'concurrency': args.concurrency, 'repeat': args.repeat},
+        'results': results,
+    }
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResultados guardados en {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+    return report
+
+
+if __name__ == '__main__':
+
+    # Ejemplo: python -m app.benchmarks.suite --output bench/nuevo.json --compare bench/anterior.json
+    parser = argparse.ArgumentParser(description="Benchmarks sin conexión de los endpoints y los pipelines: latencia, "
+                                                 "rendimiento concurrente y pico de memoria, con resultados en JSON.")
+    parser.add_argument('--output', default=None, help="Fichero JSON de resultados.")
+    parser.add_argument('--compare', default=None, help="JSON de una ejecución anterior con el que comparar.")
+    parser.add_argument('--scale', type=int, default=1, help="Replicar barrios, parques y paradas N veces.")
+    parser.add_argument('--parks', type=int, default=2_000, help="Parques sintéticos (por copia).")
+    parser.add_argument('--requests', type=int, default=500, help="Peticiones por endpoint.")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--repeat', type=int, default=5, help="Repeticiones de cada etapa de pipeline.")
+    parser.add_argument('--accessibility-barrios', type=int, default=3,
+                        help="Barrios para 'get_accesibility_gdf' (0 = omitir).")
+    parser.add_argument('--skip-endpoints', action='store_true')
+    parser.add_argument('--skip-pipelines', action='store_true')
+    args = parser.parse_args()
+
+    run(args)
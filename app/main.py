@@ -1,47 +1,32 @@
 import os
-from dotenv import load_dotenv
-import geopandas as gpd
-import pandas as pd
-from sqlalchemy import create_engine
-from fastapi import FastAPI, HTTPException, Query
-from fastapi.responses import HTMLResponse
-from app.utils.helpers import *
-from app.api.green_area import get_green_gdf
+import secrets
+import time
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from app.utils.dataset import DatasetHolder, load_dataset
+from app.utils.refresh import DatasetRefresher
+from app.utils.geo_db import open_barrio_store, LayerUnavailable
+from app.utils.isochrone import load_isochrone_engine, DEFAULT_MINUTES, MAX_MINUTES
+from app.utils.stop_index import StopIndex, load_stop_gdf, MAX_K
+from app.utils.spatial_index import BarrioLocator
+from app.utils.heatmap import HeatmapIndex
+from app.utils.tiles import TileIndex
+from app.utils.export import iter_export, EXPORT_FORMATS
+from app.utils.cache import SingleFlightCache, etag_for, etag_matches
+from app.utils.batch_coords import (parse_coordinates, encode_barrio_fragments, splice_batch, read_batch_body,
+                                    BatchTooLarge, MAX_BATCH_POINTS)
+from app.utils.metrics import MetricsMiddleware, REGISTRY, CONTENT_TYPE, metrics_enabled
+from app.utils.profiling import ProfilingMiddleware, profiling_enabled
 from pydantic import BaseModel
-from typing import Optional
-import numpy as np
-from fastapi.responses import JSONResponse
-from shapely.geometry import mapping
+from typing import List, Optional
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 import orjson
 import uvicorn
 
 
-# Conectar con base de datos a partir de .env
-load_dotenv()
-DB_USER = os.getenv("DB_USER")
-DB_PASSWORD = os.getenv("DB_PASSWORD")
-DB_HOST = os.getenv("DB_HOST")
-DB_PORT = os.getenv("DB_PORT")
-DB_NAME = os.getenv("DB_NAME")
-DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-engine = create_engine(DATABASE_URL)
-
-# Cargar geojson accesibility de la base de datos
-query = "SELECT * FROM barrios_accesibilidad;"
-acces_gdf = gpd.read_postgis(query, con=engine, geom_col='geometry')
-acces_gdf[acces_gdf.select_dtypes(include=['object']).columns] = acces_gdf[acces_gdf.select_dtypes(include=['object']).columns].fillna("Desconocido")
-acces_gdf[acces_gdf.select_dtypes(include=['float64']).columns] = acces_gdf[acces_gdf.select_dtypes(include=['float64']).columns].fillna(0)
-
-# Cargar geojson green
-green_gdf = get_green_gdf()
-green_gdf[green_gdf.select_dtypes(include=['object']).columns] = green_gdf[green_gdf.select_dtypes(include=['object']).columns].fillna("Desconocido")
-green_gdf[green_gdf.select_dtypes(include=['float64']).columns] = green_gdf[green_gdf.select_dtypes(include=['float64']).columns].fillna(0)
-
-
-
-def create_indicator(gdf, alpha, beta):
-    gdf['icvu'] = alpha * gdf['green_ratio'] + beta * (gdf['accessibility_percentage']/100)
-    return gdf
+# Los pesos del ICVU se cuantizan para que presets equivalentes compartan la entrada de caché
+HEATMAP_PARAM_DECIMALS = 4
 
 
 # Define el modelo para la respuesta de zonas verdes
@@ -63,100 +48,422 @@ class Acces(BaseModel):
     centroid_route_type: Optional[str]
     num_stops: Optional[float]
     accessibility_percentage: Optional[float]
+    departures_per_hour: Optional[float] = None
+    frequent_accessibility_percentage: Optional[float] = None
+
+
+def build_derived(acces_gdf, green_gdf):
+    """
+    Estructuras derivadas de los datos, construidas una sola vez por versión del Dataset.
+    """
+
+    heatmap_index = HeatmapIndex(acces_gdf, green_gdf)
+
+    return {
+        # Índices espaciales de los barrios
+        'green_locator': BarrioLocator(green_gdf),
+        'acces_locator': BarrioLocator(acces_gdf),
+        # Respuestas por barrio validadas y codificadas una sola vez para las consultas en lote
+        'verde_fragments': encode_barrio_fragments(green_gdf, Verde),
+        'acces_fragments': encode_barrio_fragments(acces_gdf, Acces),
+        # Tabla del mapa de calor (merge, geometrías válidas y Features pre-codificados)
+        'heatmap_index': heatmap_index,
+        # Caché de respuestas del mapa de calor (bytes ya codificados) con single-flight
+        'heatmap_cache': SingleFlightCache(int(os.getenv("HEATMAP_CACHE_SIZE", 256))),
+        # Teselas vectoriales a partir de la misma pirámide de geometrías
+        'tile_index': TileIndex(heatmap_index, cache_size=int(os.getenv("TILE_CACHE_SIZE", 4096))),
+    }
+
+
+datasets = DatasetHolder()
+
+# Recarga en segundo plano: cada DATASET_REFRESH_INTERVAL segundos (0 = solo con POST /admin/refresh)
+refresher = DatasetRefresher(
+    datasets, lambda current_version: load_dataset(build_derived, refresh=True, current_version=current_version),
+    required_columns={'acces_gdf': ['geometry', *(name for name, f in Acces.model_fields.items() if f.is_required())],
+                      'green_gdf': ['geometry', *(name for name, f in Verde.model_fields.items() if f.is_required())]},
+    interval=float(os.getenv("DATASET_REFRESH_INTERVAL", 0)))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Carga de los datos al arrancar: instantáneas locales por defecto (ver app.utils.snapshot)
+    t0 = time.perf_counter()
+    dataset = load_dataset(build_derived)
+    datasets.swap(dataset)
+    app.state.startup_seconds = time.perf_counter() - t0
+
+    print(f"Datos cargados ({dataset.source}, versión {dataset.version}) en {app.state.startup_seconds:.2f} s")
+
+    # Acceso en vivo a la base de datos (DB_BACKEND=postgis|sqlite), con un único pool para todo el proceso
+    app.state.barrio_store = await open_barrio_store()
+
+    # Paradas EMT + Metro (feeds GTFS locales) y grafo peatonal de la ciudad (WALK_GRAPH_PATH), si existen
+    gdf_stops = load_stop_gdf()
+    app.state.isochrones = load_isochrone_engine(gdf_stops=gdf_stops)
+    graph = app.state.isochrones.graph if app.state.isochrones is not None else None
+    app.state.stop_index = StopIndex(gdf_stops, graph) if gdf_stops is not None else None
+
+    refresher.start()
+    yield
+    refresher.stop()
+
+    if app.state.barrio_store is not None:
+        await app.state.barrio_store.close()
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    # Los endpoints de administración solo están disponibles si ADMIN_TOKEN está definido
+    token = os.getenv("ADMIN_TOKEN")
+    if not token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if x_admin_token is None or not secrets.compare_digest(x_admin_token, token):
+        raise HTTPException(status_code=403, detail="Token de administración no válido")
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Métricas por ruta (latencia, tamaño, errores y peticiones en curso) en GET /metrics; METRICS_ENABLED=0 las desactiva
+if metrics_enabled():
+    app.add_middleware(MetricsMiddleware)
+
+# Con PROFILING_ENABLED=1, una petición con X-Profile: collapsed|speedscope (o ?profile=) y X-Admin-Token devuelve
+# su perfil por muestreo en lugar de la respuesta; sin él, el middleware ni siquiera se instala
+if profiling_enabled():
+    app.add_middleware(ProfilingMiddleware)
 
 
-app = FastAPI()
+@app.get("/health", tags=["Estado"])
+def health():
+    dataset = datasets.get()
+    return {"status": "ok", "dataset_version": dataset.version, "source": dataset.source,
+            "startup_seconds": app.state.startup_seconds, "load_seconds": dataset.load_seconds}
+
+
+@app.get("/metrics", tags=["Estado"])
+def metrics():
+    # Formato de texto de Prometheus; cada worker de uvicorn expone sus propias métricas
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+@app.get("/admin/dataset", tags=["Administración"], dependencies=[Depends(require_admin)])
+def admin_dataset():
+    dataset = datasets.get()
+    return {"version": dataset.version, "source": dataset.source, "loaded_at": dataset.loaded_at,
+            "load_seconds": dataset.load_seconds, "rows": {"acces_gdf": len(dataset.acces_gdf),
+                                                           "green_gdf": len(dataset.green_gdf)},
+            "refresh": refresher.status()}
+
+
+@app.post("/admin/refresh", status_code=202, tags=["Administración"], dependencies=[Depends(require_admin)])
+def admin_refresh():
+    """
+    Lanza una recarga de los datos en segundo plano; el estado se consulta en GET /admin/dataset.
+    """
+
+    started = refresher.trigger()
+    return {"started": started, "version": datasets.get().version, "refresh": refresher.status()}
 
 
 @app.get("/zonas-verdes/coord", response_model=Verde, tags=["Zonas Verdes"])
 def zona_verde_coord(lon: float = Query(...), lat: float = Query(...)):
 
-    barrio_id = get_barr_id_coords(lon, lat, green_gdf)
+    barrio = datasets.get().green_locator.lookup(lon, lat)
 
-    print(f"barrio_id calculado: {barrio_id}")
+    if barrio is None:
+        raise HTTPException(status_code=404, detail="Coordenadas fuera de los límites de Valencia")
+
+    verde = Verde(
+        coddistbar=barrio["coddistbar"],
+        nombre=barrio["nombre"],
+        green_area_m2=barrio["green_area_m2"],
+        green_ratio=barrio["green_ratio"],
+        barr_area_imputed=barrio["barr_area_imputed"],
+        green_area_per_capita_m2=barrio["green_area_per_capita_m2"],
+        population=barrio["population"],
+    )
+    return verde
+
+
+@app.get("/accesibilidad/coord", response_model=Acces, tags=["Accesibilidad"])
+def acces_coord(lon: float = Query(...), lat: float = Query(...)):
 
+    barrio = datasets.get().acces_locator.lookup(lon, lat)
 
-    if not barrio_id:
+    if barrio is None:
         raise HTTPException(status_code=404, detail="Coordenadas fuera de los límites de Valencia")
 
-    barrio_data = green_gdf.loc[green_gdf['coddistbar'] == barrio_id]
+    acces = Acces(
+        coddistbar=barrio["coddistbar"],
+        nombre=barrio["nombre"],
+        centroid_distance=barrio["centroid_distance"],
+        centroid_estimated_time=barrio["centroid_estimated_time"],
+        centroid_route_type=barrio["centroid_route_type"],
+        num_stops=barrio["num_stops"],
+        accessibility_percentage=barrio["accessibility_percentage"],
+        departures_per_hour=barrio.get("departures_per_hour"),
+        frequent_accessibility_percentage=barrio.get("frequent_accessibility_percentage"),
+    )
+    return acces
 
 
-    if not barrio_data.empty:
+def barrio_store(request: Request):
+    store = request.app.state.barrio_store
+    if store is None:
+        raise HTTPException(status_code=503, detail="Consultas en vivo desactivadas (DB_BACKEND)")
+    return store
 
-        barrio = barrio_data.iloc[0]
 
-        verde = Verde(
-            coddistbar=barrio["coddistbar"],
-            nombre=barrio["nombre"],
-            green_area_m2=barrio["green_area_m2"],
-            green_ratio=barrio["green_ratio"],
-            barr_area_imputed=barrio["barr_area_imputed"],
-            green_area_per_capita_m2=barrio["green_area_per_capita_m2"],
-            population=barrio["population"],
-        )
-        return verde
-    else:
-        raise HTTPException(status_code=404, detail="Barrio no encontrado")
+@app.exception_handler(LayerUnavailable)
+async def layer_unavailable(request: Request, exc: LayerUnavailable):
+    # Capa sin tabla en la base de datos: el resto de la API sigue funcionando
+    return JSONResponse(status_code=503, content={"detail": f"Capa no disponible: {exc}"})
 
 
-@app.get("/accesibilidad/coord", response_model=Acces, tags=["Accesibilidad"])
-def acces_coord(lon: float = Query(...), lat: float = Query(...)):
+# Variantes asíncronas que consultan la base de datos en cada petición, para tablas que no caben en memoria
+@app.get("/db/zonas-verdes/coord", response_model=Verde, tags=["Zonas Verdes"])
+async def zona_verde_coord_db(lon: float = Query(...), lat: float = Query(...), store=Depends(barrio_store)):
+
+    barrio = await store.barrio_by_point('verde', lon, lat)
+    if barrio is None:
+        raise HTTPException(status_code=404, detail="Coordenadas fuera de los límites de Valencia")
+    return barrio
+
 
-    barrio_id = get_barr_id_coords(lon, lat, acces_gdf)
+@app.get("/db/accesibilidad/coord", response_model=Acces, tags=["Accesibilidad"])
+async def acces_coord_db(lon: float = Query(...), lat: float = Query(...), store=Depends(barrio_store)):
 
-    if not barrio_id:
+    barrio = await store.barrio_by_point('acces', lon, lat)
+    if barrio is None:
         raise HTTPException(status_code=404, detail="Coordenadas fuera de los límites de Valencia")
+    return barrio
 
-    barrio_data = acces_gdf.loc[acces_gdf['coddistbar'] == barrio_id]
 
-    if not barrio_data.empty:
+@app.get("/db/zonas-verdes/{coddistbar}", response_model=Verde, tags=["Zonas Verdes"])
+async def zona_verde_id_db(coddistbar: int, store=Depends(barrio_store)):
 
-        barrio = barrio_data.iloc[0]
+    barrio = await store.barrio_by_id('verde', coddistbar)
+    if barrio is None:
+        raise HTTPException(status_code=404, detail="Barrio no encontrado")
+    return barrio
+
+
+@app.get("/db/accesibilidad/{coddistbar}", response_model=Acces, tags=["Accesibilidad"])
+async def acces_id_db(coddistbar: int, store=Depends(barrio_store)):
 
-        acces = Acces(
-            coddistbar=barrio["coddistbar"],
-            nombre=barrio["nombre"],
-            centroid_distance=barrio["centroid_distance"],
-            centroid_estimated_time=barrio["centroid_estimated_time"],
-            centroid_route_type=barrio["centroid_route_type"],
-            num_stops=barrio["num_stops"],
-            accessibility_percentage=barrio["accessibility_percentage"],
-        )
-        return acces
-    else:
+    barrio = await store.barrio_by_id('acces', coddistbar)
+    if barrio is None:
         raise HTTPException(status_code=404, detail="Barrio no encontrado")
+    return barrio
+
+
+@app.post("/coord/batch", tags=["Zonas Verdes", "Accesibilidad"])
+async def coord_batch(request: Request, capa: str = Query("todas", pattern="^(verde|acces|todas)$")):
+    """
+    Localiza muchos puntos (lon, lat) en una sola petición.
+
+    El cuerpo puede ser JSON, NDJSON o CSV (ver 'parse_coordinates'). La respuesta contiene, para cada capa
+    solicitada, una lista alineada con los puntos de entrada con los campos de Verde/Acces o null si el punto
+    está fuera de Valencia.
+    """
 
+    try:
+        body = await read_batch_body(request)
+    except BatchTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
 
+    # Lectura, localización y codificación en el pool de hilos: un lote grande no bloquea el bucle de eventos
+    content = await run_in_threadpool(locate_batch, body, request.headers.get("content-type"), capa)
+    return Response(content=content, media_type="application/json")
+
+
+def locate_batch(body, content_type, capa) -> bytes:
+
+    try:
+        lons, lats = parse_coordinates(body, content_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if len(lons) > MAX_BATCH_POINTS:
+        raise HTTPException(status_code=413, detail=f"Máximo {MAX_BATCH_POINTS} puntos por petición")
+
+    dataset = datasets.get()
+    parts = [b'"count":' + orjson.dumps(len(lons))]
+
+    if capa in ("verde", "todas"):
+        positions = dataset.green_locator.locate_positions(lons, lats)
+        parts.append(b'"verde":' + splice_batch(dataset.verde_fragments, positions))
+
+    if capa in ("acces", "todas"):
+        positions = dataset.acces_locator.locate_positions(lons, lats)
+        parts.append(b'"acces":' + splice_batch(dataset.acces_fragments, positions))
+
+    return b'{' + b','.join(parts) + b'}'
 
 
 @app.get("/ICVU/heatmap", tags=["ICVU"])
-def get_heatmap(alpha: float = Query(0.7), beta: float = Query(0.5)):
-    merged_gdf = acces_gdf.merge(green_gdf, on='coddistbar', suffixes=('_acceso', '_verde'))
-    merged_gdf = create_indicator(merged_gdf, alpha, beta)
-
-    geojson_data = merged_gdf[['coddistbar', 'nombre_acceso', 'icvu', 'geometry_verde']].copy()
-    geojson_data = geojson_data.rename(columns={'geometry_verde': 'geometry'})
-    geojson_data = geojson_data[geojson_data['geometry'].notnull() & geojson_data['geometry'].apply(lambda x: x.is_valid)]
-
-    features = []
-    for _, row in geojson_data.iterrows():
-        feature = {
-            "type": "Feature",
-            "geometry": mapping(row['geometry']),
-            "properties": {
-                "coddistbar": row['coddistbar'],
-                "nombre_acceso": row['nombre_acceso'],
-                "icvu": row['icvu']
-            }
-        }
-        features.append(feature)
-
-    return JSONResponse(content={
-        "type": "FeatureCollection",
-        "crs": {"type": "name", "properties": {"name": "EPSG:4326"}},
-        "features": features
-    })
+def get_heatmap(request: Request, alpha: float = Query(0.7), beta: float = Query(0.5),
+                zoom: Optional[int] = Query(None, ge=0, le=22, description="Nivel de zoom del mapa"),
+                tolerance: Optional[float] = Query(None, ge=0, description="Tolerancia de simplificación en grados"),
+                quantize: bool = Query(False, description="Redondear las coordenadas según el nivel"),
+                format: str = Query("geojson", pattern="^(geojson|parquet|arrow|fgb)$"),
+                weighting: str = Query("coverage", pattern="^(coverage|frequency)$",
+                                       description="Accesibilidad con todas las paradas o solo con las frecuentes")):
+
+    dataset = datasets.get()
+    heatmap_index = dataset.heatmap_index
+
+    if weighting not in heatmap_index.weightings:
+        raise HTTPException(status_code=400, detail=f"Ponderación '{weighting}' no disponible en estos datos")
+
+    alpha = round(alpha, HEATMAP_PARAM_DECIMALS)
+    beta = round(beta, HEATMAP_PARAM_DECIMALS)
+    level = heatmap_index.level_for(tolerance, zoom)
+
+    if format != "geojson":
+        gdf = heatmap_index.frame(alpha, beta, zoom=zoom, tolerance=tolerance, weighting=weighting)
+        return export_response(gdf, format, "icvu_heatmap")
+
+    key = (heatmap_index.version, alpha, beta, level, quantize, weighting)
+    etag = etag_for(key)
+    headers = {"ETag": etag}
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    content = dataset.heatmap_cache.get_or_compute(
+        key, lambda: heatmap_index.render(alpha, beta, tolerance=tolerance, zoom=zoom, quantized=quantize,
+                                          weighting=weighting))
+
+    return Response(content=content, media_type="application/json", headers=headers)
+
+
+@app.get("/ICVU/cache", tags=["ICVU"])
+def heatmap_cache_stats():
+    dataset = datasets.get()
+    return {"dataset_version": dataset.heatmap_index.version, "heatmap": dataset.heatmap_cache.stats(),
+            "tiles": dataset.tile_index.cache.stats()}
+
+
+def export_response(gdf, fmt, name):
+    media_type, extension = EXPORT_FORMATS[fmt]
+    headers = {"Content-Disposition": f'attachment; filename="{name}.{extension}"'}
+    return StreamingResponse(iter_export(gdf, fmt), media_type=media_type, headers=headers)
+
+
+@app.get("/export/{dataset}", tags=["Exportación"])
+def export_dataset(dataset: str, format: str = Query("parquet", pattern="^(geojson|parquet|arrow|fgb)$")):
+    """
+    Exporta todos los atributos de 'zonas-verdes' (green_gdf) o 'accesibilidad' (acces_gdf).
+    """
+
+    current = datasets.get()
+    tables = {"zonas-verdes": current.green_gdf, "accesibilidad": current.acces_gdf}
+    if dataset not in tables:
+        raise HTTPException(status_code=404, detail=f"Dataset desconocido. Opciones: {', '.join(tables)}")
+
+    return export_response(tables[dataset], format, dataset)
+
+
+@app.get("/isochrone", tags=["Accesibilidad"])
+def isochrone(request: Request, lon: float = Query(...), lat: float = Query(...),
+              minutes: List[int] = Query(list(DEFAULT_MINUTES), description="Duraciones de las bandas en minutos"),
+              speed: float = Query(1.5, gt=0.3, le=3.0, description="Velocidad a pie (m/s)")):
+    """
+    Zonas alcanzables a pie desde (lon, lat) en cada duración, con las paradas y el área verde que contienen.
+    """
+
+    engine = request.app.state.isochrones
+    if engine is None:
+        raise HTTPException(status_code=503, detail="Grafo peatonal no disponible (WALK_GRAPH_PATH)")
+
+    if not minutes or any(m <= 0 or m > MAX_MINUTES for m in minutes):
+        raise HTTPException(status_code=400, detail=f"Las duraciones deben estar entre 1 y {MAX_MINUTES} minutos")
+
+    try:
+        content, node, snap_distance = engine.isochrones(lon, lat, minutes, speed)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    headers = {"X-Origin-Node": str(int(engine.graph.node_ids[node])), "X-Snap-Distance": f"{snap_distance:.1f}"}
+    return Response(content=content, media_type="application/geo+json", headers=headers)
+
+
+def stop_index(request: Request):
+    index = request.app.state.stop_index
+    if index is None:
+        raise HTTPException(status_code=503, detail="Paradas no disponibles (faltan los feeds GTFS)")
+    return index
+
+
+@app.get("/paradas/cercanas", tags=["Accesibilidad"])
+def paradas_cercanas(lon: float = Query(...), lat: float = Query(...), k: int = Query(5, ge=1, le=MAX_K),
+                     route_type: Optional[str] = Query(None, description="Bus, Subway, Tram..."),
+                     network: bool = Query(False, description="Incluir la distancia a pie por la red peatonal"),
+                     index=Depends(stop_index)):
+    """
+    Las k paradas más cercanas al punto, con su distancia en línea recta y, opcionalmente, a pie.
+    """
+
+    try:
+        content = index.query(lon, lat, k, route_type, network)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    return Response(content=content, media_type="application/json")
+
+
+@app.post("/paradas/cercanas/batch", tags=["Accesibilidad"])
+async def paradas_cercanas_batch(request: Request, k: int = Query(5, ge=1, le=MAX_K),
+                                 route_type: Optional[str] = Query(None), index=Depends(stop_index)):
+    """
+    Versión en lote (distancia en línea recta): mismo cuerpo que /coord/batch y una lista de paradas por punto.
+    """
+
+    try:
+        body = await read_batch_body(request)
+    except BatchTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    # Como en /coord/batch, la lectura y la búsqueda se hacen en el pool de hilos
+    content = await run_in_threadpool(nearest_stops_batch, index, body, request.headers.get("content-type"), k,
+                                      route_type)
+    return Response(content=content, media_type="application/json")
+
+
+def nearest_stops_batch(index, body, content_type, k, route_type) -> bytes:
+
+    try:
+        lons, lats = parse_coordinates(body, content_type)
+        if len(lons) * k > MAX_BATCH_POINTS:
+            raise HTTPException(status_code=413, detail=f"Máximo {MAX_BATCH_POINTS} resultados (puntos × k) por petición")
+        content = index.query_batch(lons, lats, k, route_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return b'{"count":' + orjson.dumps(len(lons)) + b',"stops":' + content + b'}'
+
+
+@app.get("/tiles/{z}/{x}/{y}.mvt", tags=["ICVU"])
+def get_tile(z: int, x: int, y: int, alpha: float = Query(0.7), beta: float = Query(0.5),
+             weighting: str = Query("coverage", pattern="^(coverage|frequency)$",
+                                    description="Accesibilidad con todas las paradas o solo con las frecuentes")):
+
+    if not 0 <= z <= 22 or not 0 <= x < 2 ** z or not 0 <= y < 2 ** z:
+        raise HTTPException(status_code=404, detail="Tesela fuera de rango")
+
+    dataset = datasets.get()
+    if weighting not in dataset.heatmap_index.weightings:
+        raise HTTPException(status_code=400, detail=f"Ponderación '{weighting}' no disponible en estos datos")
+
+    # Mismo redondeo que /ICVU/heatmap: parámetros casi iguales comparten tesela en caché
+    alpha = round(alpha, HEATMAP_PARAM_DECIMALS)
+    beta = round(beta, HEATMAP_PARAM_DECIMALS)
+
+    return Response(content=dataset.tile_index.render(z, x, y, alpha, beta, weighting),
+                    media_type="application/vnd.mapbox-vector-tile")
 
 
 if __name__ == "__main__":    # Use this for debugging purposes only
@@ -0,0 +1,118 @@
+import io
+import numpy as np
+import pandas as pd
+import orjson
+from fastapi.encoders import jsonable_encoder
+
+
+# Límite de puntos aceptados en una sola petición de lote
+MAX_BATCH_POINTS = 1_000_000
+
+# Límite del cuerpo de la petición (1M puntos en JSON ocupan unos 40 MB)
+MAX_BATCH_BYTES = 64 * 1024 * 1024
+
+
+class BatchTooLarge(ValueError):
+    pass
+
+
+async def read_batch_body(request, max_bytes=MAX_BATCH_BYTES) -> bytes:
+    """
+    Lee el cuerpo de una petición de lote sin pasar de 'max_bytes': se rechaza antes de leer nada si el
+    Content-Length ya lo supera y, si no lo trae (chunked), en cuanto lo leído lo supera.
+
+    :raises BatchTooLarge: Si el cuerpo es demasiado grande.
+    """
+
+    content_length = request.headers.get('content-length')
+    if content_length is not None and content_length.isdigit() and int(content_length) > max_bytes:
+        raise BatchTooLarge(f"El cuerpo supera {max_bytes} bytes")
+
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > max_bytes:
+            raise BatchTooLarge(f"El cuerpo supera {max_bytes} bytes")
+        chunks.append(chunk)
+
+    return b''.join(chunks)
+
+
+def _coords_from_records(records):
+    # Acepta [[lon, lat], ...] o [{"lon": .., "lat": ..}, ...]
+    if len(records) == 0:
+        return np.empty(0), np.empty(0)
+
+    if isinstance(records[0], dict):
+        lons = np.fromiter((r['lon'] for r in records), dtype=float, count=len(records))
+        lats = np.fromiter((r['lat'] for r in records), dtype=float, count=len(records))
+        return lons, lats
+
+    coords = np.asarray(records, dtype=float)
+    if coords.ndim != 2 or coords.shape[1] != 2:
+        raise ValueError("Cada punto debe ser un par [lon, lat].")
+
+    return coords[:, 0], coords[:, 1]
+
+
+def parse_coordinates(body: bytes, content_type: str):
+    """
+    Convierte el cuerpo de una petición de lote en dos arrays (lons, lats).
+
+    Formatos admitidos según el Content-Type:
+    - application/json: [[lon, lat], ...], [{"lon": .., "lat": ..}, ...] o {"points": [...]}.
+    - application/x-ndjson: una línea por punto, como [lon, lat] o {"lon": .., "lat": ..}.
+    - text/csv: columnas 'lon' y 'lat' (o las dos primeras columnas si no hay cabecera).
+
+    :raises ValueError: Si el cuerpo no se puede interpretar.
+    """
+
+    content_type = (content_type or 'application/json').split(';')[0].strip().lower()
+
+    try:
+        if content_type in ('application/x-ndjson', 'application/ndjson', 'application/jsonl'):
+            lines = [line for line in body.splitlines() if line.strip()]
+            records = orjson.loads(b'[' + b','.join(lines) + b']')
+            lons, lats = _coords_from_records(records)
+
+        elif content_type in ('text/csv', 'application/csv'):
+            df = pd.read_csv(io.BytesIO(body))
+            if not {'lon', 'lat'}.issubset(df.columns):
+                df = pd.read_csv(io.BytesIO(body), header=None, usecols=[0, 1], names=['lon', 'lat'])
+            lons = df['lon'].to_numpy(dtype=float)
+            lats = df['lat'].to_numpy(dtype=float)
+
+        else:
+            records = orjson.loads(body)
+            if isinstance(records, dict):
+                records = records.get('points', [])
+            lons, lats = _coords_from_records(records)
+
+    except (KeyError, TypeError, orjson.JSONDecodeError, pd.errors.ParserError, pd.errors.EmptyDataError) as e:
+        raise ValueError(f"No se pudieron leer las coordenadas: {e}")
+
+    return lons, lats
+
+
+def encode_barrio_fragments(gdf, model):
+    """
+    Valida cada barrio con el modelo de respuesta una sola vez y lo guarda codificado en JSON.
+
+    :param gdf: GeoDataFrame con los barrios.
+    :param model: Modelo pydantic de la respuesta (Verde o Acces).
+    :return: Array de objetos bytes, uno por fila, con 'null' añadido al final para los puntos fuera de Valencia.
+    """
+
+    # Solo los campos presentes: los opcionales que falten (p. ej. 'departures_per_hour' en datos sin horarios
+    # GTFS) toman el valor por defecto del modelo
+    fields = [field for field in (getattr(model, 'model_fields', None) or model.__fields__) if field in gdf.columns]
+    fragments = [orjson.dumps(jsonable_encoder(model(**row))) for row in gdf[fields].to_dict('records')]
+    fragments.append(b'null')
+
+    return np.array(fragments, dtype=object)
+
+
+def splice_batch(fragments, positions) -> bytes:
+    # La posición -1 (fuera de Valencia) selecciona el último fragmento, que es 'null'
+    return b'[' + b','.join(fragments[positions]) + b']'
@@ -0,0 +1,123 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Caché LRU acotada y segura entre hilos (los endpoints síncronos se ejecutan en el threadpool de FastAPI).
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {'size': len(self._data), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+
+class _InFlight:
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlightCache(LRUCache):
+    """
+    LRUCache que agrupa los cálculos concurrentes de una misma clave (single-flight): si llegan varias
+    peticiones iguales a la vez, solo la primera calcula el valor y el resto espera a su resultado.
+    """
+
+    def __init__(self, maxsize=1024):
+        super().__init__(maxsize)
+        self._inflight = {}
+        self.coalesced = 0
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        with self._lock:
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _InFlight()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = compute()
+            self.put(key, call.value)
+            return call.value
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            call.event.set()
+
+    def stats(self):
+        stats = super().stats()
+        stats['coalesced'] = self.coalesced
+        stats['in_flight'] = len(self._inflight)
+        return stats
+
+
+def etag_for(key) -> str:
+    """
+    ETag fuerte derivado de la clave de caché (incluye la versión de los datos).
+    """
+
+    return '"' + hashlib.sha1(repr(key).encode()).hexdigest()[:24] + '"'
+
+
+def _opaque_tag(etag):
+    # Parte opaca de un ETag, sin el prefijo 'W/' de los ETags débiles
+    etag = etag.strip()
+    return etag[2:] if etag.startswith('W/') else etag
+
+
+def etag_matches(if_none_match, etag) -> bool:
+    # Cabecera If-None-Match: "*" o lista de ETags separados por comas. Se compara de forma débil (RFC 7232):
+    # los proxies que comprimen la respuesta devuelven el ETag como W/"...", y debe seguir coincidiendo
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(',')]
+    return '*' in candidates or _opaque_tag(etag) in {_opaque_tag(candidate) for candidate in candidates}
@@ -1,6 +1,32 @@
+import argparse
+import hashlib
+import json
 import os
-import pandas as pd
 import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+
+DATA_FOLDER = os.path.join(os.path.dirname(__file__), 'data')
+WORKBOOKS_FOLDER = os.path.join(DATA_FOLDER, 'Barrios2025')
+CACHE_FOLDER = os.path.join(DATA_FOLDER, 'padron_cache')
+
+# Cambia si cambia la forma de leer los libros: invalida la caché
+PARSER_VERSION = 1
+
+# Distrito_XX_Barrio_Y.xlsx -> coddistbar = XXY (p. ej. Distrito_15_Barrio_2 -> 152)
+WORKBOOK_PATTERN = re.compile(r'Distrito_(\d+)_Barrio_(\d+)\.xlsx$')
+
+# Título en valenciano: "1. Padró a 01/01/2024 . Barri 1.1. la Seu"
+TITLE_PATTERN = re.compile(r'\bBarri\s+\d+\.\d+\.')
+
+YEAR_RANGE = (1900, 2100)
+
+POPULATION_TABLE = 'population_barr'
+POPULATION_YEARS_TABLE = 'population_barr_years'
+
 
 # Función para extraer el nombre del barrio
 def extract_barrio_name(text):
@@ -10,56 +36,183 @@ def extract_barrio_name(text):
         return match.group(1).strip()
     return None
 
-# Función para extraer la población bajo el año 2024
-def extract_population(df):
-    population = None
-    # Iterar sobre todas las celdas del DataFrame
-    for row in range(df.shape[0]):
-        for col in range(df.shape[1]):
-            # Buscar el año 2024 en el DataFrame
-            if df.iloc[row, col] == 2024:
-                # Extraer el valor debajo de 2024
-                if row + 1 < df.shape[0]:
-                    population = df.iloc[row + 1, col]
-                break
-        if population is not None:
-            break
-    return population
-
-# Ruta de los archivos Excel
-path = 'barrios'
-
-# Listar todos los archivos .xlsx en el directorio
-excel_files = [f for f in os.listdir(path) if f.endswith('.xlsx')]
-
-# Crear listas para almacenar los resultados
-barrio_names = []
-populations = []
-
-# Iterar sobre todos los archivos Excel
-for file in excel_files:
-    # Leer el archivo Excel
-    file_path = os.path.join(path, file)
-    df = pd.read_excel(file_path, engine='openpyxl')
-
-    # Extraer el nombre del barrio de la celda 2 (en la primera columna) y limpiar el texto
-    barrio_name = extract_barrio_name(str(df.iloc[1, 0]))  # Fila 2, columna 1
-    barrio_names.append(barrio_name)
-
-    # Extraer la población buscando el valor 2024
-    population = extract_population(df)
-    populations.append(population)
-
-# Crear un DataFrame con los resultados
-result_df = pd.DataFrame({
-    'nombre_barrio': barrio_names,
-    'population': populations
-})
-
-
-
-print("Proceso completado. Los datos se han guardado en '020101_PadronBarrios.csv'.")
-
-result_df['nombre_barrio'] = result_df['nombre_barrio'].apply(lambda x: x.upper())
-# Guardar los resultados en un archivo CSV
-result_df.to_csv('data/020101_PadronBarrios.csv', index=False)
\ No newline at end of file
+
+def coddistbar_from_filename(file_path):
+    match = WORKBOOK_PATTERN.search(os.path.basename(file_path))
+    if match is None:
+        raise ValueError(f"Nombre de libro inesperado: {file_path}")
+    return int(f"{int(match.group(1))}{int(match.group(2))}")
+
+
+def extract_population_series(values):
+    """
+    Serie de población de la hoja: la primera fila con años (números enteros entre 1900 y 2100) cuya fila
+    siguiente tiene las poblaciones. La búsqueda es vectorizada sobre toda la hoja.
+
+    :param values: Celdas de la hoja (array 2D de objetos).
+    :return: Diccionario {año: población}.
+    """
+
+    numeric = pd.to_numeric(pd.Series(values.ravel()), errors='coerce').to_numpy(dtype=float).reshape(values.shape)
+
+    with np.errstate(invalid='ignore'):
+        is_year = (numeric >= YEAR_RANGE[0]) & (numeric <= YEAR_RANGE[1]) & (numeric == np.floor(numeric))
+    # La fila de debajo de cada año debe ser numérica
+    has_value = np.zeros_like(is_year)
+    has_value[:-1] = ~np.isnan(numeric[1:])
+    header = is_year & has_value
+
+    rows = np.flatnonzero(header.any(axis=1))
+    if len(rows) == 0:
+        return {}
+
+    row = rows[0]
+    cols = np.flatnonzero(header[row])
+    return {int(year): int(population) for year, population in zip(numeric[row, cols], numeric[row + 1, cols])}
+
+
+def parse_workbook(file_path):
+    """
+    Lee un libro del padrón por barrio (primera hoja) y devuelve su 'coddistbar', el nombre del barrio y la
+    serie completa de población por año.
+    """
+
+    df = pd.read_excel(file_path, sheet_name=0, header=None, engine='openpyxl')
+    values = df.to_numpy(dtype=object)
+
+    texts = pd.Series(values[:, 0]).astype(str)
+    titles = texts[texts.str.contains(TITLE_PATTERN)]
+    if titles.empty:
+        raise ValueError(f"No se encuentra el título del barrio en {file_path}")
+
+    return {
+        'coddistbar': coddistbar_from_filename(file_path),
+        'nombre_barrio': extract_barrio_name(titles.iloc[0]).upper(),
+        'series': extract_population_series(values),
+    }
+
+
+def file_digest(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _cache_path(digest, cache_folder):
+    return os.path.join(cache_folder, f"{digest}.json")
+
+
+def _read_cache(digest, cache_folder):
+    try:
+        with open(_cache_path(digest, cache_folder)) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cached.get('parser_version') != PARSER_VERSION:
+        return None
+    cached['series'] = {int(year): population for year, population in cached['series'].items()}
+    return cached
+
+
+def _write_cache(digest, parsed, cache_folder):
+    os.makedirs(cache_folder, exist_ok=True)
+    path = _cache_path(digest, cache_folder)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({**parsed, 'parser_version': PARSER_VERSION}, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def parse_workbooks(folder=WORKBOOKS_FOLDER, cache_folder=CACHE_FOLDER, workers=None):
+    """
+    Lee todos los libros de la carpeta en un pool de procesos. Los resultados se guardan en caché por el hash
+    del fichero, así que en las siguientes ejecuciones solo se leen los libros que han cambiado.
+
+    :return: Lista de diccionarios de 'parse_workbook', en el orden de los ficheros.
+    """
+
+    files = sorted(os.path.join(folder, f) for f in os.listdir(folder) if WORKBOOK_PATTERN.search(f))
+    digests = [file_digest(file_path) for file_path in files]
+
+    results = [_read_cache(digest, cache_folder) for digest in digests]
+    pending = [i for i, result in enumerate(results) if result is None]
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            parsed = executor.map(parse_workbook, [files[i] for i in pending])
+            for i, result in zip(pending, parsed):
+                _write_cache(digests[i], result, cache_folder)
+                results[i] = result
+
+    print(f"{len(files)} libros: {len(files) - len(pending)} desde caché, {len(pending)} leídos")
+    return results
+
+
+def population_frame(parsed, year=None):
+    """
+    :param year: Año a extraer (tabla 'coddistbar', 'nombre_barrio', 'population'); None para todos los años
+                 en formato largo (con la columna 'year').
+    """
+
+    records = [
+        {'coddistbar': item['coddistbar'], 'nombre_barrio': item['nombre_barrio'], 'year': y, 'population': population}
+        for item in parsed for y, population in item['series'].items()
+    ]
+    long_df = pd.DataFrame(records, columns=['coddistbar', 'nombre_barrio', 'year', 'population'])
+    long_df = long_df.sort_values(['coddistbar', 'year'], ignore_index=True)
+
+    if year is None:
+        return long_df
+
+    df = long_df[long_df['year'] == year].drop(columns='year').reset_index(drop=True)
+    missing = sorted({item['coddistbar'] for item in parsed} - set(df['coddistbar']))
+    if missing:
+        raise ValueError(f"Sin población de {year} en los barrios: {missing}")
+    return df
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Población por barrio a partir de los libros del padrón.")
+    parser.add_argument('--folder', default=WORKBOOKS_FOLDER)
+    parser.add_argument('--year', type=int, default=None,
+                        help="Año a cargar en 'population_barr' (por defecto el más reciente).")
+    parser.add_argument('--all-years', action='store_true',
+                        help=f"Serie completa en formato largo, en '{POPULATION_YEARS_TABLE}'.")
+    parser.add_argument('--csv', default=None, help="Guardar en este CSV en lugar de cargar en la base de datos.")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--prune', action='store_true', help="Borrar los barrios que ya no aparecen.")
+    args = parser.parse_args()
+
+    if args.all_years and args.year is not None:
+        parser.error("--year y --all-years son incompatibles")
+
+    t0 = time.perf_counter()
+    parsed = parse_workbooks(args.folder, workers=args.workers)
+
+    if args.all_years:
+        result_df, table, key_columns = population_frame(parsed), POPULATION_YEARS_TABLE, ('coddistbar', 'year')
+    else:
+        year = args.year or max(y for item in parsed for y in item['series'])
+        result_df, table, key_columns = population_frame(parsed, year), POPULATION_TABLE, ('coddistbar',)
+        print(f"Población a 01/01/{year}")
+
+    if args.csv:
+        result_df.to_csv(args.csv, index=False)
+        print(f"{len(result_df)} filas guardadas en {args.csv}")
+    else:
+        import psycopg2
+        from app.utils.dataset import get_database_url
+        from app.utils.insertar_datos_db import ingest_frame
+
+        conn = psycopg2.connect(get_database_url())
+        try:
+            result = ingest_frame(conn, result_df, table, prune=args.prune, key_columns=key_columns)
+        finally:
+            conn.close()
+        print(f"{table}: {result['inserted']} insertadas, {result['updated']} actualizadas, "
+              f"{result['unchanged']} sin cambios, {result['deleted']} borradas")
+
+    print(f"Proceso completado en {time.perf_counter() - t0:.2f} s")
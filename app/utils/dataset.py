@@ -0,0 +1,176 @@
+import os
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Callable, Optional
+from dotenv import load_dotenv
+
+
+def get_database_url():
+    load_dotenv()
+    return (f"postgresql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}:"
+            f"{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}")
+
+
+@lru_cache(maxsize=None)
+def get_engine():
+    # Un único engine (y su pool de conexiones) por proceso, en lugar de uno nuevo en cada carga
+    from sqlalchemy import create_engine
+
+    return create_engine(get_database_url(), pool_size=int(os.getenv("DB_POOL_MAX", 5)), pool_pre_ping=True,
+                         pool_recycle=1800)
+
+
+def fill_missing(gdf):
+    # Texto desconocido -> "Desconocido", numéricos desconocidos -> 0
+    object_columns = gdf.select_dtypes(include=['object']).columns
+    float_columns = gdf.select_dtypes(include=['float64']).columns
+    gdf[object_columns] = gdf[object_columns].fillna("Desconocido")
+    gdf[float_columns] = gdf[float_columns].fillna(0)
+    return gdf
+
+
+def load_acces_gdf_db(engine=None):
+    """
+    Carga la tabla 'barrios_accesibilidad' de PostGIS.
+    """
+
+    import geopandas as gpd
+
+    engine = engine or get_engine()
+    query = "SELECT * FROM barrios_accesibilidad;"
+    return gpd.read_postgis(query, con=engine, geom_col='geometry')
+
+
+def load_live():
+    """
+    Pipeline completo: accesibilidad desde PostGIS y zonas verdes desde opendatasoft.
+
+    Returns:
+    tuple: (acces_gdf, green_gdf).
+    """
+
+    from app.api.green_area import get_green_gdf
+
+    return load_acces_gdf_db(), get_green_gdf()
+
+
+def load_sources(source=None, live_fallback=None):
+    """
+    Carga los datos de la API según DATA_SOURCE ('snapshot' por defecto, o 'live').
+
+    Con 'snapshot', si las instantáneas no existen o no son válidas solo se recurre al pipeline completo cuando
+    LIVE_FALLBACK=1.
+
+    Returns:
+    tuple: (acces_gdf, green_gdf, origen, versión).
+    """
+
+    from app.utils.snapshot import load_snapshot, SnapshotError
+
+    source = source or os.getenv("DATA_SOURCE", "snapshot")
+    if live_fallback is None:
+        live_fallback = os.getenv("LIVE_FALLBACK", "0") == "1"
+
+    if source == 'snapshot':
+        try:
+            acces_gdf, acces_manifest = load_snapshot('acces_gdf')
+            green_gdf, green_manifest = load_snapshot('green_gdf')
+            return acces_gdf, green_gdf, 'snapshot', f"{acces_manifest['version']}-{green_manifest['version']}"
+
+        except (SnapshotError, OSError) as e:
+            if not live_fallback:
+                raise RuntimeError(f"{e}. Genera las instantáneas con 'python -m app.utils.snapshot build' "
+                                   f"o arranca con DATA_SOURCE=live / LIVE_FALLBACK=1.") from e
+            print(f"Instantáneas no disponibles ({e}); cargando el pipeline completo")
+
+    elif source != 'live':
+        raise ValueError(f"DATA_SOURCE desconocido: {source}")
+
+    acces_gdf, green_gdf = load_live()
+    return acces_gdf, green_gdf, 'live', None
+
+
+@dataclass(frozen=True)
+class Dataset:
+    """
+    Versión inmutable de los datos que sirve la API junto con todas sus estructuras derivadas
+    (índices espaciales, respuestas pre-codificadas, cachés).
+    """
+
+    version: str
+    source: str
+    acces_gdf: Any
+    green_gdf: Any
+    derived: dict = field(default_factory=dict)
+    loaded_at: float = field(default_factory=time.time)
+    load_seconds: float = 0.0
+
+    def __getattr__(self, name):
+        # Acceso directo a las estructuras derivadas: dataset.heatmap_index, dataset.green_locator...
+        try:
+            return self.__dict__['derived'][name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+
+class DatasetHolder:
+    """
+    Referencia a la versión actual de los datos. Cada petición toma la versión una sola vez con get().
+    """
+
+    def __init__(self):
+        self._current = None
+
+    def get(self) -> Dataset:
+        current = self._current
+        if current is None:
+            raise RuntimeError("Los datos todavía no están cargados")
+        return current
+
+    def swap(self, dataset: Dataset):
+        self._current = dataset
+
+    @property
+    def loaded(self):
+        return self._current is not None
+
+
+def load_filled_sources(source=None, live_fallback=None):
+    acces_gdf, green_gdf, origin, version = load_sources(source, live_fallback)
+    return fill_missing(acces_gdf), fill_missing(green_gdf), origin, version
+
+
+def load_dataset(build: Callable, source=None, live_fallback=None, refresh=False,
+                 current_version=None) -> Optional[Dataset]:
+    """
+    Carga los datos y construye el Dataset con la función 'build(acces_gdf, green_gdf) -> dict' de la API,
+    midiendo el tiempo total.
+
+    Si SHARED_DATA_DIR está definido, los datos se cargan una sola vez para todos los workers y cada worker
+    se engancha a las tablas Arrow mapeadas en memoria: los atributos se comparten sin copia y solo la
+    geometría se decodifica en cada worker (ver app.utils.shared_data). En una recarga
+    ('refresh') con DATA_SOURCE=live se vuelven a materializar; con instantáneas basta con que cambie su versión.
+
+    Si la versión cargada coincide con 'current_version' (la que ya se sirve) no se construye nada y se
+    devuelve None.
+    """
+
+    t0 = time.perf_counter()
+
+    if os.getenv("SHARED_DATA_DIR"):
+        from app.utils.shared_data import load_shared
+        force = refresh and (source or os.getenv("DATA_SOURCE", "snapshot")) == 'live'
+        acces_gdf, green_gdf, origin, version = load_shared(lambda: load_filled_sources(source, live_fallback),
+                                                            force=force, source=source)
+    else:
+        acces_gdf, green_gdf, origin, version = load_filled_sources(source, live_fallback)
+
+    if current_version is not None and version == current_version:
+        return None
+
+    derived = build(acces_gdf, green_gdf)
+
+    version = version or derived['heatmap_index'].version
+    return Dataset(version=version, source=origin, acces_gdf=acces_gdf, green_gdf=green_gdf, derived=derived,
+                   load_seconds=time.perf_counter() - t0)
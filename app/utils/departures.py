@@ -0,0 +1,340 @@
+import os
+import re
+import time
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+
+from app.utils.gtfs import CACHE_FOLDER, FEEDS, WEEKDAY_COLUMNS, feed_checksum, load_feed
+
+
+# Tipos de día de servicio y días de la semana que abarcan (0 = lunes)
+DAY_TYPES = {'weekday': (0, 1, 2, 3, 4), 'saturday': (5,), 'sunday': (6,)}
+
+# Ventana por defecto para ponderar la accesibilidad (hora punta de mañana) y umbral de parada frecuente
+DEFAULT_WINDOW = 'weekday 07:00-09:00'
+FREQUENT_DEPARTURES_PER_HOUR = 4
+
+# Versión del formato del índice guardado (.npz): cambiarla invalida las copias existentes aunque los zips
+# GTFS sean los mismos (2: viajes activados por su propio 'service_id', ver 'service_departures')
+DEPARTURES_FORMAT_VERSION = 2
+
+# Desplazamiento de parada en las claves ordenadas (parada, segundo): admite horarios de hasta ~12 días
+_KEY_SHIFT = 20
+
+_WINDOW_PATTERN = re.compile(r'^\s*(weekday|saturday|sunday)\s+(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})\s*$')
+
+
+def parse_window(text):
+    """
+    Convierte una ventana como 'weekday 07:00-09:00' en (tipo de día, segundo inicial, segundo final).
+    La hora final puede pasar de 24:00 (servicios nocturnos del mismo día de servicio).
+
+    :raises ValueError: Si el texto no tiene ese formato o la ventana está vacía.
+    """
+
+    match = _WINDOW_PATTERN.match(text)
+    if not match:
+        raise ValueError(f"Ventana no válida: '{text}'. Formato: 'weekday|saturday|sunday HH:MM-HH:MM'")
+
+    day, h0, m0, h1, m1 = match.groups()
+    start, end = int(h0) * 3600 + int(m0) * 60, int(h1) * 3600 + int(m1) * 60
+    if end <= start:
+        raise ValueError(f"Ventana vacía: '{text}'")
+
+    return day, start, end
+
+
+def _to_date(value):
+    value = int(value)
+    return date(value // 10000, value // 100 % 100, value % 100)
+
+
+def active_services(tables, day):
+    """
+    Servicios activos en una fecha: días de la semana de 'calendar' dentro de su vigencia, más las altas
+    (exception_type 1) y menos las bajas (exception_type 2) de 'calendar_dates'.
+    """
+
+    calendar = tables['calendar']
+    stamp = int(day.strftime('%Y%m%d'))
+
+    in_range = (calendar['start_date'] <= stamp) & (calendar['end_date'] >= stamp)
+    running = calendar[WEEKDAY_COLUMNS[day.weekday()]] == 1
+    services = set(calendar.loc[in_range & running, 'service_id'].astype(str))
+
+    exceptions = tables['calendar_dates']
+    exceptions = exceptions[exceptions['date'] == stamp]
+    services |= set(exceptions.loc[exceptions['exception_type'] == 1, 'service_id'].astype(str))
+    services -= set(exceptions.loc[exceptions['exception_type'] == 2, 'service_id'].astype(str))
+
+    return services
+
+
+def representative_date(tables, day_type):
+    """
+    Fecha de referencia de un tipo de día: la que tiene más viajes entre las fechas cubiertas por el feed
+    (la más temprana en caso de empate). Así funciona también con feeds que solo usan 'calendar_dates'.
+    """
+
+    calendar = tables['calendar']
+    candidates = set(tables['calendar_dates']['date'].astype(int))
+    for start, end in zip(calendar['start_date'], calendar['end_date']):
+        first, last = _to_date(start), _to_date(end)
+        candidates.update(int((first + timedelta(days=i)).strftime('%Y%m%d')) for i in range((last - first).days + 1))
+
+    trips_per_service = tables['trips']['service_id'].astype(str).value_counts()
+    best, best_trips = None, 0
+
+    for stamp in sorted(candidates):
+        day = _to_date(stamp)
+        if day.weekday() not in DAY_TYPES[day_type]:
+            continue
+        n_trips = int(trips_per_service.reindex(list(active_services(tables, day))).fillna(0).sum())
+        if n_trips > best_trips:
+            best, best_trips = day, n_trips
+
+    return best
+
+
+def _ragged_arange(counts):
+    # [0..c0-1, 0..c1-1, ...] sin bucles
+    counts = np.asarray(counts, dtype=np.int64)
+    starts = np.cumsum(counts) - counts
+    return np.arange(counts.sum()) - np.repeat(starts, counts)
+
+
+def service_departures(tables, services):
+    """
+    Salidas (código de parada, segundo) de los viajes de los servicios indicados.
+
+    'trip' en 'stop_times' y 'frequencies' es la fila en 'trips' (ver 'load_feed'), así que los arrays por viaje
+    ('active', 'by_frequency') se construyen en el orden de 'trips' y se indexan directamente con él.
+
+    Los viajes con entrada en 'frequencies' se expanden: el horario de 'stop_times' se usa como plantilla
+    (desfases respecto a su primera salida) y se repite cada 'headway_secs' desde 'start_time' hasta
+    'end_time' (excluido).
+    """
+
+    trips = tables['trips']
+    stop_times = tables['stop_times']
+    frequencies = tables['frequencies']
+
+    active = np.append(trips['service_id'].astype(str).isin(services).to_numpy(), False)
+    trip = stop_times['trip'].to_numpy()
+    stop = stop_times['stop'].to_numpy()
+    departure = stop_times['departure'].to_numpy()
+
+    timed = (stop >= 0) & (departure >= 0) & active[trip]     # trip == -1 -> último elemento (False)
+
+    by_frequency = np.zeros(len(trips) + 1, dtype=bool)
+    by_frequency[frequencies['trip'].to_numpy()[frequencies['trip'].to_numpy() >= 0]] = True
+
+    scheduled = timed & ~by_frequency[trip]
+    stops_out = [stop[scheduled]]
+    times_out = [departure[scheduled]]
+
+    template = timed & by_frequency[trip]
+    freq = frequencies[(frequencies['trip'] >= 0) & (frequencies['headway'] > 0)]
+    freq = freq[active[freq['trip'].to_numpy()]]
+
+    if template.any() and len(freq):
+        # Plantillas ordenadas por viaje, con desfases desde la primera salida de cada viaje
+        t_trip, t_stop, t_dep = trip[template], stop[template], departure[template]
+        order = np.argsort(t_trip, kind='stable')
+        t_trip, t_stop, t_dep = t_trip[order], t_stop[order], t_dep[order]
+
+        first = np.full(len(trips), np.iinfo(np.int32).max, dtype=np.int64)
+        np.minimum.at(first, t_trip, t_dep)
+        t_offset = t_dep - first[t_trip]
+
+        template_start = np.searchsorted(t_trip, np.arange(len(trips)), side='left')
+        template_size = np.searchsorted(t_trip, np.arange(len(trips)), side='right') - template_start
+
+        # Salidas de cabecera de cada intervalo de frecuencia
+        f_trip = freq['trip'].to_numpy()
+        f_start, f_end, f_headway = (freq[column].to_numpy().astype(np.int64) for column in ('start', 'end', 'headway'))
+        n_runs = np.maximum(-(-(f_end - f_start) // f_headway), 0)
+        run_trip = np.repeat(f_trip, n_runs)
+        run_start = np.repeat(f_start, n_runs) + _ragged_arange(n_runs) * np.repeat(f_headway, n_runs)
+
+        # Cada cabecera reproduce todas las paradas de la plantilla de su viaje
+        sizes = template_size[run_trip]
+        rows = np.repeat(template_start[run_trip], sizes) + _ragged_arange(sizes)
+        stops_out.append(t_stop[rows])
+        times_out.append((np.repeat(run_start, sizes) + t_offset[rows]).astype(np.int32))
+
+    return np.concatenate(stops_out).astype(np.int64), np.concatenate(times_out).astype(np.int32)
+
+
+class DeparturesIndex:
+    """
+    Salidas de todas las paradas (EMT + Metro) por tipo de día, precalculadas.
+
+    Para cada tipo de día se guardan los segundos de salida en un array int32 ordenado por (parada, hora) y los
+    desplazamientos de cada parada, de modo que las salidas de una parada son un trozo contiguo y el número de
+    salidas de todas las paradas en una ventana se obtiene con dos 'searchsorted'.
+    """
+
+    def __init__(self, networks, stop_ids, days, dates=None):
+        """
+        :param networks: Red de cada parada ('EMT', 'MetroValencia').
+        :param stop_ids: 'stop_id' de cada parada (texto).
+        :param days: Diccionario {tipo de día: (offsets int64, times int32)}.
+        :param dates: Fecha de referencia usada para cada tipo de día.
+        """
+
+        self.networks = np.asarray(networks, dtype=object)
+        self.stop_ids = np.asarray(stop_ids, dtype=object)
+        self.days = days
+        self.dates = dates or {}
+
+        self._positions = {key: i for i, key in enumerate(zip(self.networks, self.stop_ids))}
+        self._keys = {}
+        for day, (offsets, times) in days.items():
+            stops = np.repeat(np.arange(len(self.stop_ids), dtype=np.int64), np.diff(offsets))
+            self._keys[day] = (stops << _KEY_SHIFT) + times
+
+    def __len__(self):
+        return len(self.stop_ids)
+
+    @classmethod
+    def from_feeds(cls, feeds=tuple(FEEDS)):
+        networks, stop_ids = [], []
+        stop_codes = {day: [] for day in DAY_TYPES}
+        times = {day: [] for day in DAY_TYPES}
+        dates = {day: {} for day in DAY_TYPES}
+        base = 0
+
+        for feed in feeds:
+            tables = load_feed(feed)
+            categories = np.asarray(tables['stops']['stop_id'].cat.categories, dtype=object).astype(str)
+            networks.extend([FEEDS[feed][2]] * len(categories))
+            stop_ids.extend(categories)
+
+            for day_type in DAY_TYPES:
+                reference = representative_date(tables, day_type)
+                dates[day_type][feed] = reference.isoformat() if reference else None
+                if reference is None:
+                    continue
+                stops, seconds = service_departures(tables, active_services(tables, reference))
+                stop_codes[day_type].append(stops + base)
+                times[day_type].append(seconds)
+
+            base += len(categories)
+
+        days = {}
+        for day_type in DAY_TYPES:
+            stops = np.concatenate(stop_codes[day_type]) if stop_codes[day_type] else np.empty(0, np.int64)
+            seconds = np.concatenate(times[day_type]) if times[day_type] else np.empty(0, np.int32)
+            order = np.lexsort((seconds, stops))
+            offsets = np.zeros(base + 1, dtype=np.int64)
+            np.cumsum(np.bincount(stops, minlength=base), out=offsets[1:])
+            days[day_type] = (offsets, seconds[order].astype(np.int32))
+
+        return cls(networks, stop_ids, days, dates)
+
+    def save(self, path):
+        arrays = {'networks': self.networks.astype(str), 'stop_ids': self.stop_ids.astype(str)}
+        for day, (offsets, times) in self.days.items():
+            arrays[f"{day}_offsets"], arrays[f"{day}_times"] = offsets, times
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, dates=np.array(repr(self.dates)), **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        import ast
+
+        with np.load(path) as data:
+            days = {day: (data[f"{day}_offsets"], data[f"{day}_times"]) for day in DAY_TYPES}
+            return cls(data['networks'], data['stop_ids'], days, ast.literal_eval(str(data['dates'])))
+
+    def positions(self, networks, stop_ids):
+        # Posición de cada (red, stop_id) en el índice; -1 si la parada no tiene servicio en los feeds
+        return np.fromiter((self._positions.get((network, str(stop_id)), -1)
+                            for network, stop_id in zip(networks, stop_ids)), dtype=np.int64, count=len(stop_ids))
+
+    def departures(self, position, day, start=0, end=None):
+        """
+        Segundos de salida (ordenados) de una parada en una ventana [start, end).
+        """
+
+        offsets, times = self.days[day]
+        segment = times[offsets[position]:offsets[position + 1]]
+        if end is None:
+            return segment[np.searchsorted(segment, start):]
+        return segment[np.searchsorted(segment, start):np.searchsorted(segment, end)]
+
+    def counts(self, day, start, end):
+        """
+        Número de salidas de cada parada en la ventana [start, end), para todas las paradas a la vez.
+        """
+
+        keys = self._keys[day]
+        base = np.arange(len(self.stop_ids), dtype=np.int64) << _KEY_SHIFT
+        return np.searchsorted(keys, base + end) - np.searchsorted(keys, base + start)
+
+    def departures_per_hour(self, day, start, end):
+        return self.counts(day, start, end) * 3600 / (end - start)
+
+    def attach(self, gdf_stops, window=DEFAULT_WINDOW, min_departures_per_hour=FREQUENT_DEPARTURES_PER_HOUR):
+        """
+        Añade a las paradas (con columnas 'type' y 'stop_id') las salidas por hora en la ventana y si la parada
+        es frecuente (al menos 'min_departures_per_hour').
+        """
+
+        day, start, end = parse_window(window)
+        per_hour = np.append(self.departures_per_hour(day, start, end), 0.0)
+
+        gdf_stops = gdf_stops.copy()
+        gdf_stops['departures_per_hour'] = per_hour[self.positions(gdf_stops['type'], gdf_stops['stop_id'])]
+        gdf_stops['frequent'] = gdf_stops['departures_per_hour'] >= min_departures_per_hour
+
+        return gdf_stops
+
+
+def load_departures_index(feeds=tuple(FEEDS), use_cache=True):
+    """
+    DeparturesIndex de los feeds, guardado en la caché GTFS y reconstruido solo si cambia algún zip o el formato
+    del índice.
+    """
+
+    key = f"v{DEPARTURES_FORMAT_VERSION}-" + '-'.join(f"{feed}{feed_checksum(feed)[:8]}" for feed in feeds)
+    path = os.path.join(CACHE_FOLDER, f"departures-{key}.npz")
+
+    if use_cache and os.path.exists(path):
+        return DeparturesIndex.load(path)
+
+    t0 = time.perf_counter()
+    index = DeparturesIndex.from_feeds(feeds)
+    print(f"Índice de salidas construido en {time.perf_counter() - t0:.2f} s ({len(index)} paradas, "
+          f"fechas de referencia {index.dates})")
+
+    if use_cache:
+        os.makedirs(CACHE_FOLDER, exist_ok=True)
+        for entry in os.listdir(CACHE_FOLDER):
+            if entry.startswith('departures-') and entry.endswith('.npz'):
+                os.remove(os.path.join(CACHE_FOLDER, entry))
+        index.save(path)
+
+    return index
+
+
+if __name__ == '__main__':
+
+    # Ejemplo: python -m app.utils.departures "weekday 07:00-09:00"
+    import sys
+
+    window = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_WINDOW
+    index = load_departures_index()
+    day, start, end = parse_window(window)
+
+    t0 = time.perf_counter()
+    per_hour = index.departures_per_hour(day, start, end)
+    elapsed = time.perf_counter() - t0
+
+    served = per_hour > 0
+    print(f"{window}: {int(served.sum())} paradas con servicio, mediana {np.median(per_hour[served]):.1f} salidas/h "
+          f"({elapsed * 1e6:.0f} µs para {len(index)} paradas)")
+    print(pd.Series(per_hour, index=index.stop_ids).sort_values(ascending=False).head(10))
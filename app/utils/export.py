@@ -0,0 +1,188 @@
+import json
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+import orjson
+import shapely
+
+
+# Formatos de exportación: tipo MIME y extensión de fichero
+EXPORT_FORMATS = {
+    'geojson': ('application/geo+json', 'geojson'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+    'fgb': ('application/flatgeobuf', 'fgb'),
+}
+
+DEFAULT_CHUNK_ROWS = 1000
+
+
+def _is_null(value):
+    return value is None or (isinstance(value, float) and value != value)
+
+
+def _sanitize(gdf):
+    # Las columnas 'object' con valores no textuales (puntos, diccionarios...) se guardan como texto
+    df = pd.DataFrame(gdf.drop(columns=gdf.geometry.name))
+
+    for column in df.select_dtypes(include=['object']).columns:
+        values = df[column]
+        if values.map(lambda v: _is_null(v) or isinstance(v, str)).all():
+            continue
+        df[column] = values.map(lambda v: None if _is_null(v) else
+                                v.wkt if isinstance(v, shapely.Geometry) else
+                                json.dumps(v) if isinstance(v, (dict, list)) else str(v))
+
+    return df
+
+
+def _plain_gdf(gdf):
+    import geopandas as gpd
+
+    return gpd.GeoDataFrame(_sanitize(gdf), geometry=gdf.geometry.values, crs=gdf.crs)
+
+
+def geo_metadata(gdf):
+    """
+    Metadatos 'geo' de GeoParquet 1.0 (también se añaden al esquema Arrow).
+    """
+
+    geometry_types = sorted(set(gdf.geometry.geom_type.dropna()))
+    column = {'encoding': 'WKB', 'geometry_types': geometry_types}
+
+    if gdf.crs is not None:
+        column['crs'] = gdf.crs.to_json_dict()
+    if len(gdf) > 0:
+        column['bbox'] = [float(v) for v in gdf.total_bounds]
+
+    return {'version': '1.0.0', 'primary_column': 'geometry', 'columns': {'geometry': column}}
+
+
+def to_arrow_table(gdf):
+    """
+    Convierte el GeoDataFrame en una tabla Arrow con la geometría como WKB en la columna 'geometry'.
+    """
+
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(_sanitize(gdf), preserve_index=False)
+    table = table.append_column('geometry', pa.array(shapely.to_wkb(np.asarray(gdf.geometry.values)), pa.binary()))
+
+    metadata = dict(table.schema.metadata or {})
+    metadata[b'geo'] = json.dumps(geo_metadata(gdf)).encode()
+
+    return table.replace_schema_metadata(metadata)
+
+
+class _ChunkSink:
+    # Fichero de solo escritura que acumula lo escrito para poder ir entregándolo por trozos
+    def __init__(self):
+        self._chunks = []
+        self.closed = False
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _iter_geojson(gdf, chunk_rows):
+    gdf = _plain_gdf(gdf)
+    yield b'{"type":"FeatureCollection","features":['
+
+    for start in range(0, len(gdf), chunk_rows):
+        features = gdf.iloc[start:start + chunk_rows].__geo_interface__['features']
+        chunk = b','.join(orjson.dumps(feature, option=orjson.OPT_SERIALIZE_NUMPY) for feature in features)
+        yield (b',' if start > 0 else b'') + chunk
+
+    yield b']}'
+
+
+def _iter_arrow(gdf, chunk_rows):
+    import pyarrow as pa
+
+    table = to_arrow_table(gdf)
+    sink = _ChunkSink()
+
+    with pa.ipc.new_stream(pa.PythonFile(sink, mode='w'), table.schema) as writer:
+        for batch in table.to_batches(max_chunksize=chunk_rows):
+            writer.write_batch(batch)
+            yield sink.drain()
+
+    yield sink.drain()
+
+
+def _iter_parquet(gdf, chunk_rows):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = to_arrow_table(gdf)
+    sink = _ChunkSink()
+
+    with pq.ParquetWriter(pa.PythonFile(sink, mode='w'), table.schema, compression='zstd') as writer:
+        for start in range(0, max(len(table), 1), chunk_rows):
+            writer.write_table(table.slice(start, chunk_rows))
+            yield sink.drain()
+
+    yield sink.drain()
+
+
+def _iter_flatgeobuf(gdf, chunk_rows):
+    # El driver de FlatGeobuf necesita un fichero en disco; se escribe y se entrega por bloques
+    out = _plain_gdf(gdf)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'export.fgb')
+        out.to_file(path, driver='FlatGeobuf')
+
+        with open(path, 'rb') as f:
+            while chunk := f.read(1 << 16):
+                yield chunk
+
+
+_WRITERS = {'geojson': _iter_geojson, 'parquet': _iter_parquet, 'arrow': _iter_arrow, 'fgb': _iter_flatgeobuf}
+
+
+def iter_export(gdf, fmt, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Serializa el GeoDataFrame en el formato pedido, devolviendo los bytes por trozos a medida que se producen.
+
+    :param fmt: 'geojson', 'parquet' (GeoParquet), 'arrow' (Arrow IPC stream) o 'fgb' (FlatGeobuf).
+    :raises ValueError: Si el formato no está soportado (antes de empezar a generar).
+    """
+
+    if fmt not in _WRITERS:
+        raise ValueError(f"Formato no soportado: {fmt}. Opciones: {', '.join(_WRITERS)}")
+
+    return (chunk for chunk in _WRITERS[fmt](gdf, chunk_rows) if chunk)
+
+
+def write_gdf(gdf, path, fmt='geojson'):
+    """
+    Escribe el GeoDataFrame en disco en cualquiera de los formatos de exportación.
+    El GeoJSON se sigue escribiendo con el driver de GDAL, como hasta ahora.
+    """
+
+    if fmt == 'geojson':
+        gdf.to_file(path, driver="GeoJSON")
+        return
+
+    with open(path, 'wb') as f:
+        for chunk in iter_export(gdf, fmt):
+            f.write(chunk)
+
+
+def output_path(base_path, fmt):
+    # Cambia la extensión de la ruta según el formato
+    return f"{os.path.splitext(base_path)[0]}.{EXPORT_FORMATS[fmt][1]}"
@@ -0,0 +1,263 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import orjson
+
+
+# Tablas de barrios consultables en vivo (capa -> tabla)
+BARRIO_TABLES = {
+    'acces': 'barrios_accesibilidad',
+    'verde': 'barrios_zonas_verdes',
+}
+
+# SQL fijo por tabla: asyncpg prepara cada sentencia una vez por conexión y la reutiliza (caché de sentencias)
+BY_POINT_SQL = ("SELECT * FROM {table} WHERE ST_Contains(geometry, ST_SetSRID(ST_MakePoint($1, $2), 4326)) "
+                "LIMIT 1")
+BY_ID_SQL = "SELECT * FROM {table} WHERE coddistbar = $1 LIMIT 1"
+
+# Tipos de PostgreSQL a los que se aplican las reglas de 'fill_missing' (texto -> "Desconocido", números -> 0)
+TEXT_TYPES = {'text', 'varchar', 'bpchar', 'name'}
+NUMERIC_TYPES = {'int2', 'int4', 'int8', 'float4', 'float8', 'numeric'}
+
+
+class LayerUnavailable(LookupError):
+    # La tabla de la capa no existe (todavía) en la base de datos: la API responde 503
+    pass
+
+
+def index_statements(table, spatial=True, key_columns=('coddistbar',)):
+    """
+    Índices que necesitan las consultas en vivo y la carga incremental: GiST sobre la geometría (ST_Contains)
+    y btree único sobre la clave, 'coddistbar' por defecto (barrio por id y ON CONFLICT).
+    """
+
+    key_name = '_'.join(key_columns)
+    statements = [f"CREATE UNIQUE INDEX IF NOT EXISTS {table}_{key_name}_key ON {table} ({', '.join(key_columns)})"]
+    if spatial:
+        statements.append(f"CREATE INDEX IF NOT EXISTS {table}_geometry_gist ON {table} USING GIST (geometry)")
+    return statements
+
+
+def _fill_defaults(attributes):
+    # Valor por defecto de cada columna según su tipo, como hace 'fill_missing' con los datos en memoria
+    defaults = {}
+    for attribute in attributes:
+        if attribute.type.name in TEXT_TYPES:
+            defaults[attribute.name] = "Desconocido"
+        elif attribute.type.name in NUMERIC_TYPES:
+            defaults[attribute.name] = 0
+    return defaults
+
+
+def _row_to_dict(row, defaults):
+    # Los NULL de SQL se sustituyen para que la respuesta pase la validación del modelo igual que en memoria
+    record = dict(row)
+    record.pop('geometry', None)
+    for name, default in defaults.items():
+        if record.get(name) is None:
+            record[name] = default
+    return record
+
+
+class PostgisBarrioStore:
+    """
+    Acceso asíncrono a las tablas de barrios en PostGIS con un pool de conexiones asyncpg, creado una sola vez
+    en el 'lifespan' de la API.
+
+    Una tabla que falte no impide arrancar: sus consultas lanzan LayerUnavailable (503) y se vuelve a comprobar
+    en cada petición, así que basta con cargarla (app.utils.insertar_datos_db) para que empiece a responder.
+    """
+
+    backend = 'postgis'
+
+    def __init__(self, pool):
+        self.pool = pool
+        # capa -> valores por defecto de sus columnas, solo para las tablas ya comprobadas
+        self._defaults = {}
+
+    @classmethod
+    async def open(cls, dsn=None, min_size=None, max_size=None):
+        import asyncpg
+        from app.utils.dataset import get_database_url
+
+        pool = await asyncpg.create_pool(
+            dsn or get_database_url(),
+            min_size=int(min_size or os.getenv("DB_POOL_MIN", 2)),
+            max_size=int(max_size or os.getenv("DB_POOL_MAX", 10)),
+            command_timeout=float(os.getenv("DB_COMMAND_TIMEOUT", 10)),
+        )
+        store = cls(pool)
+
+        # Comprueba las tablas al arrancar (y prepara sus sentencias); las que falten solo se avisan
+        for capa in BARRIO_TABLES:
+            try:
+                await store._layer(capa)
+            except LayerUnavailable as e:
+                print(f"{e}: las consultas en vivo de la capa '{capa}' responderán 503")
+
+        return store
+
+    async def _layer(self, capa):
+        defaults = self._defaults.get(capa)
+        if defaults is None:
+            table = BARRIO_TABLES[capa]
+            async with self.pool.acquire() as conn:
+                if await conn.fetchval("SELECT to_regclass($1::text)", table) is None:
+                    raise LayerUnavailable(f"No existe la tabla '{table}'")
+                await conn.prepare(BY_POINT_SQL.format(table=table))
+                statement = await conn.prepare(BY_ID_SQL.format(table=table))
+            defaults = self._defaults[capa] = _fill_defaults(statement.get_attributes())
+        return defaults
+
+    async def _fetch_barrio(self, capa, sql, *args):
+        import asyncpg
+
+        defaults = await self._layer(capa)
+        try:
+            async with self.pool.acquire() as conn:
+                row = await conn.fetchrow(sql.format(table=BARRIO_TABLES[capa]), *args)
+        except asyncpg.UndefinedTableError as e:
+            # La tabla se ha borrado después de comprobarla
+            self._defaults.pop(capa, None)
+            raise LayerUnavailable(f"No existe la tabla '{BARRIO_TABLES[capa]}'") from e
+        return None if row is None else _row_to_dict(row, defaults)
+
+    async def ensure_indexes(self):
+        async with self.pool.acquire() as conn:
+            for table in BARRIO_TABLES.values():
+                if await conn.fetchval("SELECT to_regclass($1::text)", table) is None:
+                    continue
+                for statement in index_statements(table):
+                    await conn.execute(statement)
+
+    async def barrio_by_point(self, capa, lon, lat):
+        return await self._fetch_barrio(capa, BY_POINT_SQL, lon, lat)
+
+    async def barrio_by_id(self, capa, coddistbar):
+        return await self._fetch_barrio(capa, BY_ID_SQL, coddistbar)
+
+    async def close(self):
+        await self.pool.close()
+
+
+def build_sqlite_db(path, tables):
+    """
+    Crea la base SQLite que sustituye a PostGIS en pruebas y benchmarks.
+
+    Cada tabla guarda los atributos como JSON y la geometría como WKB, con un índice R*Tree de cajas envolventes
+    ('{tabla}_rtree') que hace el papel del índice GiST.
+
+    :param tables: Diccionario {capa: GeoDataFrame} con las capas de BARRIO_TABLES.
+    """
+
+    import numpy as np
+    import shapely
+
+    if os.path.exists(path):
+        os.remove(path)
+
+    conn = sqlite3.connect(path)
+    with conn:
+        for capa, gdf in tables.items():
+            table = BARRIO_TABLES[capa]
+            conn.execute(f"CREATE TABLE {table} (id INTEGER PRIMARY KEY, coddistbar INTEGER, attributes TEXT, "
+                         f"geometry BLOB)")
+            conn.execute(f"CREATE INDEX {table}_coddistbar_idx ON {table} (coddistbar)")
+            conn.execute(f"CREATE VIRTUAL TABLE {table}_rtree USING rtree(id, minx, maxx, miny, maxy)")
+
+            geoms = np.asarray(gdf.geometry.values)
+            bounds = shapely.bounds(geoms)
+            wkb = shapely.to_wkb(geoms)
+            attributes = gdf.drop(columns=gdf.geometry.name)
+
+            for i, record in enumerate(attributes.to_dict(orient='records')):
+                conn.execute(f"INSERT INTO {table} VALUES (?, ?, ?, ?)",
+                             (i, int(record['coddistbar']), orjson.dumps(record, default=str,
+                                                                         option=orjson.OPT_SERIALIZE_NUMPY), wkb[i]))
+                minx, miny, maxx, maxy = bounds[i]
+                conn.execute(f"INSERT INTO {table}_rtree VALUES (?, ?, ?, ?, ?)", (i, minx, maxx, miny, maxy))
+    conn.close()
+
+
+class SqliteBarrioStore:
+    """
+    Sustituto local de PostGIS con la misma interfaz asíncrona: candidatos por el R*Tree y comprobación exacta
+    con shapely. Las consultas (bloqueantes) se ejecutan en el pool de hilos, con una conexión por hilo.
+    """
+
+    backend = 'sqlite'
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    @classmethod
+    async def open(cls, path=None):
+        path = path or os.getenv("SQLITE_DB_PATH")
+        if not path or not os.path.exists(path):
+            raise FileNotFoundError(f"No existe la base SQLite de barrios: {path}")
+        return cls(path)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        return conn
+
+    def _execute(self, capa, sql, parameters):
+        try:
+            return self._conn().execute(sql, parameters)
+        except sqlite3.OperationalError as e:
+            if 'no such table' in str(e):
+                raise LayerUnavailable(f"No existe la tabla '{BARRIO_TABLES[capa]}'") from e
+            raise
+
+    def _by_point(self, capa, lon, lat):
+        import shapely
+
+        table = BARRIO_TABLES[capa]
+        candidates = self._execute(
+            capa, f"SELECT t.attributes, t.geometry FROM {table}_rtree r JOIN {table} t ON t.id = r.id "
+                  f"WHERE r.minx <= ? AND r.maxx >= ? AND r.miny <= ? AND r.maxy >= ? ORDER BY t.id",
+            (lon, lon, lat, lat))
+
+        point = shapely.Point(lon, lat)
+        for attributes, wkb in candidates:
+            if shapely.from_wkb(wkb).contains(point):
+                return orjson.loads(attributes)
+        return None
+
+    def _by_id(self, capa, coddistbar):
+        row = self._execute(capa, f"SELECT attributes FROM {BARRIO_TABLES[capa]} WHERE coddistbar = ? "
+                                  f"ORDER BY id LIMIT 1", (coddistbar,)).fetchone()
+        return None if row is None else orjson.loads(row[0])
+
+    async def ensure_indexes(self):
+        pass
+
+    async def barrio_by_point(self, capa, lon, lat):
+        return await asyncio.to_thread(self._by_point, capa, lon, lat)
+
+    async def barrio_by_id(self, capa, coddistbar):
+        return await asyncio.to_thread(self._by_id, capa, coddistbar)
+
+    async def close(self):
+        pass
+
+
+async def open_barrio_store(backend=None):
+    """
+    Abre el acceso en vivo según DB_BACKEND: 'postgis', 'sqlite' (SQLITE_DB_PATH) o vacío (desactivado).
+    """
+
+    backend = backend if backend is not None else os.getenv("DB_BACKEND", "")
+
+    if not backend:
+        return None
+    if backend == 'postgis':
+        return await PostgisBarrioStore.open()
+    if backend == 'sqlite':
+        return await SqliteBarrioStore.open()
+
+    raise ValueError(f"DB_BACKEND desconocido: {backend}")
@@ -0,0 +1,158 @@
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+import shapely
+
+from app.utils.walk_graph import PROJECTED_CRS
+
+
+def _fix_invalid(geoms):
+    # Mismo arreglo que aplica gpd.overlay (make_valid=True) a los polígonos no válidos
+    geoms = geoms.copy()
+    invalid = ~shapely.is_valid(geoms)
+    if invalid.any():
+        geoms[invalid] = shapely.buffer(geoms[invalid], 0)
+    return geoms
+
+
+def _geometry_keys(gdf):
+    # Huella de cada geometría en su CRS de origen (el mismo parque con la misma geometría da la misma clave)
+    crs = str(gdf.crs).encode()
+    return [hashlib.blake2b(crs + wkb, digest_size=16).digest() for wkb in shapely.to_wkb(gdf.geometry.values)]
+
+
+def barrios_digest(admin_barr) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(admin_barr.crs).encode())
+    digest.update(np.asarray(admin_barr['coddistbar'], dtype=np.int64).tobytes())
+    for wkb in shapely.to_wkb(admin_barr.geometry.values):
+        digest.update(wkb)
+    return digest.hexdigest()
+
+
+class GreenAreaEngine:
+    """
+    Área verde por barrio sin 'gpd.overlay': los parques se emparejan con los barrios mediante un STRtree y solo
+    se calcula el área de cada intersección, de forma vectorizada. Si el barrio contiene al parque entero, el
+    área es la del propio parque y la intersección no se calcula.
+
+    El resultado de cada parque (barrios que toca y área en cada uno) se guarda por la huella de su geometría,
+    así que al cambiar el conjunto de espacios verdes solo se calculan los parques nuevos o modificados (y con
+    ellos, solo los barrios afectados). El motor está ligado a una geometría de barrios concreta.
+    """
+
+    def __init__(self, admin_barr):
+
+        self.digest = barrios_digest(admin_barr)
+        self.codes = admin_barr['coddistbar'].to_numpy()
+
+        barrios = admin_barr.to_crs(PROJECTED_CRS)
+        self.barrio_area = barrios.geometry.area.to_numpy()
+        self._geoms = _fix_invalid(np.asarray(barrios.geometry.values, dtype=object))
+        shapely.prepare(self._geoms)
+        self._tree = shapely.STRtree(self._geoms)
+
+        self._cache = {}
+        self._lock = threading.Lock()
+        self.last_computed = 0
+
+    def __len__(self):
+        return len(self.codes)
+
+    def _compute(self, gdf_green):
+        # Pares (parque, barrio) con intersección de área positiva, para un lote de parques
+        geoms = np.asarray(gdf_green.to_crs(PROJECTED_CRS).geometry.values, dtype=object)
+        geoms = _fix_invalid(geoms)
+
+        idx_park, idx_barr = self._tree.query(geoms, predicate='intersects')
+        areas = np.empty(len(idx_park), dtype=np.float64)
+
+        # Camino rápido: el barrio (preparado) cubre el parque entero
+        covered = shapely.covers(self._geoms[idx_barr], geoms[idx_park])
+        areas[covered] = shapely.area(geoms[idx_park[covered]])
+        rest = ~covered
+        areas[rest] = shapely.area(shapely.intersection(geoms[idx_park[rest]], self._geoms[idx_barr[rest]]))
+
+        # Como en el overlay, las intersecciones que solo son líneas o puntos no cuentan
+        keep = areas > 0
+        idx_park, idx_barr, areas = idx_park[keep], idx_barr[keep], areas[keep]
+
+        order = np.argsort(idx_park, kind='stable')
+        idx_park, idx_barr, areas = idx_park[order], idx_barr[order], areas[order]
+        bounds = np.searchsorted(idx_park, np.arange(len(geoms) + 1))
+
+        return [(idx_barr[start:end], areas[start:end]) for start, end in zip(bounds[:-1], bounds[1:])]
+
+    def barrio_green_area(self, gdf_green) -> np.ndarray:
+        """
+        Área verde (m2, EPSG:25830) en cada barrio, en el orden de 'admin_barr'; NaN si ningún parque lo toca.
+        Los parques solapados suman cada uno su parte, igual que con el overlay.
+        """
+
+        gdf_green = gdf_green[~gdf_green.geometry.isna() & ~gdf_green.geometry.is_empty]
+        keys = _geometry_keys(gdf_green)
+
+        with self._lock:
+            new = {}
+            for position, key in enumerate(keys):
+                if key not in self._cache:
+                    new.setdefault(key, position)
+
+            if new:
+                results = self._compute(gdf_green.iloc[list(new.values())])
+                self._cache.update(zip(new, results))
+            self.last_computed = len(new)
+
+            # Se olvidan los parques que ya no están en el conjunto
+            current = set(keys)
+            for key in [key for key in self._cache if key not in current]:
+                del self._cache[key]
+
+            pairs = [self._cache[key] for key in keys]
+
+        if pairs:
+            positions = np.concatenate([barrios for barrios, _ in pairs])
+            areas = np.concatenate([values for _, values in pairs])
+        else:
+            positions, areas = np.empty(0, dtype=np.int64), np.empty(0)
+
+        total = np.bincount(positions, weights=areas, minlength=len(self.codes))
+        touched = np.bincount(positions, minlength=len(self.codes)) > 0
+
+        return np.where(touched, total, np.nan)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_green_area_engine(admin_barr) -> GreenAreaEngine:
+    """
+    Motor compartido entre ejecuciones; se reconstruye solo si cambian los barrios.
+    """
+
+    global _engine
+
+    digest = barrios_digest(admin_barr)
+    with _engine_lock:
+        if _engine is None or _engine.digest != digest:
+            _engine = GreenAreaEngine(admin_barr)
+        return _engine
+
+
+def green_area_by_barrio(admin_barr, gdf_green) -> pd.DataFrame:
+    """
+    Área de cada barrio y área verde agregada por 'coddistbar' (como la suma del overlay agrupada por código).
+
+    :return: DataFrame alineado con 'admin_barr' con 'barr_area_imputed' y 'green_area_m2'.
+    """
+
+    engine = get_green_area_engine(admin_barr)
+    per_barrio = pd.Series(engine.barrio_green_area(gdf_green), index=engine.codes)
+    by_code = per_barrio.groupby(level=0).sum(min_count=1)
+
+    return pd.DataFrame({
+        'barr_area_imputed': engine.barrio_area,
+        'green_area_m2': by_code.reindex(engine.codes).to_numpy(),
+    }, index=admin_barr.index)
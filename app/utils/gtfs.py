@@ -0,0 +1,250 @@
+import hashlib
+import os
+import shutil
+import time
+import numpy as np
+import pandas as pd
+
+
+DATA_FOLDER = os.path.join(os.path.dirname(__file__), 'data')
+CACHE_FOLDER = os.path.join(DATA_FOLDER, 'gtfs_cache')
+
+# Feeds de Valencia: carpeta extraída, zip descargado (ver 'download_GTFS') y nombre de la red
+FEEDS = {
+    'emt': ('emt', 'mdb-795.zip', 'EMT'),
+    'metro': ('metro', 'mdb-1054.zip', 'MetroValencia'),
+}
+
+# Tipos de ruta GTFS (básicos y extendidos) agrupados por modo
+ROUTE_TYPE_NAMES = {0: 'Tram',
+                    1: 'Subway',
+                    2: 'Railway',
+                    3: 'Bus',
+                    4: 'Ferry',
+                    11: 'Trolleybus',
+                    100: 'Railway',
+                    109: 'Railway',
+                    400: 'Railway',
+                    401: 'Subway',
+                    700: 'Bus',
+                    717: 'Bus',
+                    900: 'Tram',
+                    1000: 'Ferry', }
+
+WEEKDAY_COLUMNS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+
+STOP_TIMES_CHUNK_ROWS = 1_000_000
+
+# Versión del formato de la caché: cambiarla invalida las copias Parquet existentes
+# (3: 'trip' pasa a ser la fila en 'trips' y no el código de la categoría ordenada)
+CACHE_FORMAT_VERSION = 3
+
+
+def gtfs_time_to_seconds(values):
+    """
+    Convierte horas GTFS 'H:MM:SS' (pueden pasar de 24:00:00) a segundos desde el inicio del día de servicio.
+    Los valores vacíos se devuelven como -1.
+    """
+
+    parts = pd.Series(values, dtype='string').str.strip().str.split(':', expand=True)
+    if parts.shape[1] < 3:
+        return np.full(len(values), -1, dtype=np.int32)
+
+    numbers = parts.iloc[:, :3].apply(pd.to_numeric, errors='coerce')
+    seconds = numbers[0] * 3600 + numbers[1] * 60 + numbers[2]
+    return seconds.fillna(-1).to_numpy(dtype=np.int32)
+
+
+def feed_checksum(feed):
+    """
+    Huella del feed: sha256 del zip descargado o, si no está, de tamaño y fecha de los ficheros extraídos.
+    """
+
+    folder, zip_filename, _ = FEEDS[feed]
+    zip_path = os.path.join(DATA_FOLDER, zip_filename)
+    digest = hashlib.sha256(f"v{CACHE_FORMAT_VERSION}".encode())
+
+    if os.path.exists(zip_path):
+        with open(zip_path, 'rb') as f:
+            while chunk := f.read(1 << 20):
+                digest.update(chunk)
+    else:
+        feed_dir = os.path.join(DATA_FOLDER, folder)
+        for name in sorted(os.listdir(feed_dir)):
+            stat = os.stat(os.path.join(feed_dir, name))
+            digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+
+    return digest.hexdigest()[:16]
+
+
+def _read(feed_dir, name, columns, dtype, **kwargs):
+    # Solo las columnas necesarias; las que falten en el feed se ignoran
+    path = os.path.join(feed_dir, f"{name}.txt")
+    header = pd.read_csv(path, nrows=0, skipinitialspace=True).columns
+    usecols = [column for column in columns if column in header]
+
+    return pd.read_csv(path, usecols=usecols, dtype={c: dtype[c] for c in usecols if c in dtype},
+                       skipinitialspace=True, **kwargs)
+
+
+def _read_optional(feed_dir, name, columns, dtype):
+    if not os.path.exists(os.path.join(feed_dir, f"{name}.txt")):
+        return pd.DataFrame({column: pd.Series(dtype=dtype[column]) for column in columns})
+    return _read(feed_dir, name, columns, dtype)
+
+
+def _parse_feed(feed):
+    """
+    Lee el feed con tipos compactos. Los identificadores se guardan como categorías y 'stop_times' como códigos
+    int32 (viaje, parada) y segundos de salida, leyendo el fichero por bloques para acotar la memoria.
+
+    El código de viaje es la fila en 'trips' (en el orden de trips.txt), no el código de la categoría 'trip_id',
+    que sigue el orden alfabético: así se puede indexar directamente cualquier array alineado con 'trips'.
+    """
+
+    feed_dir = os.path.join(DATA_FOLDER, FEEDS[feed][0])
+
+    stops = _read(feed_dir, 'stops', ['stop_id', 'stop_name', 'stop_lat', 'stop_lon'],
+                  {'stop_id': 'string', 'stop_name': 'string', 'stop_lat': 'float64', 'stop_lon': 'float64'})
+    stops['stop_id'] = stops['stop_id'].astype('category')
+
+    routes = _read(feed_dir, 'routes', ['route_id', 'route_type'], {'route_id': 'category', 'route_type': 'int32'})
+
+    trips = _read(feed_dir, 'trips', ['route_id', 'service_id', 'trip_id'],
+                  {'route_id': 'category', 'service_id': 'category', 'trip_id': 'string'})
+    trips = trips.drop_duplicates('trip_id').reset_index(drop=True)
+    trips['trip_id'] = trips['trip_id'].astype('category')
+
+    trip_rows = pd.Index(trips['trip_id'].astype(object))
+    stop_categories = stops['stop_id'].cat.categories
+    chunks = []
+
+    for chunk in _read(feed_dir, 'stop_times', ['trip_id', 'stop_id', 'departure_time'],
+                       {'trip_id': 'string', 'stop_id': 'string', 'departure_time': 'string'},
+                       chunksize=STOP_TIMES_CHUNK_ROWS):
+        chunks.append(pd.DataFrame({
+            'trip': trip_rows.get_indexer(chunk['trip_id'].astype(object)).astype(np.int32),
+            'stop': pd.Categorical(chunk['stop_id'], categories=stop_categories).codes.astype(np.int32),
+            'departure': gtfs_time_to_seconds(chunk['departure_time']),
+        }))
+
+    stop_times = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(
+        {'trip': np.empty(0, np.int32), 'stop': np.empty(0, np.int32), 'departure': np.empty(0, np.int32)})
+
+    # Calendario y frecuencias (opcionales en GTFS): servicios por día y viajes definidos por intervalo
+    calendar = _read_optional(feed_dir, 'calendar', ['service_id', *WEEKDAY_COLUMNS, 'start_date', 'end_date'],
+                              {'service_id': 'string', **{day: 'int8' for day in WEEKDAY_COLUMNS},
+                               'start_date': 'int32', 'end_date': 'int32'})
+    calendar_dates = _read_optional(feed_dir, 'calendar_dates', ['service_id', 'date', 'exception_type'],
+                                    {'service_id': 'string', 'date': 'int32', 'exception_type': 'int8'})
+
+    frequencies = _read_optional(feed_dir, 'frequencies', ['trip_id', 'start_time', 'end_time', 'headway_secs'],
+                                 {'trip_id': 'string', 'start_time': 'string', 'end_time': 'string',
+                                  'headway_secs': 'int32'})
+    frequencies = pd.DataFrame({
+        'trip': trip_rows.get_indexer(frequencies['trip_id'].astype(object)).astype(np.int32),
+        'start': gtfs_time_to_seconds(frequencies['start_time']),
+        'end': gtfs_time_to_seconds(frequencies['end_time']),
+        'headway': frequencies['headway_secs'].to_numpy(dtype=np.int32),
+    })
+
+    return {'stops': stops, 'routes': routes, 'trips': trips, 'stop_times': stop_times, 'calendar': calendar,
+            'calendar_dates': calendar_dates, 'frequencies': frequencies}
+
+
+def load_feed(feed, use_cache=True):
+    """
+    Tablas del feed ('stops', 'routes', 'trips', 'stop_times', 'calendar', 'calendar_dates', 'frequencies'),
+    desde la copia Parquet en caché si el zip no ha cambiado. En 'stop_times' y 'frequencies', 'trip' y 'stop'
+    son la fila en 'trips' y la posición en las categorías de 'stop_id' (-1 si no existen).
+    """
+
+    checksum = feed_checksum(feed)
+    cache_dir = os.path.join(CACHE_FOLDER, f"{feed}-{checksum}")
+    names = ('stops', 'routes', 'trips', 'stop_times', 'calendar', 'calendar_dates', 'frequencies')
+
+    if use_cache and all(os.path.exists(os.path.join(cache_dir, f"{name}.parquet")) for name in names):
+        return {name: pd.read_parquet(os.path.join(cache_dir, f"{name}.parquet")) for name in names}
+
+    t0 = time.perf_counter()
+    tables = _parse_feed(feed)
+
+    if use_cache:
+        # Se guarda en una carpeta temporal y se renombra, y se borran las copias de versiones anteriores del feed
+        os.makedirs(CACHE_FOLDER, exist_ok=True)
+        tmp_dir = f"{cache_dir}.tmp-{os.getpid()}"
+        os.makedirs(tmp_dir, exist_ok=True)
+        for name, table in tables.items():
+            table.to_parquet(os.path.join(tmp_dir, f"{name}.parquet"), index=False)
+
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        os.replace(tmp_dir, cache_dir)
+        for entry in os.listdir(CACHE_FOLDER):
+            if entry.startswith(f"{feed}-") and entry != f"{feed}-{checksum}":
+                shutil.rmtree(os.path.join(CACHE_FOLDER, entry), ignore_errors=True)
+
+    print(f"Feed GTFS '{feed}' procesado en {time.perf_counter() - t0:.2f} s ({len(tables['stop_times'])} stop_times)")
+    return tables
+
+
+def load_stops(feed, tables=None):
+    """
+    Paradas del feed como GeoDataFrame (EPSG:4326), con la geometría construida de forma vectorizada.
+    """
+
+    import geopandas as gpd
+
+    stops = (tables or load_feed(feed))['stops'].copy()
+    stops['stop_id'] = stops['stop_id'].astype(str)
+    stops['stop_name'] = stops['stop_name'].astype(object)
+
+    return gpd.GeoDataFrame(stops, geometry=gpd.points_from_xy(stops['stop_lon'], stops['stop_lat']),
+                            crs='EPSG:4326')
+
+
+def trip_route_types(tables):
+    """
+    Modo ('Bus', 'Subway'...) de cada viaje, alineado con 'trips'.
+    """
+
+    routes = tables['routes']
+    names = routes['route_type'].map(ROUTE_TYPE_NAMES)
+    by_route = pd.Series(names.to_numpy(), index=routes['route_id'].astype(str))
+
+    return tables['trips']['route_id'].astype(str).map(by_route).to_numpy(dtype=object)
+
+
+def stop_route_types(feed, tables=None):
+    """
+    Pares distintos (stop_id, route_type_en) del feed, calculados en una sola pasada sobre 'stop_times':
+    cada fila se reduce a un entero (parada, modo) y se eliminan los repetidos con np.unique.
+    """
+
+    tables = tables or load_feed(feed)
+    stop_times = tables['stop_times']
+
+    trip_modes = pd.Categorical(trip_route_types(tables))
+    mode_codes = np.append(trip_modes.codes, -1).astype(np.int64)
+
+    trips = stop_times['trip'].to_numpy()
+    stops = stop_times['stop'].to_numpy().astype(np.int64)
+    modes = mode_codes[trips]          # trip == -1 (viaje desconocido) -> último elemento, -1
+
+    valid = (stops >= 0) & (modes >= 0)
+    n_modes = max(len(trip_modes.categories), 1)
+    pairs = np.unique(stops[valid] * n_modes + modes[valid])
+
+    stop_categories = tables['stops']['stop_id'].cat.categories
+    return pd.DataFrame({
+        'stop_id': np.asarray(stop_categories, dtype=object)[pairs // n_modes].astype(str),
+        'route_type_en': np.asarray(trip_modes.categories, dtype=object)[pairs % n_modes],
+    })
+
+
+if __name__ == '__main__':
+
+    # Procesa los feeds y guarda la caché: python -m app.utils.gtfs
+    for feed in FEEDS:
+        t0 = time.perf_counter()
+        pairs = stop_route_types(feed)
+        print(f"{feed}: {len(pairs)} pares parada-modo en {time.perf_counter() - t0:.2f} s")
@@ -0,0 +1,130 @@
+import hashlib
+import numpy as np
+import orjson
+import shapely
+from shapely.geometry import mapping
+from app.utils.simplify import build_pyramid, select_level
+
+
+FEATURE_COLLECTION_HEADER = (b'{"type":"FeatureCollection",'
+                             b'"crs":{"type":"name","properties":{"name":"EPSG:4326"}},'
+                             b'"features":[')
+FEATURE_COLLECTION_FOOTER = b']}'
+
+
+def merge_indicators(acces_gdf, green_gdf):
+    """
+    Une accesibilidad y zonas verdes por 'coddistbar' y descarta las geometrías nulas o no válidas.
+    """
+
+    merged = acces_gdf.merge(green_gdf, on='coddistbar', suffixes=('_acceso', '_verde'))
+
+    geoms = np.asarray(merged['geometry_verde'].values, dtype=object)
+    valid = ~shapely.is_missing(geoms)
+    valid[valid] = shapely.is_valid(geoms[valid])
+
+    return merged[valid].reset_index(drop=True)
+
+
+def encode_floats(values) -> list:
+    # Codifica cada valor como JSON de una sola vez (NaN -> null)
+    if len(values) == 0:
+        return []
+    return orjson.dumps(np.asarray(values, dtype=np.float64), option=orjson.OPT_SERIALIZE_NUMPY)[1:-1].split(b',')
+
+
+class HeatmapIndex:
+    """
+    Tabla del mapa de calor ICVU preparada una sola vez al arrancar.
+
+    Guarda la unión de accesibilidad y zonas verdes, los dos arrays que intervienen en el indicador y,
+    para cada barrio, el fragmento JSON ya codificado del Feature hasta el valor de 'icvu'. En cada petición
+    solo se calcula el ICVU con NumPy y se intercalan los valores en los fragmentos.
+
+    Los fragmentos se guardan para cada nivel de la pirámide de geometrías simplificadas (ver
+    'app.utils.simplify'), con y sin coordenadas cuantizadas.
+    """
+
+    def __init__(self, acces_gdf, green_gdf):
+
+        self.merged = merge_indicators(acces_gdf, green_gdf)
+
+        self.green_ratio = self.merged['green_ratio'].to_numpy(dtype=np.float64)
+        self.accessibility = self.merged['accessibility_percentage'].to_numpy(dtype=np.float64) / 100
+
+        # Accesibilidad contando solo paradas frecuentes, si los datos la incluyen (ver app.utils.departures)
+        self.weightings = {'coverage': self.accessibility}
+        if 'frequent_accessibility_percentage' in self.merged.columns:
+            self.weightings['frequency'] = (self.merged['frequent_accessibility_percentage']
+                                            .to_numpy(dtype=np.float64) / 100)
+
+        self.pyramid = build_pyramid(self.merged['geometry_verde'].values)
+
+        self.levels = []
+        for tolerance, geoms, quantized in self.pyramid:
+            self.levels.append((tolerance, self._encode_prefixes(geoms), self._encode_prefixes(quantized)))
+
+        # Versión de los datos, derivada del contenido (geometrías, nombres e indicadores)
+        digest = hashlib.sha1(b''.join(self.levels[-1][1]))
+        digest.update(self.green_ratio.tobytes())
+        for weighting in self.weightings.values():
+            digest.update(weighting.tobytes())
+        self.version = digest.hexdigest()[:16]
+
+    def _encode_prefixes(self, geoms):
+        return [
+            b'{"type":"Feature","geometry":' + orjson.dumps(mapping(geometry))
+            + b',"properties":{"coddistbar":' + orjson.dumps(int(coddistbar))
+            + b',"nombre_acceso":' + orjson.dumps(nombre)
+            + b',"icvu":'
+            for geometry, coddistbar, nombre in zip(geoms, self.merged['coddistbar'], self.merged['nombre_acceso'])
+        ]
+
+    def __len__(self):
+        return len(self.merged)
+
+    def level_for(self, tolerance=None, zoom=None):
+        return select_level(self.levels, tolerance, zoom)
+
+    def icvu(self, alpha, beta, weighting='coverage'):
+        """
+        :param weighting: 'coverage' (todas las paradas) o 'frequency' (solo paradas frecuentes).
+        :raises ValueError: Si los datos no incluyen esa ponderación.
+        """
+
+        if weighting not in self.weightings:
+            raise ValueError(f"Ponderación no disponible: {weighting}. Opciones: {', '.join(self.weightings)}")
+        return alpha * self.green_ratio + beta * self.weightings[weighting]
+
+    def frame(self, alpha, beta, tolerance=None, zoom=None, weighting='coverage'):
+        """
+        Mismo contenido que 'render' como GeoDataFrame, para exportarlo en formatos binarios.
+        """
+
+        import geopandas as gpd
+
+        _, geoms, _ = self.pyramid[select_level(self.levels, tolerance, zoom)]
+
+        return gpd.GeoDataFrame({'coddistbar': self.merged['coddistbar'].to_numpy(),
+                                 'nombre_acceso': self.merged['nombre_acceso'].to_numpy(),
+                                 'icvu': self.icvu(alpha, beta, weighting)},
+                                geometry=geoms, crs='EPSG:4326')
+
+    def render(self, alpha, beta, tolerance=None, zoom=None, quantized=False, weighting='coverage') -> bytes:
+        """
+        Devuelve el FeatureCollection completo, ya codificado en JSON, para unos pesos 'alpha' y 'beta'.
+
+        :param tolerance: Tolerancia de simplificación aceptable (grados); se usa el nivel más simplificado que no la supere.
+        :param zoom: Alternativa a 'tolerance': nivel de zoom del mapa.
+        :param quantized: Si es True, usa las coordenadas redondeadas de ese nivel.
+        :param weighting: Ponderación de la accesibilidad (ver 'icvu').
+        """
+
+        _, prefixes, quantized_prefixes = self.levels[select_level(self.levels, tolerance, zoom)]
+        if quantized:
+            prefixes = quantized_prefixes
+
+        values = encode_floats(self.icvu(alpha, beta, weighting))
+        features = b','.join([prefix + value + b'}}' for prefix, value in zip(prefixes, values)])
+
+        return FEATURE_COLLECTION_HEADER + features + FEATURE_COLLECTION_FOOTER
@@ -1,24 +1,26 @@
 import re
 import geopandas as gpd
-import matplotlib.pyplot as plt
-import osmnx as ox # depende internamente de GeoPandas
 import networkx as nx
 import unicodedata
 import os
 import shutil
 import pandas as pd
+import shapely
 from shapely.geometry import Point
 from collections import Counter
-from sqlalchemy import create_engine
-from dotenv import load_dotenv
 import requests
 import zipfile
-from geopy.distance import geodesic
+from concurrent.futures import Future, ProcessPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+from app.utils.walk_graph import CSRGraph, open_walk_graph
+from app.utils.metrics import timed
+from app.utils import profiling
 
 
 ## ZONAS VERDES ##
 
 # Cargar los datos de los distritos y barrios
+@timed('load_admin_data')
 def load_admin_data():
 
     url = "https://valencia.opendatasoft.com/api/explore/v2.1/catalog/datasets/barris-barrios/exports/geojson?lang=es&timezone=Europe%2FBerlin"
@@ -30,6 +32,7 @@ def load_admin_data():
 
 
 # Cargar los datos de las áreas verdes
+@timed('load_green_spaces')
 def load_green_spaces():
     url = "https://valencia.opendatasoft.com/api/explore/v2.1/catalog/datasets/espais-verds-espacios-verdes/exports/geojson?lang=es&timezone=Europe%2FBerlin"
     gdf_green = gpd.read_file(url)
@@ -42,11 +45,11 @@ def load_population_csv_local():
     return df_pop_barr
 
 # Cargar datos de población de barrios
+@timed('load_population_csv')
 def load_population_csv():
-    load_dotenv()
-    db_url = f"postgresql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
-    engine = create_engine(db_url)
-    df_pop_barr = pd.read_sql("SELECT * FROM population_barr", engine)
+    from app.utils.dataset import get_engine
+
+    df_pop_barr = pd.read_sql("SELECT * FROM population_barr", get_engine())
     df_pop_barr.loc[df_pop_barr['nombre_barrio'] == 'MAUELLA', 'coddistbar'] = 1234
 
     new_row = pd.DataFrame({'coddistbar': [175], 'nombre_barrio': ['RAFALELL-VISTABELLA'], 'population': [59]})
@@ -56,33 +59,24 @@ def load_population_csv():
 
 
 # Calcular el área de los barrios y la intersección con las áreas verdes
+@timed('compute_green_area_ratio')
 def compute_green_area_ratio(admin_barr, gdf_green):
+    from app.utils.green_area import green_area_by_barrio
 
-    admin_barr_2 = admin_barr.to_crs('EPSG:25830')
-    gdf_green_2 = gdf_green.to_crs('EPSG:25830')
-
-    admin_barr_2['barr_area_imputed'] = admin_barr_2.geometry.area
-
-    gdf_inter_barr = gpd.overlay(gdf_green_2, admin_barr_2, how='intersection')
-
-    if 'coddistbar_2' in gdf_inter_barr.columns:
-        gdf_inter_barr = gdf_inter_barr.rename(columns={'coddistbar_2': 'coddistbar'})
+    # Áreas por barrio con el motor indexado (mismo resultado que gpd.overlay + groupby, ver 'green_area.py')
+    areas = green_area_by_barrio(admin_barr, gdf_green)
 
-    gdf_inter_barr['green_area_m2'] = gdf_inter_barr.geometry.area
-
-    gdf_green_barr_0 = gdf_inter_barr.groupby('coddistbar')['green_area_m2'].sum().reset_index()
-
-    # Unir la información de la zona verde a los barrios
-    admin_barr_green = admin_barr_2.merge(gdf_green_barr_0, on='coddistbar', how='left')
+    admin_barr_green = admin_barr.to_crs("EPSG:4326")
+    admin_barr_green['barr_area_imputed'] = areas['barr_area_imputed']
+    admin_barr_green['green_area_m2'] = areas['green_area_m2']
     admin_barr_green['green_ratio'] = admin_barr_green['green_area_m2'] / admin_barr_green['barr_area_imputed']
 
-    admin_barr_green = admin_barr_green.to_crs("EPSG:4326")
-
 
     return admin_barr_green
 
 
 # Unir la población a los barrios
+@timed('merge_population')
 def merge_population(admin_barr_green, df_pop_barr):
 
     valores_admin_barr = set(admin_barr_green['coddistbar'].unique())
@@ -98,6 +92,7 @@ def merge_population(admin_barr_green, df_pop_barr):
 
 
 # Calcular el área verde per cápita
+@timed('compute_green_area_per_capita')
 def compute_green_area_per_capita(gdf_green_pop_barr):
 
     gdf_green_pop_barr['green_area_per_capita_m2'] = gdf_green_pop_barr['green_area_m2'] / gdf_green_pop_barr['population']
@@ -112,6 +107,7 @@ def compute_green_area_per_capita(gdf_green_pop_barr):
 
 
 
+@timed('download_GTFS')
 def download_GTFS(zip_url, zip_filename, folder_extract):
     """
     Descarga y extrae un archivo ZIP con los datos GTFS del metro.
@@ -147,102 +143,65 @@ def download_GTFS(zip_url, zip_filename, folder_extract):
 
 
 # Función para cargar los datos de las paradas de metro y bus
+@timed('load_transport_stops')
 def load_transport_stops():
-    data_folder = os.path.join(os.path.dirname(__file__), 'data')
-
-    df_stops_emt = pd.read_csv(os.path.join(data_folder, 'emt', 'stops.txt'))
-    df_stops_metro = pd.read_csv(os.path.join(data_folder, 'metro', 'stops.txt'))
-
-    geometry_bus = [Point(xy) for xy in zip(df_stops_emt['stop_lon'], df_stops_emt['stop_lat'])]
-    df_stops_emt = gpd.GeoDataFrame(df_stops_emt, geometry=geometry_bus)
-    df_stops_emt.crs = 'EPSG:4326'
+    from app.utils.gtfs import load_stops
 
-    geometry_metro = [Point(xy) for xy in zip(df_stops_metro['stop_lon'], df_stops_metro['stop_lat'])]
-    df_stops_metro = gpd.GeoDataFrame(df_stops_metro, geometry=geometry_metro)
-    df_stops_metro.crs = 'EPSG:4326'
-
-    return df_stops_emt, df_stops_metro
+    return load_stops('emt'), load_stops('metro')
 
 
 # Función para unir los datos de EMT con Metro y obtener las paradas comunes
+@timed('merge_emt_metro')
 def merge_emt_metro(df_stops_emt, df_stops_metro):
     df_stops_emt['type'] = 'EMT'
     df_stops_metro['type'] = 'MetroValencia'
 
+    # Las geometrías ya vienen construidas de cada feed
     df_stops = pd.concat([df_stops_emt, df_stops_metro], ignore_index=True)
 
-    geometry = [Point(xy) for xy in zip(df_stops['stop_lon'], df_stops['stop_lat'])]
-    gdf_stops = gpd.GeoDataFrame(df_stops, geometry=geometry)
-    gdf_stops.crs = 'EPSG:4326'
-
-    return gdf_stops
+    return gpd.GeoDataFrame(df_stops, geometry='geometry', crs='EPSG:4326')
 
 
+@timed('load_transport_route')
 def load_transport_route(gdf_stops):
     """
     Carga y combina información de rutas de transporte público (MetroValencia y EMT),
     asociando cada parada con su tipo de transporte (bus, metro, tranvía, etc.).
 
+    Los pares (parada, tipo de ruta) de cada feed se calculan con 'app.utils.gtfs.stop_route_types' y se unen
+    solo con las paradas de su misma red, ya que los 'stop_id' de EMT y Metro se solapan.
+
     Args:
     gdf_stops (gpd.GeoDataFrame): GeoDataFrame con las paradas de transporte, incluyendo columnas
-    'stop_id', 'stop_name' y 'geometry'.
+    'stop_id', 'stop_name', 'type' y 'geometry'.
 
     Returns:
     gpd.GeoDataFrame: GeoDataFrame enriquecido con el tipo de ruta ('route_type_en') y el tipo de red ('type').
     """
 
-    map_simple = {0: 'Tram',
-                  1: 'Subway',
-                  2: 'Railway',
-                  3: 'Bus',
-                  4: 'Ferry',
-                  11: 'Trolleybus',
-                  100: 'Railway',
-                  109: 'Railway',
-                  400: 'Railway',
-                  401: 'Subway',
-                  700: 'Bus',
-                  717: 'Bus',
-                  900: 'Tram',
-                  1000: 'Ferry', }
-
-    # CARGA A PARTIR DE FICHEROS
-    data_folder = os.path.join(os.path.dirname(__file__), 'data')
-
-    df_route_metro = pd.read_csv(os.path.join(data_folder, 'metro', 'routes.txt'))
-    df_route_emt = pd.read_csv(os.path.join(data_folder, 'emt', 'routes.txt'))
-
-    df_stop_times_metro = pd.read_csv(os.path.join(data_folder, 'metro', 'stop_times.txt'))
-    df_trips_metro = pd.read_csv(os.path.join(data_folder, 'metro', 'trips.txt'))
+    from app.utils.gtfs import FEEDS, stop_route_types
 
-    df_stop_times_emt = pd.read_csv(os.path.join(data_folder, 'emt', 'stop_times.txt'))
-    df_trips_emt = pd.read_csv(os.path.join(data_folder, 'emt', 'trips.txt'))
-    # CARGA A PARTIR DE FICHEROS
+    stops = gdf_stops.assign(stop_id=gdf_stops['stop_id'].astype(str))
+    merged = []
 
+    for feed in ('emt', 'metro'):
+        network = FEEDS[feed][2]
+        feed_stops = stops.loc[stops['type'] == network, ['stop_id', 'stop_name', 'geometry']]
+        df_merged = feed_stops.merge(stop_route_types(feed), on='stop_id')
+        df_merged = df_merged[['stop_id', 'stop_name', 'route_type_en', 'geometry']].drop_duplicates(
+            subset=['stop_id', 'route_type_en'])
+        df_merged['type'] = network
+        merged.append(df_merged)
 
-    # Procesar Metro
-    df_route_metro['route_type'] = df_route_metro['route_type'].astype(int)
-    df_route_metro['route_type_en'] = df_route_metro['route_type'].map(map_simple)
-    df_merged_metro = df_route_metro[['route_type_en', 'route_id']].merge(df_trips_metro[['route_id', 'trip_id']], left_on='route_id', right_on='route_id')[['trip_id', 'route_type_en']].drop_duplicates()
-    df_merged_metro = df_merged_metro.merge(df_stop_times_metro, left_on='trip_id', right_on='trip_id')[['route_type_en', 'stop_id']].drop_duplicates()
-    df_merged_metro = gdf_stops.merge(df_merged_metro, left_on='stop_id', right_on='stop_id')[['stop_id', 'stop_name', 'route_type_en', 'geometry']].drop_duplicates()
-    df_merged_metro['type'] = 'MetroValencia'
-
-    # Procesar EMT
-    df_route_emt['route_type'] = df_route_emt['route_type'].astype(int)
-    df_route_emt['route_type_en'] = df_route_emt['route_type'].map(map_simple)
-    df_merged_emt = df_route_emt[['route_type_en', 'route_id']].merge(df_trips_emt[['route_id', 'trip_id']], left_on='route_id', right_on='route_id')[['trip_id', 'route_type_en']].drop_duplicates()
-    df_merged_emt = df_merged_emt.merge(df_stop_times_emt, left_on='trip_id', right_on='trip_id')[['route_type_en', 'stop_id']].drop_duplicates()
-    df_merged_emt = gdf_stops.merge(df_merged_emt, left_on='stop_id', right_on='stop_id')[['stop_id', 'stop_name', 'route_type_en', 'geometry']].drop_duplicates()
-    df_merged_emt['type'] = 'EMT'
-
-    gdf_combined  = pd.concat([df_merged_emt, df_merged_metro], ignore_index=True)
+    gdf_combined = gpd.GeoDataFrame(pd.concat(merged, ignore_index=True), geometry='geometry', crs=gdf_stops.crs)
 
     return gdf_combined  # ['stop_id', 'stop_name', 'route_type_en', 'geometry', 'type'], dtype='object')
 
 
 # Función para mostrar el gráfico de tipos de transporte
 def plot_transport_modes(df_route_emt, df_route_metro):
+    import matplotlib.pyplot as plt
+
     df_route = pd.concat([df_route_metro, df_route_emt], ignore_index=True)
 
     d = dict(Counter(df_route['route_type_en']))
@@ -272,10 +231,15 @@ def plot_transport_modes(df_route_emt, df_route_metro):
 
 # Función para encontrar el nodo más cercano a las coordenadas (lat, lon)
 def find_nearest_node(G, lat, lon):
+    if isinstance(G, CSRGraph):
+        return G.nearest_nodes(lon, lat)
+    import osmnx as ox
     return ox.distance.nearest_nodes(G, X=lon, Y=lat)
 
 # Función para calcular la distancia más corta entre dos nodos
 def shortest_path_length(G, node1, node2):
+    if isinstance(G, CSRGraph):
+        return G.shortest_path_length(node1, node2)
     return nx.shortest_path_length(G, node1, node2, weight='length')
 
 
@@ -384,84 +348,420 @@ def get_barr_id_coords(lon: float, lat: float, green_gdf: gpd.GeoDataFrame) -> s
 
 
 
-def get_accesibility_gdf(admin_barr, gdf_stops, threshold_distance = 300, average_speed = 1.5):
+def compute_barrio_accessibility(G, geometry, nearby_stops, threshold_distance=300, average_speed=1.5, barrio_nodes=None):
+    """
+    Calcula los indicadores de accesibilidad de un barrio sobre su grafo peatonal.
+
+    En lugar de lanzar un Dijkstra por cada pareja (nodo, parada), se hace un único Dijkstra multi-origen
+    desde todos los nodos de parada (sobre el grafo invertido y acotado por 'threshold_distance') y un único
+    Dijkstra desde el nodo del centroide.
+
+    Args:
+    G (nx.MultiDiGraph): Grafo peatonal del barrio.
+    geometry (shapely.Polygon): Geometría del barrio.
+    nearby_stops (gpd.GeoDataFrame): Paradas dentro del barrio, con columna 'route_type_en'.
+    threshold_distance (float): Distancia máxima a pie (m) para considerar un nodo accesible.
+    average_speed (float): Velocidad media de caminata (m/s).
+    barrio_nodes (set, opcional): Nodos que pertenecen al barrio cuando G es un trozo del grafo de la ciudad.
+    Por defecto se cuentan todos los nodos de G.
+
+    Returns:
+    dict: 'centroid_distance', 'centroid_estimated_time', 'centroid_closest_stop', 'centroid_route_type',
+    'num_stops' y 'accessibility_percentage'. Si las paradas traen la columna 'frequent' (ver
+    'DeparturesIndex.attach'), también 'frequent_accessibility_percentage': el mismo porcentaje contando solo
+    las paradas frecuentes.
+    """
+
+    if isinstance(G, CSRGraph):
+        return _compute_barrio_accessibility_csr(G, geometry, nearby_stops, threshold_distance, average_speed,
+                                                 barrio_nodes)
+
+    barr_centroid = geometry.centroid
+    barr_node = find_nearest_node(G, barr_centroid.y, barr_centroid.x)
+
+    num_stops = len(nearby_stops)
+    total_nodes = len(G.nodes) if barrio_nodes is None else len(barrio_nodes)
+
+    # Inicialización para obtener parada cerca del centroide
+    min_distance = float('inf')
+    closest_stop = None
+    route_type = None
+    source_nodes = set()
+    frequent_nodes = set()
+    with_frequency = 'frequent' in nearby_stops.columns
+
+    if num_stops > 0:
+        stop_nodes = find_nearest_node(G, nearby_stops.geometry.y.to_numpy(), nearby_stops.geometry.x.to_numpy())
+        frequent = nearby_stops['frequent'].to_numpy() if with_frequency else np.zeros(num_stops, dtype=bool)
+
+        # Un único Dijkstra desde el centroide hasta todas las paradas
+        centroid_lengths = nx.single_source_dijkstra_path_length(G, barr_node, weight='length')
+
+        for stop, stop_node, stop_route_type, is_frequent in zip(nearby_stops.geometry, stop_nodes,
+                                                                 nearby_stops['route_type_en'], frequent):
+            distance_center = centroid_lengths.get(stop_node)
+
+            # Sin camino desde el centroide: la parada se ignora, como antes con nx.NetworkXNoPath
+            if distance_center is None:
+                continue
+
+            source_nodes.add(stop_node)
+            if is_frequent:
+                frequent_nodes.add(stop_node)
+
+            # Actualizar la parada más cercana (la primera en caso de empate)
+            if distance_center < min_distance:
+                min_distance = distance_center
+                closest_stop = stop
+                route_type = stop_route_type
+
+    # Nodos a menos de 'threshold_distance' de alguna parada: Dijkstra multi-origen sobre el grafo invertido,
+    # ya que la distancia se mide desde cada nodo hasta la parada
+    def accessible_share(sources):
+        if total_nodes == 0:
+            return None
+        if not sources:
+            return 0.0
+        reached = nx.multi_source_dijkstra_path_length(G.reverse(copy=False), sources,
+                                                       cutoff=threshold_distance, weight='length')
+        accessible_nodes = len(reached) if barrio_nodes is None else len(barrio_nodes.intersection(reached))
+        return (accessible_nodes / total_nodes) * 100
+
+    # Cálculo del porcentaje de nodos accesibles
+    accessibility_percentage = accessible_share(source_nodes)
+
+    # Estimar el tiempo de caminata hacia la parada más cercana
+    estimated_time = min_distance / average_speed if min_distance != float('inf') else None
+
+    result = {
+        'centroid_distance': min_distance if min_distance != float('inf') else None,
+        'centroid_estimated_time': estimated_time,
+        'centroid_closest_stop': closest_stop,
+        'centroid_route_type': route_type,
+        'num_stops': num_stops,
+        'accessibility_percentage': accessibility_percentage,
+    }
+    if with_frequency:
+        result['frequent_accessibility_percentage'] = accessible_share(frequent_nodes)
+
+    return result
+
+
+def _compute_barrio_accessibility_csr(G, geometry, nearby_stops, threshold_distance, average_speed, barrio_nodes):
+    # Mismo cálculo que 'compute_barrio_accessibility', vectorizado sobre un CSRGraph (posiciones en vez de ids)
+    barr_centroid = geometry.centroid
+    barr_node = G.nearest_nodes(barr_centroid.x, barr_centroid.y)
+
+    num_stops = len(nearby_stops)
+
+    if barrio_nodes is None:
+        barrio_positions = None
+        total_nodes = len(G)
+    else:
+        barrio_positions = G.position_of(np.fromiter(barrio_nodes, dtype=np.int64, count=len(barrio_nodes)))
+        total_nodes = len(barrio_positions)
+
+    min_distance = float('inf')
+    closest_stop = None
+    route_type = None
+    source_nodes = np.empty(0, dtype=np.int64)
+    frequent_nodes = source_nodes
+    with_frequency = 'frequent' in nearby_stops.columns
+
+    if num_stops > 0:
+        stop_nodes = G.nearest_nodes(nearby_stops.geometry.x.to_numpy(), nearby_stops.geometry.y.to_numpy())
+        distances_center = G.dijkstra(barr_node)[stop_nodes]
+        reachable = np.isfinite(distances_center)
+        source_nodes = stop_nodes[reachable]
+        if with_frequency:
+            frequent_nodes = stop_nodes[reachable & nearby_stops['frequent'].to_numpy(dtype=bool)]
+
+        if reachable.any():
+            # argmin devuelve la primera parada en caso de empate
+            closest = int(np.argmin(distances_center))
+            min_distance = float(distances_center[closest])
+            closest_stop = nearby_stops.geometry.iloc[closest]
+            route_type = nearby_stops['route_type_en'].iloc[closest]
+
+    def accessible_share(sources):
+        if total_nodes == 0:
+            return None
+        if len(sources) == 0:
+            return 0.0
+        reached = np.isfinite(G.dijkstra(sources, cutoff=threshold_distance, reverse=True))
+        accessible_nodes = int(reached.sum()) if barrio_positions is None else int(reached[barrio_positions].sum())
+        return (accessible_nodes / total_nodes) * 100
+
+    accessibility_percentage = accessible_share(source_nodes)
+    estimated_time = min_distance / average_speed if min_distance != float('inf') else None
+
+    result = {
+        'centroid_distance': min_distance if min_distance != float('inf') else None,
+        'centroid_estimated_time': estimated_time,
+        'centroid_closest_stop': closest_stop,
+        'centroid_route_type': route_type,
+        'num_stops': num_stops,
+        'accessibility_percentage': accessibility_percentage,
+    }
+    if with_frequency:
+        result['frequent_accessibility_percentage'] = accessible_share(frequent_nodes)
+
+    return result
+
+
+def build_city_walk_graph(admin_barr, buffer_distance=500):
+    """
+    Construye un único grafo peatonal simplificado para toda la extensión de Valencia.
+
+    Args:
+    admin_barr (gpd.GeoDataFrame): Barrios de Valencia.
+    buffer_distance (float): Margen en metros alrededor del término municipal, para no cortar calles en el borde.
+
+    Returns:
+    nx.MultiDiGraph: Grafo peatonal de la ciudad.
+    """
+
+    import osmnx as ox  # importación diferida: osmnx es pesado y la API no lo necesita
+
+    extent = admin_barr.to_crs('EPSG:25830').geometry.buffer(buffer_distance)
+    extent = gpd.GeoSeries([shapely.union_all(extent.values)], crs='EPSG:25830').to_crs('EPSG:4326').iloc[0]
+
+    return ox.graph_from_polygon(extent, network_type='walk', simplify=True)
+
+
+def tag_graph_nodes(nodes_gdf, admin_barr):
+    """
+    Asigna a cada nodo del grafo el 'coddistbar' del barrio que lo contiene mediante un spatial join.
+
+    Returns:
+    pd.Series: 'coddistbar' indexado por id de nodo (los nodos fuera de todos los barrios no aparecen).
+    """
+
+    joined = gpd.sjoin(nodes_gdf[['geometry']], admin_barr[['coddistbar', 'geometry']].to_crs(nodes_gdf.crs),
+                       how='inner', predicate='within')
+    joined = joined[~joined.index.duplicated(keep='first')]
+
+    return joined['coddistbar']
+
+
+def iter_accessibility_units(admin_barr, gdf_stops, mode='barrio', buffer_distance=500, G_city=None):
+    """
+    Genera las unidades de trabajo del cálculo de accesibilidad, una por barrio.
+
+    En modo 'barrio' cada unidad lleva solo la geometría y sus paradas, y el grafo se descarga al procesarla.
+    En modo 'city' se construye (una sola vez) el grafo de toda la ciudad y cada unidad lleva el trozo del grafo
+    alrededor del barrio (barrio + 'buffer_distance'), sus nodos etiquetados por spatial join y las paradas de
+    ese entorno, de modo que las paradas al otro lado de la calle, en el barrio vecino, también cuentan.
+    Con 'buffer_distance' >= 'threshold_distance' el porcentaje de nodos accesibles es exacto.
+
+    'G_city' puede ser un grafo de networkx ya construido o un CSRGraph. Si el CSRGraph viene de un fichero,
+    las unidades llevan solo la ruta y las posiciones de sus nodos, y cada proceso abre el fichero con memmap.
+
+    Si las paradas traen 'departures_per_hour', cada unidad lleva también la suma de salidas por hora de las
+    paradas del barrio.
+
+    Yields:
+    dict: 'index', 'coddistbar', 'nombre', 'geometry', 'graph', 'stops', 'num_stops' y 'barrio_nodes'.
+    """
+
+    import osmnx as ox
+
+    if mode not in ('barrio', 'city'):
+        raise ValueError(f"Modo de accesibilidad desconocido: {mode}")
+
+    if mode == 'city':
+        if G_city is None:
+            G_city = build_city_walk_graph(admin_barr, buffer_distance)
+
+        if isinstance(G_city, CSRGraph):
+            nodes_gdf = G_city.nodes_gdf()
+        else:
+            nodes_gdf = ox.graph_to_gdfs(G_city, edges=False).to_crs('EPSG:25830')
+        node_barrio = tag_graph_nodes(nodes_gdf, admin_barr)
+        nodes_by_barrio = node_barrio.groupby(node_barrio).groups
+
+        barr_proj = admin_barr.to_crs('EPSG:25830').geometry
+        stops_proj = gdf_stops.to_crs('EPSG:25830')
 
     for index, row in admin_barr.iterrows():
-        barrio_name = row['nombre']
+        unit = {'index': index, 'coddistbar': row.get('coddistbar'), 'nombre': row['nombre'], 'geometry': row.geometry,
+                'graph': None, 'barrio_nodes': None}
 
         if row.geometry is None or row.geometry.is_empty:
-            print(f"Geometría vacía en el barrio: {barrio_name}")
+            unit['stops'] = gdf_stops.iloc[0:0]
+            unit['num_stops'] = 0
+            yield unit
             continue
 
+        inside = gdf_stops.geometry.within(row.geometry)
+        unit['num_stops'] = int(inside.sum())
+        if 'departures_per_hour' in gdf_stops.columns:
+            # Una parada con varios tipos de ruta aparece en varias filas: sus salidas se cuentan una vez
+            barrio_stops = gdf_stops.loc[inside].drop_duplicates(subset=['type', 'stop_id'])
+            unit['departures_per_hour'] = float(barrio_stops['departures_per_hour'].sum())
+
+        if mode == 'barrio':
+            unit['stops'] = gdf_stops[inside]
+
+        else:
+            neighbourhood = barr_proj.loc[index].buffer(buffer_distance)
+            node_positions = nodes_gdf.sindex.query(neighbourhood, predicate='intersects')
+            stop_positions = stops_proj.sindex.query(neighbourhood, predicate='intersects')
+
+            if isinstance(G_city, CSRGraph) and G_city.path is not None:
+                unit['graph_path'] = G_city.path
+                unit['graph_nodes'] = np.sort(node_positions)
+            elif isinstance(G_city, CSRGraph):
+                unit['graph'] = G_city.subgraph(node_positions)
+            else:
+                unit['graph'] = G_city.subgraph(nodes_gdf.index[node_positions]).copy()
+            unit['barrio_nodes'] = set(nodes_by_barrio.get(row['coddistbar'], []))
+            unit['stops'] = gdf_stops.iloc[sorted(stop_positions)]
+
+        yield unit
+
+
+def compute_unit_accessibility(unit, threshold_distance=300, average_speed=1.5):
+    """
+    Procesa una unidad de trabajo de 'iter_accessibility_units' y devuelve el registro del barrio.
+    """
+
+    import osmnx as ox
+
+    G = unit['graph']
+    if G is None and unit.get('graph_path'):
+        G = open_walk_graph(unit['graph_path']).subgraph(unit['graph_nodes'])
+    elif G is None:
+        G = ox.graph_from_polygon(unit['geometry'], network_type='walk', simplify=True)
+
+    result = compute_barrio_accessibility(G, unit['geometry'], unit['stops'], threshold_distance, average_speed,
+                                          barrio_nodes=unit['barrio_nodes'])
+    result['num_stops'] = unit['num_stops']
+    if 'departures_per_hour' in unit:
+        result['departures_per_hour'] = unit['departures_per_hour']
+
+    return result
+
+
+@timed('get_accesibility_gdf')
+def get_accesibility_gdf(admin_barr, gdf_stops, threshold_distance = 300, average_speed = 1.5, mode = 'barrio',
+                         buffer_distance = 500, G_city = None):
+    """
+    Accesibilidad de todos los barrios en el propio proceso, con el mismo montaje por registros que
+    'get_accesibility_gdf_parallel', así que el resultado no depende del número de procesos.
+
+    Los barrios que fallan se quedan sin indicadores y se listan por pantalla; para obtener la tabla de errores
+    se usa 'get_accesibility_gdf_parallel' (con max_workers=1 también se ejecuta en el propio proceso).
+
+    Returns:
+    gpd.GeoDataFrame: Barrios con los indicadores de accesibilidad.
+    """
+
+    acces_admin_barr, df_errors = _accessibility_gdf(admin_barr, gdf_stops, threshold_distance, average_speed, mode,
+                                                     buffer_distance, 1, G_city)
+    for error in df_errors.itertuples():
+        print(f"Error procesando el barrio {error.nombre}: {error.error_type}: {error.error}")
+
+    return acces_admin_barr
+
+
+class _SerialExecutor:
+    # Ejecutor que calcula cada unidad al enviarla, en el propio proceso (sin serializar grafos)
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def submit(self, fn, *args):
+        future = Future()
         try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
 
-            G = ox.graph_from_polygon(row.geometry, network_type='walk', simplify=True)
+def _accessibility_worker(unit, threshold_distance, average_speed):
+    # Función de nivel de módulo para poder enviarse a los procesos del pool
+    return compute_unit_accessibility(unit, threshold_distance, average_speed)
 
-            barr_centroid = row.geometry.centroid
-            barr_node = find_nearest_node(G, barr_centroid.y, barr_centroid.x)
 
-            nearby_stops = gdf_stops[gdf_stops.geometry.within(row.geometry)]
+@timed('get_accesibility_gdf_parallel')
+def get_accesibility_gdf_parallel(admin_barr, gdf_stops, threshold_distance=300, average_speed=1.5, mode='barrio',
+                                  buffer_distance=500, max_workers=None, G_city=None):
+    """
+    Accesibilidad de todos los barrios en un ProcessPoolExecutor (o en el propio proceso con max_workers=1).
 
-            num_stops = len(nearby_stops)
+    Cada barrio se envía como unidad de trabajo (geometría, sus paradas y, en modo 'city', su trozo de grafo).
+    Los resultados se recogen como registros y el GeoDataFrame se monta al final en el orden de 'admin_barr',
+    por lo que la salida no depende del número de procesos ni del orden en que terminan.
 
-            # Inicialización para obtener parada cerca del centroide
-            min_distance = float('inf')
-            closest_stop = None
-            route_type = None
+    Con PIPELINE_PROFILE_DIR definido se ejecuta en el propio proceso (max_workers=1): el perfil de la etapa
+    solo ve el hilo que la ejecuta, y con el pool ese hilo se limita a esperar a los procesos.
 
-            # Inicializar el conjunto de nodos accesibles
-            accessible_nodes_set = set()
-            total_nodes = len(G.nodes)
+    Args:
+    max_workers (int, opcional): Número de procesos. Por defecto, os.cpu_count().
 
-            # Guardar las distancias de las paradas a los nodos
-            for stop in nearby_stops.geometry:
-                try:
-                    stop_node = find_nearest_node(G, stop.y, stop.x)
-                    distance_center = shortest_path_length(G, barr_node, stop_node)
+    Returns:
+    tuple: (GeoDataFrame con los indicadores, DataFrame de errores con 'index', 'coddistbar', 'nombre',
+    'error_type' y 'error').
+    """
+
+    if profiling.PIPELINE_PROFILE_DIR and max_workers != 1:
+        print("PIPELINE_PROFILE_DIR definido: la accesibilidad se calcula en un solo proceso para poder perfilarla")
+        max_workers = 1
 
-                    # Actualizar la parada más cercana
-                    if distance_center < min_distance:
-                        min_distance = distance_center
-                        closest_stop = stop
-                        route_type = nearby_stops.loc[nearby_stops.geometry == stop, 'route_type_en'].values[0]
+    return _accessibility_gdf(admin_barr, gdf_stops, threshold_distance, average_speed, mode, buffer_distance,
+                              max_workers, G_city)
 
-                    # Calcular accesibilidad para cada nodo
-                    for node in G.nodes:
-                        distance = shortest_path_length(G, node, stop_node)
 
-                        if distance <= threshold_distance:
-                            accessible_nodes_set.add(node)
+def _accessibility_gdf(admin_barr, gdf_stops, threshold_distance, average_speed, mode, buffer_distance, max_workers,
+                       G_city):
+    # Cuerpo común de las dos versiones (sin medir: cada versión pública se mide una sola vez con 'timed')
+    max_workers = max_workers or os.cpu_count() or 1
+    records = {}
+    errors = []
 
-                except nx.NetworkXNoPath:
+    units = iter_accessibility_units(admin_barr, gdf_stops, mode, buffer_distance, G_city)
+
+    executor = ProcessPoolExecutor(max_workers=max_workers) if max_workers > 1 else _SerialExecutor()
+    with executor:
+        pending = {}
+
+        def submit_next():
+            for unit in units:
+                if unit['geometry'] is None or unit['geometry'].is_empty:
+                    errors.append({'index': unit['index'], 'coddistbar': unit['coddistbar'], 'nombre': unit['nombre'],
+                                   'error_type': 'EmptyGeometry', 'error': 'Geometría vacía'})
                     continue
+                future = executor.submit(_accessibility_worker, unit, threshold_distance, average_speed)
+                pending[future] = (unit['index'], unit['coddistbar'], unit['nombre'])
+                return True
+            return False
 
-            # Cálculo del porcentaje de nodos accesibles
-            accessible_nodes = len(accessible_nodes_set)
-            accessibility_percentage = (accessible_nodes / total_nodes) * 100 if total_nodes > 0 else None
-
-            # Estimar el tiempo de caminata hacia la parada más cercana
-            estimated_time = min_distance / average_speed if min_distance != float('inf') else None
-
-            admin_barr.loc[index, 'centroid_distance'] = min_distance if min_distance != float('inf') else None
-            admin_barr.loc[index, 'centroid_estimated_time'] = estimated_time
-            admin_barr.loc[index, 'centroid_closest_stop'] = closest_stop
-            admin_barr.loc[index, 'centroid_route_type'] = route_type
-            admin_barr.loc[index, 'num_stops'] = num_stops
-            admin_barr.loc[index, 'accessibility_percentage'] = accessibility_percentage
-
-            print(f"Barrio: {barrio_name}")
-            print(f"Centroide: {row.geometry.centroid}")
-            print(f"Parada más cercana: {closest_stop}")
-            print(f"Tipo de transporte: {route_type}")
-            print(f"Distancia mínima: {min_distance:.2f} metros" if min_distance != float('inf') else "Sin conexión posible")
-            print(f"Número de paradas dentro del barrio: {num_stops}")
-            print(f"Tiempo estimado: {estimated_time:.2f} segundos" if estimated_time else "Tiempo estimado no disponible")
-            print(f"Porcentaje de nodos accesibles a <300m: {accessibility_percentage:.2f}%")
-            print("-" * 40)
+        # Se limita el número de unidades en vuelo para no serializar todos los grafos de golpe
+        while len(pending) < 2 * max_workers and submit_next():
+            pass
 
-        except Exception as e:
-            print(f"Error procesando el barrio {barrio_name}: {e}")
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
 
-    return admin_barr
+            for future in done:
+                index, coddistbar, nombre = pending.pop(future)
+                try:
+                    records[index] = future.result()
+                except Exception as e:
+                    errors.append({'index': index, 'coddistbar': coddistbar, 'nombre': nombre,
+                                   'error_type': type(e).__name__, 'error': str(e)})
+                submit_next()
+
+    acces_admin_barr = admin_barr.copy()
+    df_records = pd.DataFrame.from_dict(records, orient='index')
+    for column in df_records.columns:
+        acces_admin_barr[column] = df_records[column].reindex(acces_admin_barr.index)
 
+    df_errors = pd.DataFrame(errors, columns=['index', 'coddistbar', 'nombre', 'error_type', 'error'])
+    df_errors = df_errors.sort_values('index', kind='stable').reset_index(drop=True)
 
+    return acces_admin_barr, df_errors
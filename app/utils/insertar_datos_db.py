@@ -1,55 +1,204 @@
-from dotenv import load_dotenv
-import psycopg2
-from sqlalchemy import create_engine
-from geoalchemy2 import Geometry
-from sqlalchemy.ext.declarative import declarative_base
-import geopandas as gpd
+import argparse
+import io
 import os
+import time
+import numpy as np
+import pandas as pd
 
-from sqlalchemy import create_engine
-from app.utils.helpers import (load_admin_data, load_population_csv_local, load_green_spaces, compute_green_area_ratio,
-                               merge_population, compute_green_area_per_capita)
+from app.utils.dataset import get_database_url
+from app.utils.geo_db import index_statements
 
-# Cargar las variables de entorno desde el archivo .env
-load_dotenv()
 
-# Obtener las variables de entorno
-DB_USER = os.getenv("DB_USER")
-DB_PASSWORD = os.getenv("DB_PASSWORD")
-DB_HOST = os.getenv("DB_HOST")
-DB_PORT = os.getenv("DB_PORT")
-DB_NAME = os.getenv("DB_NAME")
+DATA_FOLDER = os.path.join(os.path.dirname(__file__), 'data')
 
-# Construir la URL de conexión a la base de datos
-DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+# Tablas que se cargan (en este orden: las zonas verdes se calculan con la población ya cargada)
+TABLES = {
+    'population': 'population_barr',
+    'accesibilidad': 'barrios_accesibilidad',
+    'zonas-verdes': 'barrios_zonas_verdes',
+}
 
-# Crear la conexión a PostgreSQL
-engine = create_engine(DATABASE_URL)
+KEY_COLUMNS = ('coddistbar',)
+HASH_COLUMN = 'row_hash'
+SRID = 4326
 
 
-# # Cargar el archivo csv
-# df_pop_barr = load_population_csv_local()
-# print(df_pop_barr)
-#
-#
-# # Insertar en la base de datos
-# df_pop_barr.to_sql("population_barr", engine, if_exists="replace", index=False)
+def load_population(file_path=None):
+    return pd.read_csv(file_path or os.path.join(DATA_FOLDER, '020101_PadronBarrios.csv'))
 
 
+def load_accesibilidad(file_path=None):
+    import geopandas as gpd
 
-# Insertar geodataframe
+    return gpd.read_file(file_path or os.path.join(DATA_FOLDER, 'acces_admin_barr_previous.geojson'))
 
-file_path = os.path.join(os.path.dirname(__file__), 'data', 'acces_admin_barr_previous.geojson')
 
-# Leer el archivo GeoJSON con GeoPandas
-acces_admin_barr = gpd.read_file(file_path)
-# Verifica el contenido del GeoDataFrame (opcional)
-print(acces_admin_barr)
+def load_zonas_verdes(file_path=None):
+    import geopandas as gpd
 
+    if file_path:
+        return gpd.read_file(file_path)
 
-# Insertar el GeoDataFrame en PostgreSQL
-acces_admin_barr.to_postgis(name='barrios_accesibilidad', con=engine, if_exists='replace')
+    from app.api.green_area import get_green_gdf
+    return get_green_gdf()
 
-print("GeoDataFrame insertado en la base de datos correctamente.")
 
+LOADERS = {'population': load_population, 'accesibilidad': load_accesibilidad, 'zonas-verdes': load_zonas_verdes}
 
+
+def _sql_type(dtype):
+    if pd.api.types.is_bool_dtype(dtype):
+        return 'boolean'
+    if pd.api.types.is_integer_dtype(dtype):
+        return 'bigint'
+    if pd.api.types.is_float_dtype(dtype):
+        return 'double precision'
+    return 'text'
+
+
+def prepare_frame(df):
+    """
+    Deja la tabla lista para COPY: atributos planos (texto para los valores no escalares), geometría como EWKB
+    hexadecimal con SRID y una columna 'row_hash' con el hash del contenido de cada fila.
+
+    Returns:
+    tuple: (DataFrame, diccionario {columna: tipo SQL}).
+    """
+
+    import geopandas as gpd
+    import shapely
+
+    if isinstance(df, gpd.GeoDataFrame):
+        from app.utils.export import _sanitize
+
+        gdf = df.to_crs(epsg=SRID) if df.crs is not None and df.crs.to_epsg() != SRID else df
+        geoms = shapely.set_srid(np.asarray(gdf.geometry.values), SRID)
+        out = _sanitize(gdf).reset_index(drop=True)
+        out['geometry'] = shapely.to_wkb(geoms, hex=True, include_srid=True)
+    else:
+        out = df.reset_index(drop=True).copy()
+
+    # Hash estable del contenido (atributos + geometría), calculado de forma vectorizada
+    out[HASH_COLUMN] = pd.util.hash_pandas_object(out, index=False).map('{:016x}'.format)
+
+    types = {column: _sql_type(out[column].dtype) for column in out.columns}
+    if 'geometry' in types:
+        types['geometry'] = f'geometry(Geometry, {SRID})'
+
+    return out, types
+
+
+def _quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def ensure_table(cursor, table, types, spatial, key_columns=KEY_COLUMNS):
+    # Crea la tabla si no existe; si existe, añade las columnas nuevas y conserva datos, índices y permisos
+    columns = ', '.join(f"{_quote(column)} {sql_type}" for column, sql_type in types.items())
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {table} ({columns})")
+
+    for column, sql_type in types.items():
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {_quote(column)} {sql_type}")
+
+    for statement in index_statements(table, spatial=spatial, key_columns=key_columns):
+        cursor.execute(statement)
+
+
+def ingest_frame(conn, df, table, prune=False, key_columns=KEY_COLUMNS):
+    """
+    Carga incremental de una tabla en una sola transacción:
+
+    1. COPY de todas las filas a una tabla temporal de staging.
+    2. INSERT ... ON CONFLICT (clave, 'coddistbar' por defecto) DO UPDATE solo de las filas cuyo 'row_hash' ha
+       cambiado.
+    3. Opcionalmente ('prune'), borrado de las claves que ya no vienen en los datos.
+
+    Returns:
+    dict: Filas insertadas, actualizadas, sin cambios y borradas, y el tiempo empleado.
+    """
+
+    t0 = time.perf_counter()
+    frame, types = prepare_frame(df)
+    columns = list(types)
+    column_list = ', '.join(_quote(column) for column in columns)
+    key_list = ', '.join(_quote(column) for column in key_columns)
+    staging = f"{table}_staging"
+
+    buffer = io.StringIO()
+    frame.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+
+    with conn:
+        with conn.cursor() as cursor:
+            ensure_table(cursor, table, types, spatial='geometry' in types, key_columns=key_columns)
+
+            staging_columns = ', '.join(f"{_quote(column)} {sql_type}" for column, sql_type in types.items())
+            cursor.execute(f"CREATE TEMP TABLE {staging} ({staging_columns}) ON COMMIT DROP")
+            cursor.copy_expert(f"COPY {staging} ({column_list}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+            updates = ', '.join(f"{_quote(column)} = EXCLUDED.{_quote(column)}"
+                                for column in columns if column not in key_columns)
+            cursor.execute(f"""
+                WITH upserted AS (
+                    INSERT INTO {table} ({column_list})
+                    SELECT {column_list} FROM {staging}
+                    ON CONFLICT ({key_list}) DO UPDATE SET {updates}
+                    WHERE {table}.{HASH_COLUMN} IS DISTINCT FROM EXCLUDED.{HASH_COLUMN}
+                    RETURNING (xmax = 0) AS inserted
+                )
+                SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM upserted
+            """)
+            inserted, updated = cursor.fetchone()
+
+            deleted = 0
+            if prune:
+                cursor.execute(f"DELETE FROM {table} t WHERE NOT EXISTS "
+                               f"(SELECT 1 FROM {staging} s WHERE ({', '.join(f's.{_quote(c)}' for c in key_columns)})"
+                               f" = ({', '.join(f't.{_quote(c)}' for c in key_columns)}))")
+                deleted = cursor.rowcount
+
+    return {'table': table, 'rows': len(frame), 'inserted': inserted, 'updated': updated,
+            'unchanged': len(frame) - inserted - updated, 'deleted': deleted,
+            'seconds': time.perf_counter() - t0}
+
+
+def ingest(names, files=None, prune=False, dsn=None):
+    import psycopg2
+
+    files = files or {}
+    conn = psycopg2.connect(dsn or get_database_url())
+    results = []
+
+    try:
+        for name in names:
+            loader = LOADERS[name]
+            df = loader(files[name]) if files.get(name) else loader()
+            result = ingest_frame(conn, df, TABLES[name], prune=prune)
+            results.append(result)
+            print(f"{result['table']}: {result['inserted']} insertadas, {result['updated']} actualizadas, "
+                  f"{result['unchanged']} sin cambios, {result['deleted']} borradas ({result['seconds']:.2f} s)")
+    finally:
+        conn.close()
+
+    return results
+
+
+if __name__ == '__main__':
+
+    # Ejemplo: python -m app.utils.insertar_datos_db accesibilidad --file app/utils/data/acces_admin_barr_previous.geojson
+    parser = argparse.ArgumentParser(description="Carga incremental de las tablas de barrios en PostGIS.")
+    parser.add_argument('tables', nargs='*', help=f"Tablas a cargar: {', '.join(TABLES)} (por defecto todas).")
+    parser.add_argument('--file', default=None, help="Fichero de entrada (solo con una tabla).")
+    parser.add_argument('--prune', action='store_true', help="Borrar los barrios que ya no aparecen en los datos.")
+    args = parser.parse_args()
+
+    names = args.tables or list(TABLES)
+    unknown = [name for name in names if name not in TABLES]
+    if unknown:
+        parser.error(f"Tablas desconocidas: {', '.join(unknown)}")
+    if args.file and len(names) != 1:
+        parser.error("--file solo se puede usar con una tabla")
+
+    t0 = time.perf_counter()
+    ingest(names, files={names[0]: args.file} if args.file else None, prune=args.prune)
+    print(f"Carga completada en {time.perf_counter() - t0:.2f} s")
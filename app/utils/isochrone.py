@@ -0,0 +1,195 @@
+import os
+import numpy as np
+import orjson
+import shapely
+from shapely.geometry import mapping
+
+from app.utils.cache import SingleFlightCache
+from app.utils.walk_graph import PROJECTED_CRS, open_walk_graph
+
+
+DEFAULT_MINUTES = (5, 10, 15)
+MAX_MINUTES = 30
+
+# Anchura (m) a cada lado de las calles alcanzadas con la que se forma el polígono de cada banda
+EDGE_BUFFER = 40
+
+# Distancia máxima (m) entre el punto pedido y el nodo del grafo al que se ajusta
+MAX_SNAP_DISTANCE = 500
+
+
+class IsochroneEngine:
+    """
+    Isócronas a pie sobre el grafo peatonal CSR de la ciudad, cargado una sola vez al arrancar.
+
+    Cada petición ajusta el origen al nodo más cercano (KD-tree), lanza un único Dijkstra acotado por la banda
+    más larga y, para cada banda, forma el polígono con el buffer de las calles alcanzadas (las aristas que
+    solo se recorren en parte se recortan en el punto al que se llega). Las paradas alcanzables se cuentan con
+    la distancia de red a sus nodos y el área verde con la intersección del polígono con los espacios verdes.
+    """
+
+    def __init__(self, graph, gdf_stops=None, green_spaces=None, cache_size=1024):
+        """
+        :param graph: CSRGraph de la ciudad.
+        :param gdf_stops: Paradas (EPSG:4326) con 'type', 'stop_id' y 'route_type_en' (ver 'load_transport_route').
+        :param green_spaces: Polígonos de espacios verdes (cualquier CRS), opcional.
+        """
+
+        from pyproj import Transformer
+
+        self.graph = graph
+        self.edge_sources = np.repeat(np.arange(len(graph), dtype=np.int32), np.diff(np.asarray(graph.offsets)))
+        self.edge_targets = np.asarray(graph.targets)
+        self.edge_lengths = np.asarray(graph.lengths, dtype=np.float64)
+        self.x = np.asarray(graph.x)
+        self.y = np.asarray(graph.y)
+
+        self._to_lonlat = Transformer.from_crs(PROJECTED_CRS, 'EPSG:4326', always_xy=True)
+
+        # Paradas: una por (red, stop_id), con sus tipos de ruta
+        self.stop_nodes = np.empty(0, dtype=np.int64)
+        self.stop_route_types = []
+        if gdf_stops is not None and len(gdf_stops):
+            grouped = gdf_stops.groupby(['type', 'stop_id'], sort=False)
+            first = grouped.head(1)
+            self.stop_nodes = graph.nearest_nodes(first.geometry.x.to_numpy(), first.geometry.y.to_numpy())
+            route_types = grouped['route_type_en'].agg(lambda values: sorted(set(values)))
+            self.stop_route_types = list(route_types.loc[list(zip(first['type'], first['stop_id']))])
+
+        # Espacios verdes: unión disuelta (sin solapes) partida en polígonos con un STRtree
+        self.green_parts = None
+        self.green_tree = None
+        if green_spaces is not None and len(green_spaces):
+            geoms = np.asarray(green_spaces.to_crs(PROJECTED_CRS).geometry.values)
+            geoms = geoms[~shapely.is_missing(geoms)]
+            union = shapely.union_all(shapely.make_valid(geoms))
+            self.green_parts = shapely.get_parts(union)
+            self.green_tree = shapely.STRtree(self.green_parts)
+
+        self.cache = SingleFlightCache(cache_size)
+
+    def snap(self, lon, lat):
+        return self.graph.nearest_nodes(lon, lat, return_distance=True)
+
+    def _band_geometry(self, dist, reached, band_distance):
+        # Aristas desde nodos alcanzados; se recortan en la fracción recorrida dentro de la banda
+        sources = self.edge_sources[reached]
+        targets = self.edge_targets[reached]
+        lengths = self.edge_lengths[reached]
+
+        start = dist[sources]
+        inside = start <= band_distance
+        sources, targets, lengths, start = sources[inside], targets[inside], lengths[inside], start[inside]
+
+        fraction = np.clip((band_distance - start) / np.maximum(lengths, 1e-9), 0, 1)
+        x0, y0 = self.x[sources], self.y[sources]
+        x1 = x0 + fraction * (self.x[targets] - x0)
+        y1 = y0 + fraction * (self.y[targets] - y0)
+
+        coords = np.stack([np.column_stack([x0, y0]), np.column_stack([x1, y1])], axis=1)
+        lines = shapely.linestrings(coords)
+        nodes = shapely.points(self.x[dist <= band_distance], self.y[dist <= band_distance])
+
+        # El buffer de la colección completa disuelve los solapes en una sola operación
+        parts = shapely.geometrycollections(np.concatenate([lines, nodes]))
+        return shapely.buffer(parts, EDGE_BUFFER, quad_segs=2)
+
+    def _green_area(self, polygon):
+        if self.green_tree is None:
+            return None
+        candidates = self.green_tree.query(polygon, predicate='intersects')
+        if len(candidates) == 0:
+            return 0.0
+        return float(shapely.area(shapely.intersection(self.green_parts[candidates], polygon)).sum())
+
+    def _to_geojson(self, geometry):
+        def transform(coords):
+            lon, lat = self._to_lonlat.transform(coords[:, 0], coords[:, 1])
+            return np.round(np.column_stack([lon, lat]), 6)
+
+        return mapping(shapely.transform(geometry, transform))
+
+    def compute(self, node, minutes, speed):
+        """
+        FeatureCollection (bytes JSON) con una banda por duración, de menor a mayor; cada banda incluye todo lo
+        alcanzable hasta esa duración.
+        """
+
+        distances = [m * 60 * speed for m in minutes]
+        dist = self.graph.dijkstra(node, cutoff=max(distances))
+        reached = np.isfinite(dist[self.edge_sources])
+
+        features = []
+        for band_minutes, band_distance in zip(minutes, distances):
+            polygon = self._band_geometry(dist, reached, band_distance)
+
+            reached_stops = np.flatnonzero(dist[self.stop_nodes] <= band_distance)
+            by_route_type = {}
+            for position in reached_stops:
+                for route_type in self.stop_route_types[position]:
+                    by_route_type[route_type] = by_route_type.get(route_type, 0) + 1
+
+            green_area = self._green_area(polygon)
+            features.append({
+                'type': 'Feature',
+                'geometry': self._to_geojson(polygon),
+                'properties': {
+                    'minutes': band_minutes,
+                    'distance_m': band_distance,
+                    'area_m2': round(float(polygon.area), 1),
+                    'nodes': int((dist <= band_distance).sum()),
+                    'stops': int(len(reached_stops)),
+                    'stops_by_route_type': by_route_type,
+                    'green_area_m2': None if green_area is None else round(green_area, 1),
+                },
+            })
+
+        return orjson.dumps({'type': 'FeatureCollection', 'features': features})
+
+    def isochrones(self, lon, lat, minutes=DEFAULT_MINUTES, speed=1.5):
+        """
+        Isócronas desde (lon, lat). Las respuestas se guardan por (nodo de origen, bandas, velocidad), así que los
+        orígenes cercanos que se ajustan al mismo nodo comparten la entrada de caché.
+
+        :raises ValueError: Si el punto está a más de MAX_SNAP_DISTANCE de la red peatonal.
+        :return: (bytes JSON, nodo de origen, distancia de ajuste en metros).
+        """
+
+        node, snap_distance = self.snap(lon, lat)
+        if snap_distance > MAX_SNAP_DISTANCE:
+            raise ValueError(f"El punto está a {snap_distance:.0f} m de la red peatonal")
+
+        minutes = tuple(sorted(set(minutes)))
+        speed = round(speed, 2)
+        content = self.cache.get_or_compute((node, minutes, speed), lambda: self.compute(node, minutes, speed))
+
+        return content, node, snap_distance
+
+
+def load_isochrone_engine(graph_path=None, gdf_stops=None):
+    """
+    Motor de isócronas para la API, o None si no existe el grafo peatonal (WALK_GRAPH_PATH).
+
+    Las paradas, si no se pasan, se leen de los feeds GTFS locales y los espacios verdes de la instantánea
+    'green_spaces' (si existe; si no, el área verde no se calcula).
+    """
+
+    from app.utils.walk_graph import DEFAULT_GRAPH_PATH
+
+    graph_path = graph_path or os.getenv("WALK_GRAPH_PATH", DEFAULT_GRAPH_PATH)
+    if not os.path.exists(graph_path):
+        return None
+
+    from app.utils.snapshot import load_snapshot, SnapshotError
+    from app.utils.stop_index import load_stop_gdf
+
+    if gdf_stops is None:
+        gdf_stops = load_stop_gdf()
+
+    try:
+        green_spaces, _ = load_snapshot('green_spaces')
+    except (SnapshotError, OSError):
+        green_spaces = None
+
+    return IsochroneEngine(open_walk_graph(graph_path), gdf_stops, green_spaces,
+                           cache_size=int(os.getenv("ISOCHRONE_CACHE_SIZE", 1024)))
@@ -0,0 +1,239 @@
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from app.utils import profiling
+
+
+# Límites (s) de los histogramas de latencia: de 1 ms a 30 s
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Límites (bytes) del histograma de tamaño de respuesta: de 256 B a 64 MiB
+SIZE_BUCKETS = tuple(256 * 4 ** i for i in range(10))
+
+# Límites (s) de las etapas de los pipelines: de 10 ms a 1 h
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            series = {key: (list(value) if isinstance(value, list) else value) for key, value in self._series.items()}
+        for label_values, value in sorted(series.items()):
+            lines.extend(self._render_series(label_values, value))
+        return lines
+
+    def _render_series(self, label_values, value):
+        return [f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._series[label_values] = self._series.get(label_values, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._series[label_values] = self._series.get(label_values, 0) + amount
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+    def set(self, value, *label_values):
+        with self._lock:
+            self._series[label_values] = value
+
+
+class Histogram(_Metric):
+    """
+    Histograma con límites fijos. Cada serie es una lista [cuentas por intervalo..., suma, total]; las cuentas
+    acumuladas que pide el formato de Prometheus se calculan al exportar, no al observar.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *label_values):
+        position = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[position] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def _render_series(self, label_values, value):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), value[:-2]):
+            cumulative += count
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels, label_values, [('le', _format_value(bound))])} "
+                         f"{cumulative}")
+        labels = _format_labels(self.labels, label_values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(value[-2])}")
+        lines.append(f"{self.name}_count{labels} {value[-1]}")
+        return lines
+
+
+class Registry:
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> bytes:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return ('\n'.join(lines) + '\n').encode()
+
+
+REGISTRY = Registry()
+
+REQUEST_DURATION = REGISTRY.register(Histogram(
+    'http_request_duration_seconds', 'Latencia de las peticiones HTTP.', ('method', 'route', 'status')))
+REQUESTS_IN_FLIGHT = REGISTRY.register(Gauge(
+    'http_requests_in_flight', 'Peticiones HTTP en curso.', ('method',)))
+RESPONSE_SIZE = REGISTRY.register(Histogram(
+    'http_response_size_bytes', 'Tamaño del cuerpo de las respuestas HTTP.', ('method', 'route'), SIZE_BUCKETS))
+REQUEST_ERRORS = REGISTRY.register(Counter(
+    'http_request_errors_total', 'Respuestas 5xx y excepciones no controladas.', ('method', 'route', 'status')))
+STAGE_DURATION = REGISTRY.register(Histogram(
+    'pipeline_stage_duration_seconds', 'Duración de las etapas de los pipelines de indicadores.', ('stage',),
+    STAGE_BUCKETS))
+STAGE_FAILURES = REGISTRY.register(Counter(
+    'pipeline_stage_failures_total', 'Etapas de los pipelines que terminan con excepción.', ('stage',)))
+
+
+def metrics_enabled():
+    return os.getenv("METRICS_ENABLED", "1") == "1"
+
+
+class timed:
+    """
+    Mide la duración de una etapa de los pipelines en 'pipeline_stage_duration_seconds', como gestor de
+    contexto ('with timed("etapa"):') o como decorador ('@timed("etapa")'). Cada uso toma su propio tiempo de
+    inicio, así que es seguro entre hilos y en llamadas anidadas.
+
+    Con PIPELINE_PROFILE_DIR definido, además perfila la etapa (solo el hilo que la ejecuta) y guarda el perfil
+    en esa carpeta (ver app.utils.profiling). El trabajo que la etapa reparte a otros procesos no aparece en el
+    perfil; por eso 'get_accesibility_gdf_parallel' pasa a un solo proceso cuando se perfila.
+    """
+
+    def __init__(self, stage):
+        self.stage = stage
+        self._starts = threading.local()
+
+    def __enter__(self):
+        starts = getattr(self._starts, 'stack', None)
+        if starts is None:
+            starts = self._starts.stack = []
+        profiler = None
+        if profiling.PIPELINE_PROFILE_DIR:
+            profiler = profiling.SamplingProfiler(thread_ids=[threading.get_ident()]).start()
+        starts.append((time.perf_counter(), profiler))
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        t0, profiler = self._starts.stack.pop()
+        elapsed = time.perf_counter() - t0
+        STAGE_DURATION.observe(elapsed, self.stage)
+        if exc_type is not None:
+            STAGE_FAILURES.inc(self.stage)
+        if profiler is not None:
+            profiling.dump_profile(profiler.stop(), self.stage)
+        return False
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self:
+                return func(*args, **kwargs)
+        return wrapper
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI que registra, por método y ruta (la plantilla, p. ej. '/db/accesibilidad/{coddistbar}', para
+    no crear una serie por URL), la latencia, el tamaño de la respuesta y los errores, y las peticiones en curso.
+    Las rutas que no existen se agrupan en 'unmatched'.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        method = scope['method']
+        status = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            elif message['type'] == 'http.response.body':
+                size += len(message.get('body', b''))
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc(method)
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            status = 500
+            raise
+        finally:
+            elapsed = time.perf_counter() - t0
+            REQUESTS_IN_FLIGHT.dec(method)
+
+            # FastAPI deja la ruta resuelta en el scope
+            route = getattr(scope.get('route'), 'path', 'unmatched')
+            REQUEST_DURATION.observe(elapsed, method, route, str(status))
+            RESPONSE_SIZE.observe(size, method, route)
+            if status >= 500:
+                REQUEST_ERRORS.inc(method, route, str(status))
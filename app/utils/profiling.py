@@ -0,0 +1,245 @@
+import itertools
+import json
+import os
+import secrets
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from urllib.parse import parse_qs
+
+
+# Intervalo de muestreo por defecto (s)
+DEFAULT_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", 1)) / 1000
+
+# Con PIPELINE_PROFILE_DIR definido, cada etapa medida con 'timed' guarda su perfil en esa carpeta
+PIPELINE_PROFILE_DIR = os.getenv("PIPELINE_PROFILE_DIR")
+
+PROFILE_FORMATS = {
+    'collapsed': 'text/plain; charset=utf-8',
+    'speedscope': 'application/json',
+}
+
+# Hilos parados (pool de hilos sin trabajo, bucle de eventos esperando E/S): no se cuentan sus muestras
+IDLE_MODULES = ('threading.py', 'selectors.py', 'queue.py')
+
+_dump_sequence = itertools.count()
+
+
+def _stack(frame):
+    # Pila de la raíz a la hoja como tuplas (función, fichero, línea de inicio)
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+
+class SamplingProfiler:
+    """
+    Perfilador por muestreo en un hilo aparte: cada 'interval' segundos toma la pila de los hilos observados con
+    sys._current_frames() y acumula, por pila, las muestras y el tiempo real transcurrido desde la muestra anterior
+    (con el GIL ocupado las muestras se espacian más que 'interval'). No instrumenta las funciones, así que el
+    código perfilado apenas se ralentiza y no hay ningún coste cuando no está activo.
+
+    :param thread_ids: Hilos a observar; None para todos los que estén trabajando (los endpoints síncronos se
+                       ejecutan en el pool de hilos, así que con peticiones concurrentes se mezclan sus pilas).
+    """
+
+    def __init__(self, interval=DEFAULT_INTERVAL, thread_ids=None):
+        self.interval = interval
+        self.thread_ids = None if thread_ids is None else set(thread_ids)
+        self.samples = Counter()
+        self.seconds = defaultdict(float)
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+        self._t0 = None
+
+    def _run(self):
+        own = threading.get_ident()
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            elapsed, last = now - last, now
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                    continue
+                if os.path.basename(frame.f_code.co_filename) in IDLE_MODULES:
+                    continue
+                stack = _stack(frame)
+                self.samples[stack] += 1
+                self.seconds[stack] += elapsed
+
+    def start(self):
+        self._t0 = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self._t0
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    def collapsed(self) -> str:
+        """
+        Pilas agregadas en formato 'collapsed' (una línea 'raíz;...;hoja muestras'), el que leen flamegraph.pl,
+        speedscope o inferno.
+        """
+
+        lines = []
+        for stack, count in self.samples.most_common():
+            frames = ';'.join(f"{name} ({os.path.basename(filename)}:{line})" for name, filename, line in stack)
+            lines.append(f"{frames} {count}")
+        return '\n'.join(lines) + '\n'
+
+    def speedscope(self, name='perfil') -> dict:
+        """
+        Perfil en el formato de https://www.speedscope.app (perfil 'sampled', pesos en segundos).
+        """
+
+        frame_index = {}
+        samples, weights = [], []
+        for stack, _ in self.samples.most_common():
+            samples.append([frame_index.setdefault(frame, len(frame_index)) for frame in stack])
+            weights.append(self.seconds[stack])
+
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'name': name,
+            'exporter': 'fastapi_gis_valencia',
+            'shared': {'frames': [{'name': frame_name, 'file': filename, 'line': line}
+                                  for frame_name, filename, line in frame_index]},
+            'profiles': [{
+                'type': 'sampled',
+                'name': name,
+                'unit': 'seconds',
+                'startValue': 0,
+                'endValue': sum(weights),
+                'samples': samples,
+                'weights': weights,
+            }],
+        }
+
+    def render(self, fmt, name='perfil') -> bytes:
+        if fmt == 'collapsed':
+            return self.collapsed().encode()
+        return json.dumps(self.speedscope(name)).encode()
+
+
+## ETAPAS DE LOS PIPELINES ##
+
+def dump_profile(profiler, stage, directory=None):
+    """
+    Guarda el perfil de una etapa como '<etapa>-<fecha>.speedscope.json' y '.collapsed.txt'.
+
+    :return: Ruta del fichero speedscope.
+    """
+
+    directory = directory or PIPELINE_PROFILE_DIR
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, f"{stage}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(_dump_sequence)}")
+
+    with open(f"{base}.speedscope.json", 'w') as f:
+        json.dump(profiler.speedscope(stage), f)
+    with open(f"{base}.collapsed.txt", 'w') as f:
+        f.write(profiler.collapsed())
+
+    print(f"Perfil de '{stage}' ({profiler.duration:.2f} s, {sum(profiler.samples.values())} muestras): "
+          f"{base}.speedscope.json")
+    return f"{base}.speedscope.json"
+
+
+## PETICIONES ##
+
+def requested_format(scope):
+    """
+    Formato de perfil pedido en la petición: cabecera 'X-Profile' o parámetro '?profile=' ('collapsed' o
+    'speedscope'), o None.
+    """
+
+    for name, value in scope['headers']:
+        if name == b'x-profile':
+            return value.decode('latin-1').strip().lower()
+
+    if b'profile=' in scope.get('query_string', b''):
+        values = parse_qs(scope['query_string'].decode('latin-1')).get('profile')
+        if values:
+            return values[0].strip().lower()
+    return None
+
+
+def admin_token_valid(scope):
+    token = os.getenv("ADMIN_TOKEN")
+    if not token:
+        return False
+    for name, value in scope['headers']:
+        if name == b'x-admin-token':
+            return secrets.compare_digest(value, token.encode())
+    return False
+
+
+class ProfilingMiddleware:
+    """
+    Middleware ASGI que, si la petición lo pide (X-Profile / ?profile=) con un X-Admin-Token válido, la ejecuta
+    bajo el perfilador por muestreo y devuelve el perfil en lugar de la respuesta. El estado y la duración de la
+    respuesta original van en las cabeceras X-Profile-Status y X-Profile-Duration.
+
+    Solo se instala con PROFILING_ENABLED=1, así que sin él las peticiones no pasan por aquí.
+    """
+
+    def __init__(self, app, interval=DEFAULT_INTERVAL):
+        self.app = app
+        self.interval = interval
+
+    async def __call__(self, scope, receive, send):
+        fmt = requested_format(scope) if scope['type'] == 'http' else None
+        if fmt is None:
+            await self.app(scope, receive, send)
+            return
+
+        if fmt not in PROFILE_FORMATS:
+            await self._respond(send, 400, 'text/plain; charset=utf-8',
+                                f"Formato de perfil desconocido: {fmt} ({', '.join(PROFILE_FORMATS)})".encode())
+            return
+        if not admin_token_valid(scope):
+            await self._respond(send, 403, 'text/plain; charset=utf-8', b"Token de administracion no valido")
+            return
+
+        status = 500
+
+        async def discard(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+
+        profiler = SamplingProfiler(self.interval)
+        with profiler:
+            await self.app(scope, receive, discard)
+
+        name = f"{scope['method']} {scope['path']}"
+        await self._respond(send, 200, PROFILE_FORMATS[fmt], profiler.render(fmt, name),
+                            [(b'x-profile-status', str(status).encode()),
+                             (b'x-profile-duration', f"{profiler.duration:.6f}".encode())])
+
+    @staticmethod
+    async def _respond(send, status, content_type, body, headers=()):
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', content_type.encode()),
+                                (b'content-length', str(len(body)).encode()), *headers]})
+        await send({'type': 'http.response.body', 'body': body})
+
+
+def profiling_enabled():
+    return os.getenv("PROFILING_ENABLED", "0") == "1"
@@ -0,0 +1,155 @@
+import threading
+import time
+import traceback
+
+
+class DatasetValidationError(ValueError):
+    pass
+
+
+def validate_table(gdf, name, required_columns, previous_rows=None, min_ratio=0.5):
+    """
+    Comprueba que una tabla nueva se puede servir: columnas esperadas, no vacía, 'coddistbar' único,
+    sin geometrías nulas y sin perder de golpe más de la mitad de los barrios respecto a la versión actual.
+
+    :raises DatasetValidationError: Con el primer problema encontrado.
+    """
+
+    import shapely
+
+    missing = [column for column in required_columns if column not in gdf.columns]
+    if missing:
+        raise DatasetValidationError(f"{name}: faltan columnas {missing}")
+
+    if len(gdf) == 0:
+        raise DatasetValidationError(f"{name}: la tabla está vacía")
+
+    duplicated = gdf['coddistbar'][gdf['coddistbar'].duplicated()].unique()
+    if len(duplicated):
+        raise DatasetValidationError(f"{name}: 'coddistbar' duplicado ({list(duplicated[:5])})")
+
+    geoms = gdf.geometry.values
+    if shapely.is_missing(geoms).any() or shapely.is_empty(geoms).any():
+        raise DatasetValidationError(f"{name}: hay barrios sin geometría")
+
+    if previous_rows and len(gdf) < previous_rows * min_ratio:
+        raise DatasetValidationError(f"{name}: {len(gdf)} filas frente a {previous_rows} de la versión actual")
+
+
+class DatasetRefresher:
+    """
+    Recarga los datos en segundo plano y cambia de versión de forma atómica.
+
+    El Dataset nuevo (con sus índices y cachés) se construye entero fuera del camino de las peticiones; solo
+    si pasa la validación se publica con 'holder.swap()'. Las peticiones en curso terminan con la versión que
+    tomaron y las siguientes ven la nueva, de modo que nunca se observa un estado a medio construir y las
+    cachés de la versión anterior se descartan con ella. Si la versión no ha cambiado no se cambia nada, así que
+    las cachés siguen calientes.
+    """
+
+    def __init__(self, holder, load, required_columns, interval=0):
+        """
+        :param load: Función que recibe la versión actual (o None) y devuelve un Dataset nuevo, o None si la
+                     versión de los datos no ha cambiado (p. ej. 'load_dataset' con su 'build').
+        :param required_columns: Diccionario {'acces_gdf': [...], 'green_gdf': [...]} con las columnas obligatorias.
+        :param interval: Segundos entre recargas periódicas (0 = solo bajo demanda).
+        """
+
+        self.holder = holder
+        self.load = load
+        self.required_columns = required_columns
+        self.interval = interval
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.last_refresh_at = None
+        self.last_refresh_seconds = None
+        self.last_error = None
+        self.refreshes = 0
+        self.unchanged = 0
+        self.failures = 0
+
+    @property
+    def running(self):
+        return self._lock.locked()
+
+    def validate(self, dataset):
+        previous = self.holder.get() if self.holder.loaded else None
+
+        for name, columns in self.required_columns.items():
+            previous_rows = len(getattr(previous, name)) if previous is not None else None
+            validate_table(getattr(dataset, name), name, columns, previous_rows)
+
+    def refresh(self):
+        """
+        Recarga síncrona. Devuelve True si se ha publicado una versión nueva; False si la versión no ha cambiado,
+        si la recarga falla o si ya había una en marcha (en ese caso no se lanza otra).
+        """
+
+        if not self._lock.acquire(blocking=False):
+            return False
+
+        t0 = time.perf_counter()
+        try:
+            previous = self.holder.get().version if self.holder.loaded else None
+            dataset = self.load(previous)
+
+            if dataset is None or dataset.version == previous:
+                self.unchanged += 1
+                self.last_error = None
+                print(f"Datos sin cambios (versión {previous}), comprobados en {time.perf_counter() - t0:.2f} s")
+                return False
+
+            self.validate(dataset)
+            self.holder.swap(dataset)
+
+            self.refreshes += 1
+            self.last_error = None
+            print(f"Datos recargados ({dataset.source}, versión {previous} -> {dataset.version}) "
+                  f"en {time.perf_counter() - t0:.2f} s")
+            return True
+
+        except Exception as e:
+            # La versión actual sigue sirviéndose
+            self.failures += 1
+            self.last_error = f"{type(e).__name__}: {e}"
+            print(f"Error recargando los datos: {self.last_error}")
+            traceback.print_exc()
+            return False
+
+        finally:
+            self.last_refresh_at = time.time()
+            self.last_refresh_seconds = time.perf_counter() - t0
+            self._lock.release()
+
+    def trigger(self):
+        """
+        Lanza una recarga en un hilo aparte. Devuelve False si ya había una en marcha.
+        """
+
+        if self.running:
+            return False
+        threading.Thread(target=self.refresh, name='dataset-refresh', daemon=True).start()
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.refresh()
+
+    def start(self):
+        if self.interval > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='dataset-refresher', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def status(self):
+        return {"refreshing": self.running, "interval_seconds": self.interval, "refreshes": self.refreshes,
+                "unchanged": self.unchanged, "failures": self.failures, "last_refresh_at": self.last_refresh_at,
+                "last_refresh_seconds": self.last_refresh_seconds, "last_error": self.last_error}
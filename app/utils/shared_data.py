@@ -0,0 +1,223 @@
+import fcntl
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+
+# Directorio compartido por todos los workers de uvicorn (mejor en tmpfs, p. ej. /dev/shm)
+DEFAULT_SHARED_DIR = os.path.join(tempfile.gettempdir(), 'fastapi_gis_valencia')
+
+TABLE_NAMES = ('acces_gdf', 'green_gdf')
+CURRENT_FILE = 'current.json'
+
+# Hora de importación: aproximación al arranque del proceso si /proc no está disponible
+_IMPORTED_AT = time.time()
+
+# 'created_at' de la publicación a la que está enganchado este proceso, por directorio
+_attached = {}
+
+
+def shared_dir():
+    return os.getenv("SHARED_DATA_DIR", DEFAULT_SHARED_DIR)
+
+
+def deploy_id():
+    # Identificador del despliegue (p. ej. el commit o la release); lo comparten 'prepare' y los workers
+    return os.getenv("DEPLOY_ID") or None
+
+
+def process_start_time():
+    """
+    Hora (epoch) de arranque de este proceso según /proc (Linux); si no se puede leer, la hora de importación.
+    """
+
+    try:
+        with open('/proc/self/stat') as f:
+            # El nombre del proceso va entre paréntesis y puede contener espacios: se parte tras el último ')'
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/stat') as f:
+            boot_time = next(int(line.split()[1]) for line in f if line.startswith('btime '))
+        return boot_time + start_ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError, StopIteration):
+        return _IMPORTED_AT
+
+
+@contextmanager
+def _exclusive_lock(directory):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, '.lock'), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def read_current(directory=None):
+    path = os.path.join(directory or shared_dir(), CURRENT_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def materialize(acces_gdf, green_gdf, version, source, directory=None):
+    """
+    Escribe las tablas como ficheros Arrow IPC sin comprimir (mapeables en memoria) y publica la versión en
+    'current.json'. Las versiones anteriores se borran: los procesos que aún las tengan mapeadas siguen
+    leyéndolas sin problema hasta que las suelten.
+    """
+
+    import pyarrow as pa
+    from app.utils.export import to_arrow_table
+
+    directory = directory or shared_dir()
+    version_dir = os.path.join(directory, version)
+    tmp_dir = tempfile.mkdtemp(prefix='.tmp-', dir=directory)
+
+    for name, gdf in zip(TABLE_NAMES, (acces_gdf, green_gdf)):
+        table = to_arrow_table(gdf)
+        with pa.ipc.new_file(os.path.join(tmp_dir, f"{name}.arrow"), table.schema) as writer:
+            writer.write_table(table)
+
+    shutil.rmtree(version_dir, ignore_errors=True)
+    os.replace(tmp_dir, version_dir)
+
+    current = {'version': version, 'source': source, 'created_at': time.time(), 'deploy_id': deploy_id()}
+    tmp_current = os.path.join(directory, f".{CURRENT_FILE}.tmp")
+    with open(tmp_current, 'w') as f:
+        json.dump(current, f)
+    os.replace(tmp_current, os.path.join(directory, CURRENT_FILE))
+
+    for entry in os.listdir(directory):
+        path = os.path.join(directory, entry)
+        if entry != version and not entry.startswith('.') and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+
+    return current
+
+
+def _attach_table(path):
+    # Solo los atributos se leen sin copia: las columnas numéricas sin nulos apuntan directamente a las páginas
+    # del fichero. La geometría se guarda como WKB y cada worker la decodifica en sus propios objetos shapely
+    # (los índices espaciales y la pirámide de la API los necesitan), así que esa parte no se comparte
+    import geopandas as gpd
+    import pyarrow as pa
+    import shapely
+
+    table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+    geometry = shapely.from_wkb(table.column('geometry').to_numpy(zero_copy_only=False))
+    df = table.drop_columns(['geometry']).to_pandas(split_blocks=True, zero_copy_only=False)
+
+    # El CRS viaja en los metadatos 'geo' del esquema (PROJJSON, como en GeoParquet); sin él, CRS desconocido
+    geo = json.loads((table.schema.metadata or {}).get(b'geo', b'{}'))
+    crs = geo.get('columns', {}).get('geometry', {}).get('crs')
+    if crs is not None:
+        import pyproj
+        crs = pyproj.CRS.from_json_dict(crs)
+
+    return gpd.GeoDataFrame(df, geometry=geometry, crs=crs)
+
+
+def attach(directory=None):
+    """
+    Abre la versión publicada en 'current.json'.
+
+    Returns:
+    tuple: (acces_gdf, green_gdf, origen, versión).
+    """
+
+    directory = directory or shared_dir()
+    current = read_current(directory)
+    if current is None:
+        raise FileNotFoundError(f"No hay datos compartidos en {directory}")
+
+    version_dir = os.path.join(directory, current['version'])
+    acces_gdf, green_gdf = (_attach_table(os.path.join(version_dir, f"{name}.arrow")) for name in TABLE_NAMES)
+    _attached[directory] = current['created_at']
+
+    return acces_gdf, green_gdf, f"shared:{current['source']}", current['version']
+
+
+def expected_version(source=None):
+    # Versión de las instantáneas locales, si se cargan de ellas y existen; si no, None
+    from app.utils.snapshot import read_manifest, SnapshotError
+
+    if (source or os.getenv("DATA_SOURCE", "snapshot")) != 'snapshot':
+        return None
+
+    try:
+        return f"{read_manifest('acces_gdf')['version']}-{read_manifest('green_gdf')['version']}"
+    except (SnapshotError, OSError):
+        return None
+
+
+def is_current(current, wanted):
+    """
+    Indica si los datos publicados en 'current.json' sirven para este proceso.
+
+    Con instantáneas basta con que coincida su versión. Los datos cargados del pipeline completo no tienen una
+    versión que comprobar, así que se atan al despliegue: con DEPLOY_ID tienen que haberse materializado en el
+    mismo despliegue ('prepare' incluido); sin él, después de arrancar este proceso (los workers de un mismo
+    servidor arrancan a la vez, antes de que el primero termine de materializar). Así un 'current.json' de un
+    despliegue anterior no se reutiliza indefinidamente.
+    """
+
+    if current is None:
+        return False
+    if wanted is not None:
+        return current['version'] == wanted
+    if deploy_id() is not None:
+        return current.get('deploy_id') == deploy_id()
+    return current['created_at'] >= process_start_time()
+
+
+def load_shared(loader, directory=None, force=False, source=None):
+    """
+    Carga los datos una sola vez para todos los workers.
+
+    El primer proceso que toma el cerrojo ejecuta 'loader()' (que devuelve (acces_gdf, green_gdf, origen, versión)),
+    materializa las tablas y las publica; el resto espera al cerrojo y se engancha a los ficheros mapeados.
+    Lo que se evita en cada worker es la carga (PostGIS, opendatasoft, GeoParquet) y la copia de los atributos;
+    las geometrías se decodifican en cada proceso (ver '_attach_table').
+
+    Con 'force' (recarga de datos en vivo) pasa lo mismo: solo recarga el primer worker. Si 'current.json' ya
+    no es la publicación a la que este proceso estaba enganchado, otro worker ha recargado mientras tanto y
+    basta con engancharse a la nueva.
+    """
+
+    directory = directory or shared_dir()
+
+    with _exclusive_lock(directory):
+        current = read_current(directory)
+        wanted = expected_version(source)
+
+        held = _attached.get(directory)
+        if force and current is not None and held is not None and current['created_at'] != held:
+            force = False
+
+        if force or not is_current(current, wanted):
+            acces_gdf, green_gdf, origin, version = loader()
+            materialize(acces_gdf, green_gdf, version or wanted or f"live-{int(time.time())}", origin, directory)
+
+        return attach(directory)
+
+
+if __name__ == '__main__':
+
+    # Preparación en el proceso principal del despliegue, antes de arrancar los workers:
+    #   python -m app.utils.shared_data prepare [--force]
+    # Con DATA_SOURCE=live los workers solo reutilizan lo preparado si reciben el mismo DEPLOY_ID
+    if len(sys.argv) < 2 or sys.argv[1] != 'prepare':
+        print("Uso: python -m app.utils.shared_data prepare [--force]")
+        sys.exit(1)
+
+    from app.utils.dataset import load_filled_sources
+
+    t0 = time.perf_counter()
+    _, _, source, version = load_shared(load_filled_sources, force='--force' in sys.argv)
+    print(f"Datos compartidos ({source}, versión {version}) listos en {shared_dir()} en {time.perf_counter() - t0:.1f} s")
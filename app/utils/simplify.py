@@ -0,0 +1,98 @@
+import math
+import numpy as np
+import shapely
+
+
+# Niveles de zoom con geometría simplificada precalculada; por encima del último se sirve la resolución completa
+PYRAMID_ZOOMS = (8, 10, 12, 14)
+
+
+def zoom_to_tolerance(zoom):
+    """
+    Tolerancia (grados) equivalente a medio píxel de una tesela de 256 px en ese nivel de zoom.
+    """
+
+    return 360.0 / (256 * 2 ** zoom) / 2
+
+
+def tolerance_decimals(tolerance):
+    # Decimales suficientes para no perder precisión frente a la tolerancia de simplificación
+    return max(0, math.ceil(-math.log10(tolerance)) + 1)
+
+
+def simplify_coverage(geoms, tolerance):
+    """
+    Simplifica un conjunto de polígonos que forman una cobertura (los barrios) conservando la topología:
+    los bordes compartidos se simplifican una sola vez, así que los barrios vecinos siguen compartiéndolos.
+
+    Usa shapely.coverage_simplify (Shapely >= 2.1 / GEOS >= 3.12). Si no está disponible, o para las
+    geometrías que resulten vacías o no válidas, se simplifica cada polígono por separado con preserve_topology.
+    """
+
+    geoms = np.asarray(geoms, dtype=object)
+    fallback = shapely.simplify(geoms, tolerance, preserve_topology=True)
+
+    if not hasattr(shapely, 'coverage_simplify'):
+        return fallback
+
+    try:
+        simplified = shapely.coverage_simplify(geoms, tolerance)
+    except shapely.errors.GEOSException:
+        return fallback
+
+    broken = shapely.is_empty(simplified) | ~shapely.is_valid(simplified)
+    simplified[broken] = fallback[broken]
+
+    return simplified
+
+
+def quantize(geoms, decimals):
+    """
+    Ajusta las coordenadas a una rejilla de 'decimals' decimales para reducir el tamaño del JSON.
+
+    Se usa shapely.set_precision y no un redondeo de coordenadas: al ajustar a la rejilla GEOS rehace la
+    geometría (anillos que se tocan o se cruzan, vértices repetidos), así que el resultado sigue siendo válido.
+    """
+
+    return shapely.set_precision(np.asarray(geoms, dtype=object), 10.0 ** -decimals)
+
+
+def build_pyramid(geoms, zooms=PYRAMID_ZOOMS):
+    """
+    Precalcula la geometría simplificada para cada nivel de zoom.
+
+    Returns:
+    list: [(tolerancia, geometrías, geometrías cuantizadas)] ordenada de mayor a menor tolerancia, terminando
+    con la resolución completa (tolerancia 0, cuantizada a 6 decimales).
+    """
+
+    geoms = np.asarray(geoms, dtype=object)
+    levels = []
+
+    for zoom in sorted(zooms):
+        tolerance = zoom_to_tolerance(zoom)
+        simplified = simplify_coverage(geoms, tolerance)
+        levels.append((tolerance, simplified, quantize(simplified, tolerance_decimals(tolerance))))
+
+    levels.append((0.0, geoms, quantize(geoms, 6)))
+
+    return levels
+
+
+def select_level(levels, tolerance=None, zoom=None):
+    """
+    Elige el nivel más simplificado cuya tolerancia no supera la pedida (por 'tolerance' o por 'zoom').
+    Sin parámetros se devuelve la resolución completa.
+    """
+
+    if tolerance is None and zoom is not None:
+        tolerance = zoom_to_tolerance(zoom)
+
+    if tolerance is None:
+        return len(levels) - 1
+
+    for position, (level_tolerance, _, _) in enumerate(levels):
+        if level_tolerance <= tolerance:
+            return position
+
+    return len(levels) - 1
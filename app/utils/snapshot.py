@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+
+# Versión del formato de las instantáneas (manifiesto + GeoParquet con la versión en el nombre)
+SNAPSHOT_FORMAT_VERSION = 2
+
+DEFAULT_SNAPSHOT_DIR = os.path.join(os.path.dirname(__file__), 'data', 'snapshots')
+
+SNAPSHOT_NAMES = ('acces_gdf', 'green_gdf')
+
+# Capas auxiliares que no forman parte del Dataset (p. ej. los espacios verdes para las isócronas)
+EXTRA_SNAPSHOT_NAMES = ('green_spaces',)
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+def snapshot_dir():
+    return os.getenv("SNAPSHOT_DIR", DEFAULT_SNAPSHOT_DIR)
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(1 << 20):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_snapshot(gdf, name, directory=None):
+    """
+    Guarda el GeoDataFrame como GeoParquet ('<nombre>-<versión>.parquet') junto a un manifiesto JSON con versión,
+    fichero de datos y checksum.
+
+    La publicación es atómica: primero se escribe el GeoParquet versionado (que nadie lee todavía) y después se
+    sustituye el manifiesto con un único os.replace. Un lector ve el manifiesto anterior con sus datos o el nuevo
+    con los suyos, nunca una mezcla. Se conserva el fichero de la versión anterior para los lectores que ya
+    tenían su manifiesto; las más antiguas se borran.
+
+    Returns:
+    dict: El manifiesto escrito.
+    """
+
+    from app.utils.export import write_gdf
+
+    directory = directory or snapshot_dir()
+    os.makedirs(directory, exist_ok=True)
+
+    tmp_path = os.path.join(directory, f".{name}.parquet.tmp")
+    write_gdf(gdf, tmp_path, 'parquet')
+
+    checksum = file_sha256(tmp_path)
+    version = checksum[:16]
+    data_file = f"{name}-{version}.parquet"
+    manifest = {
+        'name': name,
+        'format_version': SNAPSHOT_FORMAT_VERSION,
+        'version': version,
+        'data_file': data_file,
+        'sha256': checksum,
+        'rows': len(gdf),
+        'columns': [str(column) for column in gdf.columns],
+        'created_at': datetime.now(timezone.utc).isoformat(),
+    }
+
+    try:
+        previous = read_manifest(name, directory)['data_file']
+    except SnapshotError:
+        previous = None
+
+    os.replace(tmp_path, os.path.join(directory, data_file))
+
+    manifest_path = os.path.join(directory, f"{name}.json")
+    with open(f"{manifest_path}.tmp", 'w') as f:
+        json.dump(manifest, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(f"{manifest_path}.tmp", manifest_path)
+
+    for filename in os.listdir(directory):
+        if (filename.startswith(f"{name}-") and filename.endswith('.parquet')
+                and filename not in (data_file, previous)):
+            os.remove(os.path.join(directory, filename))
+
+    return manifest
+
+
+def read_manifest(name, directory=None):
+    path = os.path.join(directory or snapshot_dir(), f"{name}.json")
+
+    if not os.path.exists(path):
+        raise SnapshotError(f"No existe la instantánea '{name}' en {os.path.dirname(path)}")
+
+    with open(path) as f:
+        manifest = json.load(f)
+
+    if manifest.get('format_version') != SNAPSHOT_FORMAT_VERSION:
+        raise SnapshotError(f"Versión de formato no soportada en la instantánea '{name}'")
+
+    return manifest
+
+
+def load_snapshot(name, directory=None, verify=True):
+    """
+    Carga el GeoParquet que indica el manifiesto comprobando antes su checksum.
+
+    Returns:
+    tuple: (GeoDataFrame, manifiesto).
+    """
+
+    import geopandas as gpd
+
+    directory = directory or snapshot_dir()
+    manifest = read_manifest(name, directory)
+    data_path = os.path.join(directory, manifest['data_file'])
+
+    if verify and file_sha256(data_path) != manifest['sha256']:
+        raise SnapshotError(f"El checksum de la instantánea '{name}' no coincide con su manifiesto")
+
+    return gpd.read_parquet(data_path), manifest
+
+
+def build_snapshots(directory=None):
+    """
+    Ejecuta el pipeline completo (PostGIS + opendatasoft) y guarda las instantáneas que usa la API al arrancar.
+    """
+
+    from app.utils.dataset import load_live
+    from app.utils.helpers import load_green_spaces
+
+    t0 = time.perf_counter()
+    acces_gdf, green_gdf = load_live()
+    green_spaces = load_green_spaces()
+
+    for name, gdf in zip(SNAPSHOT_NAMES + EXTRA_SNAPSHOT_NAMES, (acces_gdf, green_gdf, green_spaces)):
+        manifest = write_snapshot(gdf, name, directory)
+        print(f"Instantánea '{name}' versión {manifest['version']}: {manifest['rows']} filas")
+
+    print(f"Instantáneas generadas en {time.perf_counter() - t0:.1f} s")
+
+
+if __name__ == '__main__':
+
+    if len(sys.argv) < 2 or sys.argv[1] != 'build':
+        print("Uso: python -m app.utils.snapshot build [directorio]")
+        sys.exit(1)
+
+    build_snapshots(sys.argv[2] if len(sys.argv) > 2 else None)
@@ -0,0 +1,101 @@
+import numpy as np
+import geopandas as gpd
+import shapely
+from shapely import STRtree
+from shapely.geometry import Point
+
+
+class BarrioLocator:
+    """
+    Localizador de barrios construido una sola vez al arrancar la API.
+
+    Mantiene un STRtree sobre las geometrías (preparadas) de los barrios y un
+    diccionario 'coddistbar' -> posición de fila, de modo que localizar un punto
+    es una consulta al árbol y recuperar la fila es un acceso O(1).
+    """
+
+    def __init__(self, gdf: gpd.GeoDataFrame):
+
+        if 'geometry' not in gdf.columns:
+            raise ValueError("El GeoDataFrame no tiene una columna de geometría.")
+
+        self.gdf = gdf
+        self._geoms = np.asarray(gdf.geometry.values, dtype=object)
+        shapely.prepare(self._geoms)
+        self._tree = STRtree(self._geoms)
+        self._codes = gdf['coddistbar'].to_numpy()
+
+        # Primera aparición de cada 'coddistbar', igual que el antiguo .iloc[0]
+        self._positions = {}
+        for pos, code in enumerate(self._codes):
+            self._positions.setdefault(code, pos)
+
+    def __len__(self):
+        return len(self._codes)
+
+    def locate_position(self, lon: float, lat: float) -> int | None:
+        """
+        Devuelve la posición de fila del barrio que contiene el punto, o None.
+        Si varios barrios contienen el punto se devuelve el primero en el orden del GeoDataFrame.
+        """
+
+        punto = Point(lon, lat)
+        candidates = self._tree.query(punto)
+
+        for pos in np.sort(candidates):
+            if shapely.contains(self._geoms[pos], punto):
+                return int(pos)
+        return None
+
+    def locate(self, lon: float, lat: float):
+        """
+        Equivalente a 'get_barr_id_coords': devuelve el 'coddistbar' del barrio que contiene el punto o None.
+        """
+
+        pos = self.locate_position(lon, lat)
+        return None if pos is None else self._codes[pos]
+
+    def locate_positions(self, lons, lats) -> np.ndarray:
+        """
+        Versión vectorizada de 'locate_position' para muchos puntos a la vez.
+
+        :param lons: Array de longitudes.
+        :param lats: Array de latitudes.
+        :return: Array int64 con la posición de fila de cada punto, o -1 si cae fuera de todos los barrios.
+        """
+
+        puntos = shapely.points(np.asarray(lons, dtype=float), np.asarray(lats, dtype=float))
+        result = np.full(len(puntos), -1, dtype=np.int64)
+
+        if len(puntos) == 0:
+            return result
+
+        idx_point, idx_barr = self._tree.query(puntos, predicate='within')
+
+        # Quedarse con el primer barrio (menor posición) para cada punto
+        order = np.lexsort((idx_barr, idx_point))
+        idx_point, idx_barr = idx_point[order], idx_barr[order]
+        first = np.ones(len(idx_point), dtype=bool)
+        first[1:] = idx_point[1:] != idx_point[:-1]
+        result[idx_point[first]] = idx_barr[first]
+
+        return result
+
+    def position_of(self, coddistbar) -> int | None:
+        return self._positions.get(coddistbar)
+
+    def get_row(self, coddistbar):
+        """
+        Devuelve la fila (pd.Series) del barrio con ese 'coddistbar', o None si no existe.
+        """
+
+        pos = self._positions.get(coddistbar)
+        return None if pos is None else self.gdf.iloc[pos]
+
+    def lookup(self, lon: float, lat: float):
+        """
+        Localiza el punto y devuelve directamente la fila del barrio, o None si está fuera de Valencia.
+        """
+
+        pos = self.locate_position(lon, lat)
+        return None if pos is None else self.gdf.iloc[pos]
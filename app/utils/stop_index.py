@@ -0,0 +1,159 @@
+import os
+import numpy as np
+import orjson
+
+from app.utils.isochrone import MAX_SNAP_DISTANCE
+from app.utils.walk_graph import project_lonlat
+
+
+# Con distancia de red, solo se buscan caminos de hasta este múltiplo de la distancia en línea recta más larga
+NETWORK_DETOUR_FACTOR = 3.0
+
+MAX_K = 50
+
+
+def load_stop_gdf():
+    """
+    Paradas de EMT + Metro con su tipo de ruta, desde los feeds GTFS locales; None si no se han descargado.
+    """
+
+    from app.utils.gtfs import DATA_FOLDER, FEEDS
+
+    if not all(os.path.exists(os.path.join(DATA_FOLDER, folder, 'stops.txt')) for folder, _, _ in FEEDS.values()):
+        return None
+
+    from app.utils.helpers import load_transport_stops, merge_emt_metro, load_transport_route
+
+    return load_transport_route(merge_emt_metro(*load_transport_stops()))
+
+
+class StopIndex:
+    """
+    Paradas de transporte (una por red y 'stop_id') en EPSG:25830 con un KD-tree para buscar las k más cercanas
+    a uno o muchos puntos a la vez. Con el grafo peatonal CSR también calcula la distancia a pie.
+    """
+
+    def __init__(self, gdf_stops, graph=None):
+        from sklearn.neighbors import KDTree
+
+        grouped = gdf_stops.groupby(['type', 'stop_id'], sort=False)
+        first = grouped.head(1).reset_index(drop=True)
+        route_types = grouped['route_type_en'].agg(lambda values: sorted(set(values)))
+
+        self.stop_ids = first['stop_id'].astype(str).to_numpy(dtype=object)
+        self.names = first['stop_name'].astype(str).to_numpy(dtype=object)
+        self.networks = first['type'].to_numpy(dtype=object)
+        self.route_types = list(route_types.loc[list(zip(first['type'], first['stop_id']))])
+        self.lon = first.geometry.x.to_numpy()
+        self.lat = first.geometry.y.to_numpy()
+        self.x, self.y = (np.asarray(v) for v in project_lonlat(self.lon, self.lat))
+
+        self._tree = KDTree(np.column_stack([self.x, self.y]))
+
+        # Un KD-tree por tipo de ruta para filtrar sin pedir más vecinos de la cuenta
+        self._by_route_type = {}
+        for route_type in sorted({rt for types in self.route_types for rt in types}):
+            positions = np.array([i for i, types in enumerate(self.route_types) if route_type in types], dtype=np.int64)
+            self._by_route_type[route_type] = (KDTree(np.column_stack([self.x[positions], self.y[positions]])),
+                                               positions)
+
+        # Fragmentos JSON de cada parada, codificados una sola vez
+        self._fragments = [
+            b'{"stop_id":' + orjson.dumps(stop_id) + b',"stop_name":' + orjson.dumps(name)
+            + b',"type":' + orjson.dumps(network) + b',"route_types":' + orjson.dumps(types)
+            + b',"lon":' + orjson.dumps(float(lon)) + b',"lat":' + orjson.dumps(float(lat))
+            for stop_id, name, network, types, lon, lat in zip(self.stop_ids, self.names, self.networks,
+                                                               self.route_types, self.lon, self.lat)
+        ]
+
+        self.graph = graph
+        self.stop_nodes = None
+        self.stop_snap = None
+        if graph is not None:
+            self.stop_nodes, self.stop_snap = graph.nearest_nodes(self.lon, self.lat, return_distance=True)
+
+    def __len__(self):
+        return len(self.stop_ids)
+
+    @property
+    def available_route_types(self):
+        return list(self._by_route_type)
+
+    def nearest(self, lons, lats, k=5, route_type=None):
+        """
+        Las k paradas más cercanas en línea recta a cada punto.
+
+        :param route_type: Solo paradas con ese tipo de ruta ('Bus', 'Subway', 'Tram'...).
+        :raises ValueError: Si el tipo de ruta no existe.
+        :return: (distancias en metros (n, k), posiciones de las paradas (n, k)), ordenadas de menor a mayor.
+        """
+
+        if route_type is None:
+            tree, positions = self._tree, None
+        elif route_type in self._by_route_type:
+            tree, positions = self._by_route_type[route_type]
+        else:
+            raise ValueError(f"Tipo de ruta desconocido: {route_type}. Opciones: {', '.join(self._by_route_type)}")
+
+        x, y = project_lonlat(np.atleast_1d(lons), np.atleast_1d(lats))
+        k = min(k, tree.data.shape[0])
+        dist, idx = tree.query(np.column_stack([x, y]), k=k)
+
+        return dist, (idx if positions is None else positions[idx])
+
+    def network_distances(self, lon, lat, positions, max_distance):
+        """
+        Distancia a pie (m) desde el punto a cada parada: ajuste al grafo + camino más corto + ajuste de la parada.
+        Las paradas sin camino de hasta 'max_distance' quedan a inf.
+
+        :raises ValueError: Si el punto está a más de MAX_SNAP_DISTANCE de la red peatonal.
+        """
+
+        node, snap = self.graph.nearest_nodes(lon, lat, return_distance=True)
+        # Mismo límite que las isócronas: lejos de la red, la distancia a pie no tendría sentido
+        if snap > MAX_SNAP_DISTANCE:
+            raise ValueError(f"El punto está a {snap:.0f} m de la red peatonal")
+
+        dist = self.graph.dijkstra(node, cutoff=max_distance)
+        return snap + dist[self.stop_nodes[positions]] + self.stop_snap[positions]
+
+    def encode(self, distances, positions, network=None) -> bytes:
+        # Lista JSON de paradas con su distancia en línea recta (y a pie, si se ha calculado)
+        items = []
+        for i, (distance, position) in enumerate(zip(distances, positions)):
+            item = self._fragments[position] + b',"distance_m":' + orjson.dumps(round(float(distance), 1))
+            if network is not None:
+                walk = network[i]
+                item += b',"network_distance_m":' + (orjson.dumps(round(float(walk), 1)) if np.isfinite(walk)
+                                                     else b'null')
+            items.append(item + b'}')
+        return b'[' + b','.join(items) + b']'
+
+    def query(self, lon, lat, k=5, route_type=None, network=False) -> bytes:
+        """
+        Respuesta JSON de /paradas/cercanas para un punto.
+        """
+
+        distances, positions = self.nearest(lon, lat, k, route_type)
+        distances, positions = distances[0], positions[0]
+
+        walk = None
+        if network:
+            if self.graph is None:
+                raise RuntimeError("Grafo peatonal no disponible")
+            max_distance = float(distances.max(initial=0)) * NETWORK_DETOUR_FACTOR
+            walk = self.network_distances(lon, lat, positions, max_distance)
+
+            # Orden por distancia a pie (las no alcanzables al final)
+            order = np.argsort(walk, kind='stable')
+            distances, positions, walk = distances[order], positions[order], walk[order]
+
+        return self.encode(distances, positions, walk)
+
+    def query_batch(self, lons, lats, k=5, route_type=None) -> bytes:
+        """
+        Respuesta JSON para muchos puntos: una lista de paradas (en línea recta) por punto.
+        """
+
+        distances, positions = self.nearest(lons, lats, k, route_type)
+        return b'[' + b','.join(self.encode(d, p) for d, p in zip(distances, positions)) + b']'
@@ -0,0 +1,96 @@
+import numpy as np
+import shapely
+from shapely import STRtree
+from app.utils.cache import LRUCache
+from app.utils.simplify import select_level
+
+
+TILE_EXTENT = 4096
+TILE_BUFFER = 64  # margen en unidades de tesela para que los bordes no se corten en la unión entre teselas
+WEB_MERCATOR_HALF = 20037508.342789244
+LAYER_NAME = 'barrios'
+
+TILE_ATTRIBUTES = ['green_ratio', 'accessibility_percentage', 'green_area_per_capita_m2']
+
+
+def tile_bounds(z, x, y):
+    """
+    Límites (minx, miny, maxx, maxy) de la tesela z/x/y en EPSG:3857.
+    """
+
+    size = 2 * WEB_MERCATOR_HALF / 2 ** z
+    minx = -WEB_MERCATOR_HALF + x * size
+    maxy = WEB_MERCATOR_HALF - y * size
+
+    return minx, maxy - size, minx + size, maxy
+
+
+def to_web_mercator(geoms):
+    from pyproj import Transformer
+
+    transformer = Transformer.from_crs('EPSG:4326', 'EPSG:3857', always_xy=True)
+    return shapely.transform(np.asarray(geoms, dtype=object),
+                             lambda coords: np.column_stack(transformer.transform(coords[:, 0], coords[:, 1])))
+
+
+class TileIndex:
+    """
+    Teselas vectoriales (Mapbox Vector Tile) de los barrios con el ICVU y los indicadores.
+
+    Reutiliza la pirámide de geometrías simplificadas del HeatmapIndex, proyectada a EPSG:3857 y con un
+    STRtree por nivel. Las teselas generadas se guardan en una caché LRU en memoria con clave
+    (z, x, y, alpha, beta, ponderación); la API redondea alpha y beta como en /ICVU/heatmap antes de pedirlas.
+    """
+
+    def __init__(self, heatmap_index, cache_size=4096):
+
+        self.heatmap = heatmap_index
+        merged = heatmap_index.merged
+
+        self.coddistbar = merged['coddistbar'].astype(int).tolist()
+        self.nombre = merged['nombre_acceso'].astype(str).tolist()
+        self.attributes = {column: merged[column].astype(float).tolist() for column in TILE_ATTRIBUTES}
+
+        self.levels = []
+        for tolerance, geoms, _ in heatmap_index.pyramid:
+            projected = to_web_mercator(geoms)
+            self.levels.append((tolerance, projected, STRtree(projected)))
+
+        self.cache = LRUCache(cache_size)
+
+    def render(self, z, x, y, alpha, beta, weighting='coverage') -> bytes:
+        key = (z, x, y, alpha, beta, weighting)
+        tile = self.cache.get(key)
+
+        if tile is None:
+            tile = self._encode(z, x, y, alpha, beta, weighting)
+            self.cache.put(key, tile)
+
+        return tile
+
+    def _encode(self, z, x, y, alpha, beta, weighting) -> bytes:
+        import mapbox_vector_tile
+
+        bounds = tile_bounds(z, x, y)
+        margin = (bounds[2] - bounds[0]) * TILE_BUFFER / TILE_EXTENT
+        clip_box = (bounds[0] - margin, bounds[1] - margin, bounds[2] + margin, bounds[3] + margin)
+
+        _, geoms, tree = self.levels[select_level(self.levels, zoom=z)]
+        positions = np.sort(tree.query(shapely.box(*clip_box)))
+
+        clipped = shapely.clip_by_rect(geoms[positions], *clip_box)
+        icvu = self.heatmap.icvu(alpha, beta, weighting)[positions]
+
+        features = []
+        for position, geometry, value in zip(positions, clipped, icvu):
+            if geometry.is_empty:
+                continue
+
+            properties = {'coddistbar': self.coddistbar[position], 'nombre': self.nombre[position], 'icvu': float(value)}
+            for column, values in self.attributes.items():
+                properties[column] = values[position]
+
+            features.append({'geometry': geometry, 'properties': properties})
+
+        return mapbox_vector_tile.encode([{'name': LAYER_NAME, 'features': features}],
+                                         default_options={'quantize_bounds': bounds, 'extents': TILE_EXTENT})
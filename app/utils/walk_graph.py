@@ -0,0 +1,309 @@
+import os
+import struct
+import sys
+from functools import lru_cache
+import numpy as np
+
+
+# Formato binario del grafo peatonal (CSR):
+#   cabecera: magic (8 bytes), versión (uint32), nº de nodos (uint64), nº de aristas (uint64)
+#   arrays, cada uno alineado a 64 bytes y en este orden:
+#     node_ids  int64   [n]     id de OSM del nodo
+#     lon, lat  float64 [n]     coordenadas EPSG:4326
+#     x, y      float64 [n]     coordenadas EPSG:25830
+#     offsets   int64   [n + 1] inicio de las aristas de cada nodo en 'targets'/'lengths'
+#     targets   int32   [m]     posición del nodo destino
+#     lengths   float32 [m]     longitud de la arista en metros
+MAGIC = b'VLCWALK\x00'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<8sIQQ')
+ALIGNMENT = 64
+
+DEFAULT_GRAPH_PATH = os.path.join(os.path.dirname(__file__), 'data', 'walk_graph.csr')
+
+PROJECTED_CRS = 'EPSG:25830'
+
+
+def _layout(n_nodes, n_edges):
+    # Devuelve [(nombre, dtype, longitud, offset)] para todos los arrays del fichero
+    specs = [('node_ids', np.int64, n_nodes), ('lon', np.float64, n_nodes), ('lat', np.float64, n_nodes),
+             ('x', np.float64, n_nodes), ('y', np.float64, n_nodes), ('offsets', np.int64, n_nodes + 1),
+             ('targets', np.int32, n_edges), ('lengths', np.float32, n_edges)]
+
+    layout = []
+    offset = HEADER.size
+    for name, dtype, length in specs:
+        offset = -(-offset // ALIGNMENT) * ALIGNMENT
+        layout.append((name, dtype, length, offset))
+        offset += np.dtype(dtype).itemsize * length
+
+    return layout
+
+
+def project_lonlat(lons, lats):
+    from pyproj import Transformer
+
+    transformer = Transformer.from_crs('EPSG:4326', PROJECTED_CRS, always_xy=True)
+    return transformer.transform(np.asarray(lons, dtype=float), np.asarray(lats, dtype=float))
+
+
+class CSRGraph:
+    """
+    Grafo peatonal dirigido en formato CSR, pensado para abrirse con np.memmap.
+
+    Los nodos se identifican por su posición (0..n-1); 'node_ids' guarda el id de OSM correspondiente.
+    Varios procesos que abren el mismo fichero comparten las páginas en memoria.
+    """
+
+    def __init__(self, node_ids, lon, lat, x, y, offsets, targets, lengths, path=None):
+        self.node_ids = node_ids
+        self.lon = lon
+        self.lat = lat
+        self.x = x
+        self.y = y
+        self.offsets = offsets
+        self.targets = targets
+        self.lengths = lengths
+        self.path = path
+        self._matrix = None
+        self._matrix_t = None
+        self._kdtree = None
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    @property
+    def nodes(self):
+        return range(len(self.node_ids))
+
+    @property
+    def num_edges(self):
+        return len(self.targets)
+
+    @classmethod
+    def from_networkx(cls, G):
+        """
+        Convierte un grafo de osmnx (nx.MultiDiGraph con atributos 'x', 'y' y 'length') a CSR.
+        Las aristas paralelas se reducen a la de menor longitud, que es la que usa Dijkstra.
+        """
+
+        node_ids = np.fromiter(G.nodes, dtype=np.int64, count=len(G))
+        order = np.argsort(node_ids, kind='stable')
+        node_ids = node_ids[order]
+
+        lon = np.array([G.nodes[n]['x'] for n in node_ids], dtype=np.float64)
+        lat = np.array([G.nodes[n]['y'] for n in node_ids], dtype=np.float64)
+        x, y = project_lonlat(lon, lat)
+
+        edges = [(u, v, data.get('length', 0.0)) for u, v, data in G.edges(data=True)]
+        if edges:
+            sources = np.searchsorted(node_ids, np.fromiter((e[0] for e in edges), dtype=np.int64, count=len(edges)))
+            targets = np.searchsorted(node_ids, np.fromiter((e[1] for e in edges), dtype=np.int64, count=len(edges)))
+            lengths = np.fromiter((e[2] for e in edges), dtype=np.float64, count=len(edges))
+        else:
+            sources = targets = np.empty(0, dtype=np.int64)
+            lengths = np.empty(0, dtype=np.float64)
+
+        # Ordenar por (origen, destino, longitud) y quedarse con la primera de cada pareja
+        edge_order = np.lexsort((lengths, targets, sources))
+        sources, targets, lengths = sources[edge_order], targets[edge_order], lengths[edge_order]
+        keep = np.ones(len(sources), dtype=bool)
+        keep[1:] = (sources[1:] != sources[:-1]) | (targets[1:] != targets[:-1])
+        sources, targets, lengths = sources[keep], targets[keep], lengths[keep]
+
+        offsets = np.zeros(len(node_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=len(node_ids)), out=offsets[1:])
+
+        return cls(node_ids, lon, lat, np.asarray(x), np.asarray(y), offsets,
+                   targets.astype(np.int32), lengths.astype(np.float32))
+
+    def save(self, path):
+        """
+        Escribe el grafo en el formato binario versionado (ver cabecera del módulo).
+        """
+
+        n_nodes, n_edges = len(self.node_ids), len(self.targets)
+        tmp_path = f"{path}.tmp"
+
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, FORMAT_VERSION, n_nodes, n_edges))
+            for name, dtype, length, offset in _layout(n_nodes, n_edges):
+                f.write(b'\x00' * (offset - f.tell()))
+                f.write(np.ascontiguousarray(getattr(self, name), dtype=dtype).tobytes())
+
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def open(cls, path):
+        """
+        Abre el fichero con np.memmap (solo lectura); no se copia nada a memoria hasta que se usa.
+        """
+
+        with open(path, 'rb') as f:
+            magic, version, n_nodes, n_edges = HEADER.unpack(f.read(HEADER.size))
+
+        if magic != MAGIC:
+            raise ValueError(f"{path} no es un grafo peatonal CSR.")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Versión de formato {version} no soportada en {path} (se esperaba {FORMAT_VERSION}).")
+
+        arrays = {}
+        for name, dtype, length, offset in _layout(n_nodes, n_edges):
+            if length == 0:
+                arrays[name] = np.empty(0, dtype=dtype)
+            else:
+                arrays[name] = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(length,))
+
+        return cls(path=path, **arrays)
+
+    def position_of(self, node_ids):
+        # Los ids de OSM están ordenados, así que basta una búsqueda binaria
+        return np.searchsorted(self.node_ids, node_ids)
+
+    def matrix(self, reverse=False):
+        """
+        Matriz dispersa de adyacencia (scipy) con las longitudes como pesos; 'reverse' devuelve la traspuesta.
+
+        La matriz es una copia en memoria de todo el grafo (pesos float64), privada de cada proceso. Para trabajar
+        con una zona se usa 'subgraph', que solo lee del fichero las aristas de sus nodos.
+        """
+
+        from scipy.sparse import csr_matrix
+
+        if self._matrix is None:
+            n = len(self.node_ids)
+            # Las aristas de longitud 0 se mantienen como aristas con un peso mínimo
+            weights = np.maximum(np.asarray(self.lengths, dtype=np.float64), 1e-9)
+            self._matrix = csr_matrix((weights, np.asarray(self.targets), np.asarray(self.offsets)), shape=(n, n))
+
+        if not reverse:
+            return self._matrix
+
+        if self._matrix_t is None:
+            self._matrix_t = self._matrix.transpose().tocsr()
+        return self._matrix_t
+
+    def dijkstra(self, sources, cutoff=None, reverse=False):
+        """
+        Dijkstra (multi-origen) desde las posiciones 'sources'.
+
+        :param sources: Posición o lista de posiciones de origen.
+        :param cutoff: Distancia máxima en metros (los nodos más lejanos quedan a inf).
+        :param reverse: Si es True, calcula la distancia de cada nodo HASTA los orígenes.
+        :return: Array float64 con la distancia mínima a cualquiera de los orígenes.
+        """
+
+        from scipy.sparse.csgraph import dijkstra
+
+        sources = np.unique(np.atleast_1d(np.asarray(sources, dtype=np.int64)))
+        if len(sources) == 0:
+            return np.full(len(self.node_ids), np.inf)
+
+        limit = np.inf if cutoff is None else cutoff + 1e-6
+        dist = dijkstra(self.matrix(reverse), directed=True, indices=sources, min_only=True, limit=limit)
+
+        if cutoff is not None:
+            dist[dist > cutoff] = np.inf
+
+        return dist
+
+    def shortest_path_length(self, source, target):
+        dist = self.dijkstra(source)[target]
+        if np.isinf(dist):
+            import networkx as nx
+            raise nx.NetworkXNoPath(f"No hay camino entre {source} y {target}.")
+        return float(dist)
+
+    def nearest_nodes(self, lons, lats, return_distance=False):
+        """
+        Posición del nodo más cercano a cada punto (lon, lat), con un KD-tree sobre las coordenadas proyectadas.
+
+        :param return_distance: Si es True, devuelve también la distancia (m) de cada punto a su nodo.
+        """
+
+        if self._kdtree is None:
+            from sklearn.neighbors import KDTree
+            self._kdtree = KDTree(np.column_stack([self.x, self.y]))
+
+        scalar = np.ndim(lons) == 0
+        x, y = project_lonlat(np.atleast_1d(lons), np.atleast_1d(lats))
+        dist, idx = self._kdtree.query(np.column_stack([x, y]), k=1)
+        idx, dist = idx[:, 0], dist[:, 0]
+
+        if return_distance:
+            return (int(idx[0]), float(dist[0])) if scalar else (idx, dist)
+        return int(idx[0]) if scalar else idx
+
+    def subgraph(self, positions):
+        """
+        Grafo inducido por las posiciones dadas (en memoria), renumerado en el mismo orden.
+
+        Se recorta directamente sobre los arrays CSR: con el grafo abierto con np.memmap solo se leen (y se
+        comparten entre procesos) las páginas de las aristas de esos nodos, sin construir la matriz de la ciudad.
+        """
+
+        positions = np.unique(np.asarray(positions, dtype=np.int64))
+
+        # Aristas que salen de los nodos elegidos, en el orden del CSR (ordenadas por destino dentro de cada nodo)
+        starts = np.asarray(self.offsets[positions], dtype=np.int64)
+        counts = np.asarray(self.offsets[positions + 1], dtype=np.int64) - starts
+        edges = np.repeat(starts, counts) + (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts))
+        sources = np.repeat(np.arange(len(positions)), counts)
+        targets = np.asarray(self.targets[edges], dtype=np.int64)
+        lengths = np.asarray(self.lengths[edges], dtype=np.float32)
+
+        # Solo las aristas con destino dentro del subgrafo, con el destino renumerado (la renumeración es monótona)
+        new_targets = np.searchsorted(positions, targets)
+        inside = new_targets < len(positions)
+        inside[inside] = positions[new_targets[inside]] == targets[inside]
+
+        offsets = np.zeros(len(positions) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources[inside], minlength=len(positions)), out=offsets[1:])
+
+        return CSRGraph(np.asarray(self.node_ids[positions]), np.asarray(self.lon[positions]),
+                        np.asarray(self.lat[positions]), np.asarray(self.x[positions]), np.asarray(self.y[positions]),
+                        offsets, new_targets[inside].astype(np.int32), lengths[inside])
+
+    def nodes_gdf(self):
+        """
+        GeoDataFrame de nodos en EPSG:25830, indexado por id de OSM y en el orden de las posiciones.
+        """
+
+        import geopandas as gpd
+
+        return gpd.GeoDataFrame(index=_osmid_index(self.node_ids), geometry=gpd.points_from_xy(self.x, self.y),
+                                crs=PROJECTED_CRS)
+
+
+def _osmid_index(node_ids):
+    import pandas as pd
+    return pd.Index(np.asarray(node_ids), name='osmid')
+
+
+@lru_cache(maxsize=4)
+def open_walk_graph(path=DEFAULT_GRAPH_PATH):
+    # Un único memmap por proceso y fichero
+    return CSRGraph.open(path)
+
+
+def build_walk_graph_file(path=DEFAULT_GRAPH_PATH, buffer_distance=500):
+    """
+    Descarga el grafo peatonal de toda la ciudad una vez y lo guarda en formato CSR.
+    """
+
+    from app.utils.helpers import load_admin_data, build_city_walk_graph
+
+    admin_barr = load_admin_data()
+    G = build_city_walk_graph(admin_barr, buffer_distance)
+    graph = CSRGraph.from_networkx(G)
+    graph.save(path)
+
+    print(f"Grafo guardado en {path}: {len(graph)} nodos, {graph.num_edges} aristas, "
+          f"{os.path.getsize(path) / 1e6:.1f} MB")
+
+    return graph
+
+
+if __name__ == '__main__':
+
+    build_walk_graph_file(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_GRAPH_PATH)
@@ -0,0 +1,62 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('pandas')
+
+from app.utils import gtfs
+from app.utils.departures import service_departures
+
+
+# trips.txt sin ordenar por trip_id: T9 (tranvía) va antes que T1 (metro), como en los feeds reales
+FEED_FILES = {
+    'stops.txt': "stop_id,stop_name,stop_lat,stop_lon\n"
+                 "A,Parada A,39.47,-0.37\n"
+                 "B,Parada B,39.48,-0.38\n",
+    'routes.txt': "route_id,route_type\n"
+                  "R_TRAM,0\n"
+                  "R_METRO,1\n",
+    'trips.txt': "route_id,service_id,trip_id\n"
+                 "R_TRAM,LAB,T9\n"
+                 "R_METRO,FES,T1\n",
+    'stop_times.txt': "trip_id,stop_id,departure_time\n"
+                      "T1,B,08:00:00\n"
+                      "T9,A,08:05:00\n"
+                      "T9,B,08:10:00\n",
+    'calendar.txt': "service_id,monday,tuesday,wednesday,thursday,friday,saturday,sunday,start_date,end_date\n"
+                    "LAB,1,1,1,1,1,0,0,20240101,20241231\n"
+                    "FES,0,0,0,0,0,1,1,20240101,20241231\n",
+}
+
+
+@pytest.fixture
+def tables(tmp_path, monkeypatch):
+    feed_dir = tmp_path / 'test'
+    feed_dir.mkdir()
+    for name, content in FEED_FILES.items():
+        (feed_dir / name).write_text(content)
+
+    monkeypatch.setattr(gtfs, 'DATA_FOLDER', str(tmp_path))
+    monkeypatch.setitem(gtfs.FEEDS, 'test', ('test', 'test.zip', 'Test'))
+    return gtfs.load_feed('test', use_cache=False)
+
+
+def test_trip_codes_are_trips_rows(tables):
+    trip_ids = tables['trips']['trip_id'].astype(str).to_numpy()
+    trips = tables['stop_times']['trip'].to_numpy()
+
+    assert list(trip_ids[trips]) == ['T1', 'T9', 'T9']
+
+
+def test_stop_route_types_unsorted_trips(tables):
+    pairs = gtfs.stop_route_types('test', tables)
+    found = set(zip(pairs['stop_id'], pairs['route_type_en']))
+
+    assert found == {('A', 'Tram'), ('B', 'Tram'), ('B', 'Subway')}
+
+
+def test_service_departures_unsorted_trips(tables):
+    # Solo el servicio laborable: las salidas son las del viaje T9, no las de T1
+    stops, seconds = service_departures(tables, {'LAB'})
+    stop_ids = np.asarray(tables['stops']['stop_id'].cat.categories, dtype=object)
+
+    assert sorted(zip(stop_ids[stops], seconds)) == [('A', 8 * 3600 + 300), ('B', 8 * 3600 + 600)]